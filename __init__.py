@@ -2,10 +2,11 @@
 # Licensed under the MIT License.
 
 import asyncio
+import os
 import server
 from aiohttp import web
 import folder_paths
-from .service.conversation_service import *
+from .service.plugin import mount_lazy_routes
 
 WEB_DIRECTORY = "entry"
 NODE_CLASS_MAPPINGS = {}
@@ -16,10 +17,43 @@ workspace_path = os.path.join(os.path.dirname(__file__))
 comfy_path = os.path.dirname(folder_paths.__file__)
 db_dir_path = os.path.join(workspace_path, "db")
 
+# Uploaded files are served from the plugin's own route
+os.environ.setdefault("COPILOT_UPLOAD_URL", "/api/workspace/uploads")
+
+# Register the API routes on ComfyUI's aiohttp app; the service modules behind
+# them are imported on first request, keeping ComfyUI's startup fast
+mount_lazy_routes(server.PromptServer.instance.app, prefixes=("", "/api"))
+
 dist_path = os.path.join(workspace_path, 'dist/copilot_web')
 if os.path.exists(dist_path):
-    server.PromptServer.instance.app.add_routes([
-        web.static('/copilot_web/', dist_path),
-    ])
+    # Hashed bundles are served as immutable; gzip/brotli variants are built once on first use.
+    # The directory is indexed on the first request rather than at import.
+    copilot_assets = None
+
+    async def serve_copilot_web(request):
+        global copilot_assets
+        if copilot_assets is None:
+            from .service.static_assets import StaticAssets
+            copilot_assets = StaticAssets(dist_path)
+        asset = copilot_assets.get(request.match_info["path"])
+        if asset is None:
+            raise web.HTTPNotFound()
+        result = await copilot_assets.respond(
+            asset, request.headers.get("Accept-Encoding"), request.headers.get("If-None-Match"))
+        if result.path is None:
+            return web.Response(status=result.status, body=result.body, headers=result.headers)
+        # Streamed by hand: web.FileResponse would replace the variant's ETag with its
+        # own and answer conditional requests against that
+        response = web.StreamResponse(status=result.status, headers=result.headers)
+        response.content_length = result.stat.st_size
+        await response.prepare(request)
+        if request.method != "HEAD":
+            with open(result.path, "rb") as f:
+                while chunk := await asyncio.to_thread(f.read, 256 * 1024):
+                    await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    server.PromptServer.instance.app.router.add_get('/copilot_web/{path:.+}', serve_copilot_web)
 else:
     print(f"🦄🦄🔴🔴Error: Web directory not found: {dist_path}")
@@ -0,0 +1,405 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Offline load benchmark for the Copilot API.
+
+Runs a fixed set of scenarios against the FastAPI ``app`` from ``main.py``
+either in-process (a minimal ASGI client, no sockets) or through a local
+uvicorn server (a minimal keep-alive HTTP/1.1 client), and reports latency
+percentiles, throughput and peak RSS as JSON so runs can be compared between
+commits::
+
+    python benchmarks/bench_api.py --concurrency 32 --sessions 50 --history 100
+    python benchmarks/bench_api.py --mode uvicorn --workers 2 --output after.json
+    python benchmarks/bench_api.py --compare before.json --output after.json
+
+Nothing here talks to the network beyond 127.0.0.1.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Response = Tuple[int, bytes]
+
+SCENARIOS = ("chat", "chat_stream", "fetch_messages", "node_repos", "templates")
+NODE_TYPES = "KSampler,CheckpointLoaderSimple,CLIPTextEncode,VAEDecode,SaveImage,IPAdapterApply"
+
+
+# ---------------------------------------------------------------------------
+# Clients
+# ---------------------------------------------------------------------------
+
+class ASGIClient:
+    """Call an ASGI app directly, without a server or sockets."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, target: str, body: Optional[bytes] = None) -> Response:
+        path, _, query = target.partition("?")
+        headers = [(b"host", b"bench")]
+        if body is not None:
+            headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+        }
+        done = asyncio.Event()
+        pending = [{"type": "http.request", "body": body or b"", "more_body": False}]
+        status = 0
+        chunks: List[bytes] = []
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            # Streaming responses poll for disconnects; only report one once the response is over
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    done.set()
+
+        await self.app(scope, receive, send)
+        done.set()
+        return status, b"".join(chunks)
+
+
+class HTTPConnection:
+    """Single keep-alive HTTP/1.1 connection; enough of the protocol for uvicorn."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+    async def request(self, method: str, target: str, body: Optional[bytes] = None) -> Response:
+        if self._writer is None:
+            await self._connect()
+        head = [f"{method} {target} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        if body is not None:
+            head += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        self._writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + (body or b""))
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            # The server closed an idle keep-alive connection; retry once on a fresh one
+            await self.close()
+            return await self.request(method, target, body)
+        status = int(status_line.split()[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await self._reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "content-length" in headers:
+            payload = await self._reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int((await self._reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                parts.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            payload = b"".join(parts)
+        else:
+            payload = await self._reader.read()
+            await self.close()
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, payload
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+def _json(data: Dict[str, Any]) -> bytes:
+    return json.dumps(data).encode()
+
+
+def build_scenario(name: str, sessions: int, history: int) -> Callable[[int], Tuple[str, str, Optional[bytes]]]:
+    """Return a function mapping a request number to (method, target, body)."""
+    if name == "chat":
+        return lambda i: ("POST", "/api/chat", _json(
+            {"session_id": f"bench-{i % sessions}", "message": "How do I add a LoRA to my workflow?"}))
+    if name == "chat_stream":
+        return lambda i: ("POST", "/api/chat/invoke", _json(
+            {"session_id": f"bench-{i % sessions}", "prompt": "Explain the KSampler parameters"}))
+    if name == "fetch_messages":
+        return lambda i: ("GET", f"/api/fetch-messages/bench-{i % sessions}?limit={max(history, 1)}", None)
+    if name == "node_repos":
+        return lambda i: ("GET", f"/api/nodes/repos?node_types={NODE_TYPES}", None)
+    if name == "templates":
+        return lambda i: ("GET", "/api/templates?limit=50", None)
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def run_load(
+    make_client: Callable[[], Any],
+    scenario: Callable[[int], Tuple[str, str, Optional[bytes]]],
+    total: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(total))
+
+    async def worker():
+        client = make_client()
+        try:
+            for i in counter:
+                method, target, body = scenario(i)
+                started = time.perf_counter()
+                try:
+                    status, _ = await client.request(method, target, body)
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+        finally:
+            if hasattr(client, "close"):
+                await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    ms = 1000.0
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * ms, 3),
+        "p95_ms": round(percentile(latencies, 95) * ms, 3),
+        "p99_ms": round(percentile(latencies, 99) * ms, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * ms, 3) if latencies else 0.0,
+        "max_ms": round(latencies[-1] * ms, 3) if latencies else 0.0,
+    }
+
+
+async def seed_history(make_client, sessions: int, history: int, concurrency: int) -> None:
+    """Give every benchmark session ``history`` messages (each chat turn stores two)."""
+    turns = (history + 1) // 2
+    if turns:
+        await run_load(make_client, build_scenario("chat", sessions, history), turns * sessions, concurrency)
+
+
+async def run_scenarios(make_client, args) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    await seed_history(make_client, args.sessions, args.history, args.concurrency)
+    for name in args.scenarios:
+        scenario = build_scenario(name, args.sessions, args.history)
+        if args.warmup:
+            await run_load(make_client, scenario, args.warmup, args.concurrency)
+        results[name] = await run_load(make_client, scenario, args.requests, args.concurrency)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Modes
+# ---------------------------------------------------------------------------
+
+def _peak_rss_mb(who: int) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def bench_in_process(args) -> Dict[str, Any]:
+    sys.path.insert(0, ROOT)
+    from main import app
+
+    client = ASGIClient(app)
+    async with app.router.lifespan_context(app):
+        scenarios = await run_scenarios(lambda: client, args)
+    return {"scenarios": scenarios, "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF)}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_ready(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        conn = HTTPConnection("127.0.0.1", port)
+        try:
+            status, _ = await conn.request("GET", "/api/health")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            await conn.close()
+        if time.monotonic() > deadline:
+            raise RuntimeError("uvicorn did not become ready in time")
+        await asyncio.sleep(0.1)
+
+
+async def bench_uvicorn(args) -> Dict[str, Any]:
+    port = _free_port()
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+    ]
+    server = subprocess.Popen(command, cwd=ROOT, env=os.environ.copy())
+    try:
+        await _wait_ready(port, 60)
+        scenarios = await run_scenarios(lambda: HTTPConnection("127.0.0.1", port), args)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    # Peak RSS of the largest server process (children are reaped once waited on)
+    return {"scenarios": scenarios, "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN)}
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Percentage change per scenario and metric relative to a baseline report."""
+    changes = {}
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        changes[name] = {
+            key: round((result[key] - before[key]) / before[key] * 100, 1)
+            for key in ("rps", "p50_ms", "p95_ms", "p99_ms")
+            if before.get(key)
+        }
+    return changes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Copilot API offline")
+    parser.add_argument("--mode", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=100, help="Unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--history", type=int, default=50, help="Stored messages per session before measuring")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (uvicorn mode)")
+    parser.add_argument("--session-store", choices=("memory", "sqlite"), default=None)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    args = parser.parse_args(argv)
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario: {name}")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # Configuration is read when the service modules are imported
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["COPILOT_STUB_TOKEN_DELAY"] = os.getenv("COPILOT_STUB_TOKEN_DELAY", "0")
+    if args.session_store:
+        os.environ["COPILOT_SESSION_STORE"] = args.session_store
+    elif args.mode == "uvicorn" and args.workers > 1:
+        os.environ.setdefault("COPILOT_SESSION_STORE", "sqlite")
+
+    runner = bench_in_process if args.mode == "asgi" else bench_uvicorn
+    result = asyncio.run(runner(args))
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": args.mode,
+            "workers": args.workers if args.mode == "uvicorn" else None,
+            "session_store": os.getenv("COPILOT_SESSION_STORE", "memory"),
+            "concurrency": args.concurrency,
+            "sessions": args.sessions,
+            "history": args.history,
+            "requests": args.requests,
+        },
+        **result,
+    }
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["change_pct"] = compare(json.load(f), report)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
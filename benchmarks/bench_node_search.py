@@ -0,0 +1,108 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Benchmark for the node search index.
+
+Generates a synthetic node catalog (built-in names plus made-up custom packs),
+builds the index, then reports build time, load (mmap open) time and query
+latency percentiles as JSON::
+
+    python benchmarks/bench_node_search.py --nodes 50000 --queries 500
+
+Semantic scoring is included when NumPy is installed.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from service.builtin_registry import BUILTIN_REGISTRY  # noqa: E402
+from service.node_search import HashingEmbedder, NodeDoc, NodeSearchIndex, build_index, numpy  # noqa: E402
+
+PREFIXES = ("Advanced", "Simple", "Batch", "Latent", "Image", "Mask", "Clip", "Vae", "Lora", "Control", "Face", "Video")
+NOUNS = ("Loader", "Sampler", "Encode", "Decode", "Upscale", "Blend", "Crop", "Resize", "Merge", "Switch", "Preview")
+TYPES = ("IMAGE", "LATENT", "MASK", "MODEL", "CLIP", "VAE", "CONDITIONING", "INT", "FLOAT", "STRING", "COMBO")
+CATEGORIES = ("image", "latent", "loaders", "sampling", "conditioning", "mask", "video", "utils")
+QUERIES = ("ksampler", "load checkpoint", "upscale image", "latent blend", "mask crop", "lora loader",
+           "vae decode", "face restore", "controlnet", "video frames", "imgae upscle", "conditioning merge")
+
+
+def synthetic_docs(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    docs = [NodeDoc(name=name, display_name="", category="", description="", input_types=[], output_types=[],
+                    source="builtin", github_url=None) for name in BUILTIN_REGISTRY.node_types]
+    for i in range(count - len(docs)):
+        name = f"{rng.choice(PREFIXES)}{rng.choice(NOUNS)}{rng.choice(PREFIXES)}_{i}"
+        category = f"{rng.choice(CATEGORIES)}/{rng.choice(PREFIXES).lower()}"
+        docs.append(NodeDoc(
+            name=name,
+            display_name=f"{name.split('_')[0]} ({i % 97})",
+            category=category,
+            description=" ".join(rng.choice(PREFIXES + NOUNS).lower() for _ in range(rng.randint(4, 16))),
+            input_types=sorted(set(rng.sample(TYPES, rng.randint(1, 4)))),
+            output_types=sorted(set(rng.sample(TYPES, rng.randint(1, 2)))),
+            source="custom",
+            github_url=f"https://github.com/example/pack{i % 500}",
+        ))
+    return docs
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the node search index")
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    embedder = HashingEmbedder() if numpy is not None else None
+    docs = synthetic_docs(args.nodes)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "node_search.idx")
+        started = time.perf_counter()
+        build_index(docs, path, "bench", embedder)
+        build_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = NodeSearchIndex(path)
+        load_ms = (time.perf_counter() - started) * 1000
+
+        timings = []
+        for i in range(args.queries):
+            query = QUERIES[i % len(QUERIES)]
+            started = time.perf_counter()
+            index.search(query, args.limit, embedder=embedder)
+            timings.append((time.perf_counter() - started) * 1000)
+        report = {
+            "nodes": len(docs),
+            "semantic": index.has_embeddings,
+            "index_mb": round(os.path.getsize(path) / 2 ** 20, 2),
+            "build_s": round(build_s, 2),
+            "load_ms": round(load_ms, 3),
+            "query_ms": {
+                "p50": round(statistics.median(timings), 3),
+                "p95": round(percentile(timings, 0.95), 3),
+                "p99": round(percentile(timings, 0.99), 3),
+            },
+            "sample": [doc["name"] for doc in index.search("upscale image", 5, embedder=embedder)],
+        }
+        index.close()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Benchmark for the ext payload store.
+
+Simulates a session that iterates on one workflow: every turn tweaks a few
+widget values or adds a node, and the whole workflow rides along in ``ext``.
+Reports the inline JSON size against what the store holds, plus intern and
+rehydrate latency, as JSON::
+
+    python benchmarks/bench_payload_store.py --nodes 300 --turns 100
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from service.payload_store import MemoryPayloadBackend, PayloadStore, canonical_json  # noqa: E402
+
+
+def synthetic_workflow(nodes: int, rng: random.Random) -> dict:
+    return {
+        "nodes": [
+            {
+                "id": i,
+                "type": rng.choice(("KSampler", "VAEDecode", "CLIPTextEncode", "LoraLoader", "ImageScale")),
+                "pos": [rng.randint(0, 4000), rng.randint(0, 4000)],
+                "size": [315, 262],
+                "inputs": [{"name": f"in{j}", "type": "LATENT", "link": i * 4 + j} for j in range(3)],
+                "outputs": [{"name": "out", "type": "IMAGE", "links": [i * 4 + 3]}],
+                "widgets_values": [rng.randint(0, 2 ** 32), 20, 7.5, "euler", "normal", 1.0],
+            }
+            for i in range(nodes)
+        ],
+        "links": [[i, i, 0, i + 1, 0, "LATENT"] for i in range(nodes)],
+        "version": 0.4,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=300)
+    parser.add_argument("--turns", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    store = PayloadStore(MemoryPayloadBackend())
+    workflow = synthetic_workflow(args.nodes, rng)
+    inline_bytes = 0
+    intern_ms, load_ms, refs = [], [], []
+    for turn in range(args.turns):
+        workflow = copy.deepcopy(workflow)
+        if turn % 10 == 9:
+            node = copy.deepcopy(rng.choice(workflow["nodes"]))
+            node["id"] = len(workflow["nodes"])
+            workflow["nodes"].append(node)
+        for node in rng.sample(workflow["nodes"], 3):
+            node["widgets_values"][0] = rng.randint(0, 2 ** 32)
+        inline_bytes += len(canonical_json(workflow))
+        started = time.perf_counter()
+        packed = store.pack("bench", [{"type": "workflow", "data": workflow}])
+        intern_ms.append((time.perf_counter() - started) * 1000)
+        refs.append(packed[0]["ref"])
+    store._hot.clear()
+    for ref in refs:
+        started = time.perf_counter()
+        store.load(ref)
+        load_ms.append((time.perf_counter() - started) * 1000)
+        store._hot.clear()
+
+    print(json.dumps({
+        "turns": args.turns,
+        "workflow_bytes": len(canonical_json(workflow)),
+        "inline_bytes": inline_bytes,
+        "stored_bytes": store.backend.bytes,
+        "reduction": round(inline_bytes / store.backend.bytes, 1),
+        "intern_ms_p50": round(statistics.median(intern_ms), 3),
+        "cold_load_ms_p50": round(statistics.median(load_ms), 3),
+        "cold_load_ms_max": round(max(load_ms), 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Import-time budget check for the ComfyUI plugin entry.
+
+The plugin's ``__init__.py`` only imports ``service.plugin`` at ComfyUI
+startup; everything else loads on the first request. This script imports
+that entry module in fresh interpreters with ``-X importtime``, fails if it
+exceeds the budget or pulls in any module that should stay lazy, and prints
+a JSON report::
+
+    python benchmarks/import_budget.py --budget-ms 25 --runs 7
+
+aiohttp is excluded from the measurement because ComfyUI has already
+imported it by the time custom nodes load.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_MODULES = ("service.plugin",)
+HOST_MODULES = ("aiohttp",)
+
+# Modules whose import cost must not be paid at ComfyUI startup
+LAZY_MODULES = (
+    "fastapi",
+    "starlette",
+    "pydantic",
+    "uvicorn",
+    "sqlite3",
+    "service.conversation_service",
+    "service.conversation_router",
+    "service.node_service",
+    "service.session_store",
+    "service.template_catalog",
+    "service.blob_cache",
+    "service.git_scanner",
+)
+
+
+def measure_once() -> Tuple[float, Dict[str, int]]:
+    """Import the entry modules once; return (total ms, cumulative us per module they imported)."""
+    code = "import {}; import {}".format(", ".join(HOST_MODULES), ", ".join(ENTRY_MODULES))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules: Dict[str, int] = {}
+    host_done = False
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not host_done:
+            host_done = name.strip() in HOST_MODULES
+            continue
+        # Everything after the host modules is what the plugin costs
+        modules[name.strip()] = int(cumulative)
+        if len(name) - len(name.lstrip()) == 1:  # top level: one space after the separator
+            total_us += int(cumulative)
+    return total_us / 1000.0, modules
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the plugin entry's import time")
+    parser.add_argument("--budget-ms", type=float, default=25.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    timings: List[float] = []
+    loaded: Dict[str, int] = {}
+    for _ in range(args.runs):
+        total_ms, loaded = measure_once()
+        timings.append(total_ms)
+    median_ms = statistics.median(timings)
+    eager = sorted(m for m in loaded if m in LAZY_MODULES)
+    slowest = sorted(loaded.items(), key=lambda item: -item[1])[:10]
+    report = {
+        "entry": list(ENTRY_MODULES),
+        "median_ms": round(median_ms, 2),
+        "runs_ms": [round(t, 2) for t in timings],
+        "budget_ms": args.budget_ms,
+        "eager_lazy_modules": eager,
+        "slowest_us": dict(slowest),
+        "ok": median_ms <= args.budget_ms and not eager,
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
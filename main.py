@@ -1,9 +1,13 @@
+import argparse
+import asyncio
+import importlib.util
 import os
 import sys
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response
 import uvicorn
 from pathlib import Path
 from typing import Optional, Dict, Any
@@ -12,12 +16,40 @@ import json
 # Import routers
 from service.conversation_router import router as conversation_router
 from service.node_router import router as node_router
+from service.model_router import router as model_router
+from service.event_hub import get_event_hub
+from service.event_ingest import get_event_ingest
+from service.lifecycle import warmup
+from service.log import configure_logging, get_logger
+from service.metrics import MetricsMiddleware, REGISTRY, PROMETHEUS_CONTENT_TYPE
+from service.static_assets import StaticAssets
+
+configure_logging()
+logger = get_logger("copilot.main")
+
+# UI build, indexed once; compressed variants are generated during startup
+ui_dist_path = Path(__file__).parent / "ui" / "dist"
+ui_assets = StaticAssets(str(ui_dist_path)) if ui_dist_path.exists() else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Uvicorn only starts accepting connections once startup has finished
+    stats = await warmup()
+    if ui_assets is not None:
+        stats["ui_assets_compressed"] = await asyncio.to_thread(ui_assets.precompress)
+    logger.info("warmup complete", extra={"fields": stats})
+    get_event_hub().start()
+    yield
+    # By now uvicorn has drained in-flight requests (timeout_graceful_shutdown)
+    await get_event_hub().close()
+    await get_event_ingest().close()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="ComfyUI-Copilot API",
     description="API for ComfyUI-Copilot - Your Intelligent Assistant for Comfy-UI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS
@@ -29,14 +61,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger JSON responses (message history, template lists); responses that
+# already carry a Content-Encoding, such as precompressed assets, pass through
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("COPILOT_GZIP_MIN_SIZE", 1024)))
+
+# Record per-route latency, in-flight requests, payload sizes and time to first chunk
+app.add_middleware(MetricsMiddleware, routes=lambda: route_templates())
+
 # Include routers
-app.include_router(conversation_router, prefix="/api", tags=["Conversation"])
-app.include_router(node_router, prefix="/api/nodes", tags=["Nodes"])
+ROUTERS = (
+    (conversation_router, "/api", "Conversation"),
+    (node_router, "/api/nodes", "Nodes"),
+    (model_router, "/api/models", "Models"),
+)
+for router, prefix, tag in ROUTERS:
+    app.include_router(router, prefix=prefix, tags=[tag])
 
-# Serve static files from the UI dist directory
-ui_dist_path = Path(__file__).parent / "ui" / "dist"
-if ui_dist_path.exists():
-    app.mount("/", StaticFiles(directory=str(ui_dist_path), html=True), name="ui")
+def route_templates():
+    """``(methods, full path)`` of each route in matching order, used to label request metrics."""
+    included = [
+        (getattr(route, "methods", None), prefix + route.path)
+        for router, prefix, _ in ROUTERS for route in router.routes
+    ]
+    own = [
+        (getattr(route, "methods", None), route.path)
+        for route in app.router.routes if isinstance(getattr(route, "path", None), str)
+    ]
+    return included + own
 
 # Health check endpoint
 @app.get("/api/health")
@@ -47,21 +98,96 @@ async def health_check():
         "version": "1.0.0"
     }
 
-# Serve the main page for any other route (for SPA routing)
+# Prometheus metrics endpoint
+@app.get("/api/metrics")
+async def metrics():
+    return Response(content=REGISTRY.expose(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+# Serve the UI build, falling back to index.html for any other route (SPA routing)
 @app.get("/{full_path:path}")
-async def catch_all(full_path: str):
-    if ui_dist_path.exists():
-        index_path = ui_dist_path / "index.html"
-        if index_path.exists():
-            return FileResponse(index_path)
-    raise HTTPException(status_code=404, detail="Not Found")
+async def catch_all(full_path: str, request: Request):
+    asset = None
+    if ui_assets is not None and not full_path.startswith("api/"):
+        asset = ui_assets.get(full_path) or ui_assets.get("index.html")
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    result = await ui_assets.respond(
+        asset, request.headers.get("accept-encoding"), request.headers.get("if-none-match"))
+    if result.path is not None:
+        return FileResponse(
+            result.path, headers=result.headers, media_type=result.headers["Content-Type"], stat_result=result.stat)
+    return Response(content=result.body, status_code=result.status, headers=result.headers)
 
-if __name__ == "__main__":
-    # Run the server
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ComfyUI-Copilot API server")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument(
+        "--prod",
+        action="store_true",
+        default=os.getenv("COPILOT_MODE", "").lower() == "production",
+        help="Production mode: no reload, graceful draining, uvloop/httptools when installed",
+    )
+    # One worker by default: see PER_PROCESS_STATE for what more workers do not share
+    parser.add_argument("--workers", type=int, default=int(os.getenv("COPILOT_WORKERS", 1)))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info").lower())
+    return parser.parse_args(argv)
+
+# Features that keep their state in the worker's memory. With several workers
+# a client may hit a worker that has never seen its job or subscription.
+PER_PROCESS_STATE = (
+    "response cache and request coalescing (each worker caches and coalesces separately)",
+    "chat admission limits and session locks (enforced per worker)",
+)
+
+def run_production(args):
+    """Serve with graceful draining on shutdown, in one or more worker processes."""
+    if args.workers > 1:
+        # Worker processes inherit the environment; per-process memory stores
+        # would give every worker its own view of a session.
+        os.environ.setdefault("COPILOT_SESSION_STORE", "sqlite")
+        if os.environ["COPILOT_SESSION_STORE"] == "memory":
+            logger.warning("COPILOT_SESSION_STORE=memory is not shared between workers")
+        os.environ.setdefault("COPILOT_WS_RELAY", "sqlite")
+        if os.environ["COPILOT_WS_RELAY"] != "sqlite":
+            logger.warning("without COPILOT_WS_RELAY=sqlite, WebSocket events reach only the publishing worker")
+        os.environ.setdefault("COPILOT_SWEEP_STORE", "sqlite")
+        if os.environ["COPILOT_SWEEP_STORE"] != "sqlite":
+            logger.warning("without COPILOT_SWEEP_STORE=sqlite, sweep jobs are visible only on the worker that runs them")
+        logger.warning(
+            "running %d workers; per-process state is not shared between them: %s. "
+            "Use --workers 1 if clients rely on it.",
+            args.workers, ", ".join(PER_PROCESS_STATE),
+        )
+    # On shutdown uvicorn stops accepting connections and waits this long for
+    # in-flight requests (chat streams included) before cancelling them
+    drain_timeout = float(os.getenv("COPILOT_SHUTDOWN_DRAIN_SECONDS", 30))
     uvicorn.run(
         "main:app",
-        host=os.getenv("HOST", "0.0.0.0"),
-        port=int(os.getenv("PORT", 8000)),
-        reload=True,
-        log_level="info"
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop="uvloop" if _has_module("uvloop") else "asyncio",
+        http="httptools" if _has_module("httptools") else "h11",
+        timeout_graceful_shutdown=int(drain_timeout),
+        proxy_headers=True,
+        access_log=False,
+        log_level=args.log_level,
     )
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.prod:
+        run_production(args)
+    else:
+        # Run the development server
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level=args.log_level
+        )
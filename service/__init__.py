@@ -4,8 +4,16 @@ Service package for ComfyUI-Copilot.
 This package contains the backend services and APIs for the ComfyUI-Copilot application.
 """
 
-# Import routers to make them available when importing from service package
-from .conversation_router import router as conversation_router
-from .node_router import router as node_router
-
+# The FastAPI routers are only imported on first access: the ComfyUI plugin
+# imports this package too, and must not pay for FastAPI at startup.
 __all__ = ['conversation_router', 'node_router']
+
+
+def __getattr__(name):
+    if name == 'conversation_router':
+        from .conversation_router import router
+        return router
+    if name == 'node_router':
+        from .node_router import router
+        return router
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,257 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Content-addressed blob cache for images attached to chat requests.
+
+Blobs are stored under ``db/blobs/<sha[:2]>/<sha>`` and evicted least recently
+used first once the cache grows past its byte budget. Access times are kept in
+the file mtime so the LRU order survives restarts, and clients can check for a
+digest before sending the bytes again.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .upload_storage import UploadStorage, UploadWriter
+
+DEFAULT_BLOB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db", "blobs")
+DEFAULT_BLOB_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_sha256(value: str) -> bool:
+    return bool(value) and bool(_SHA256_RE.match(value))
+
+
+class MissingBlobs(Exception):
+    """Raised when a request references digests the cache does not hold."""
+
+    def __init__(self, digests: List[str]):
+        super().__init__(f"Unknown blob digests: {', '.join(digests)}")
+        self.digests = digests
+
+
+class BlobCache:
+    """Size-bounded LRU cache of immutable blobs keyed by SHA-256."""
+
+    def __init__(self, root: Optional[str] = None, max_bytes: int = DEFAULT_BLOB_CACHE_BYTES):
+        self.root = root or DEFAULT_BLOB_DIR
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def _load(self) -> None:
+        """Rebuild the index from disk, oldest access first."""
+        found = []
+        if os.path.isdir(self.root):
+            for shard in os.scandir(self.root):
+                if not shard.is_dir() or len(shard.name) != 2:
+                    continue
+                for entry in os.scandir(shard.path):
+                    if is_sha256(entry.name):
+                        st = entry.stat()
+                        found.append((st.st_mtime, entry.name, st.st_size))
+        found.sort()
+        for _, sha256, size in found:
+            self._entries[sha256] = size
+            self._size += size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            sha256, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.unlink(self._path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def contains(self, sha256: str) -> bool:
+        """Return True if the blob is cached, without touching its LRU position."""
+        if not is_sha256(sha256):
+            return False
+        with self._lock:
+            if sha256 not in self._entries:
+                return False
+        if os.path.exists(self._path(sha256)):
+            return True
+        self._forget(sha256)
+        return False
+
+    def missing(self, digests: Iterable[str]) -> List[str]:
+        """Return the digests the cache does not hold."""
+        return [d for d in dict.fromkeys(digests) if not self.contains(d)]
+
+    def get_path(self, sha256: str) -> Optional[str]:
+        """Return the blob's path and mark it as recently used."""
+        if not self.contains(sha256):
+            self.misses += 1
+            return None
+        path = self._path(sha256)
+        with self._lock:
+            if sha256 in self._entries:
+                self._entries.move_to_end(sha256)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._forget(sha256)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def read(self, sha256: str) -> Optional[bytes]:
+        path = self.get_path(sha256)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def put(self, data: bytes) -> str:
+        """Store bytes and return their digest; existing blobs are not rewritten."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if self.get_path(sha256) is not None:
+            return sha256
+        fd, tmp_path = tempfile.mkstemp(dir=self._ensure_dir(sha256), suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self._commit(sha256, tmp_path, len(data))
+        return sha256
+
+    def adopt(self, sha256: str, tmp_path: str, size: int) -> None:
+        """Move an already hashed file into the cache (e.g. a finished upload)."""
+        if self.get_path(sha256) is not None:
+            os.unlink(tmp_path)
+            return
+        self._ensure_dir(sha256)
+        self._commit(sha256, tmp_path, size)
+
+    def _ensure_dir(self, sha256: str) -> str:
+        directory = os.path.dirname(self._path(sha256))
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _commit(self, sha256: str, tmp_path: str, size: int) -> None:
+        os.replace(tmp_path, self._path(sha256))
+        with self._lock:
+            if sha256 not in self._entries:
+                self._entries[sha256] = size
+                self._size += size
+            self._entries.move_to_end(sha256)
+            self._evict()
+
+    def _forget(self, sha256: str) -> None:
+        with self._lock:
+            size = self._entries.pop(sha256, None)
+            if size is not None:
+                self._size -= size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class _BlobCacheWriter(UploadWriter):
+    def __init__(self, cache: BlobCache):
+        self.cache = cache
+        tmp_dir = os.path.join(cache.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._size = 0
+
+    async def write(self, chunk: bytes) -> None:
+        self._size += len(chunk)
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def commit(self, sha256: str, extension: str) -> Tuple[str, bool]:
+        await asyncio.to_thread(self._file.close)
+        existed = self.cache.contains(sha256)
+        self.cache.adopt(sha256, self.tmp_path, self._size)
+        return f"/api/blobs/{sha256}", existed
+
+    async def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+class BlobCacheStorage(UploadStorage):
+    """Upload storage adapter that streams bodies into a BlobCache."""
+
+    def __init__(self, cache: BlobCache):
+        self.cache = cache
+
+    def open_writer(self) -> UploadWriter:
+        return _BlobCacheWriter(self.cache)
+
+    def path_for(self, name: str) -> Optional[str]:
+        return self.cache.get_path(name)
+
+
+_blob_cache: Optional[BlobCache] = None
+
+
+def get_blob_cache() -> BlobCache:
+    """Return the process-wide blob cache, creating it from the environment if needed."""
+    global _blob_cache
+    if _blob_cache is None:
+        _blob_cache = BlobCache(
+            os.getenv("COPILOT_BLOB_CACHE_DIR"),
+            int(os.getenv("COPILOT_BLOB_CACHE_MAX_BYTES", DEFAULT_BLOB_CACHE_BYTES)),
+        )
+    return _blob_cache
+
+
+def resolve_image_refs(cache: BlobCache, images: Optional[List[Dict[str, Any]]]) -> List[str]:
+    """Turn chat image attachments into blob digests.
+
+    Each attachment carries either inline ``data`` (a base64 data URL, which is
+    stored in the cache) or a ``sha256`` of a blob the client already sent.
+    Raises MissingBlobs listing every referenced digest that is not cached, so
+    the client can resend just those.
+    """
+    digests: List[str] = []
+    missing: List[str] = []
+    for image in images or []:
+        data = image.get("data")
+        if data:
+            payload = data.split(",", 1)[1] if data.startswith("data:") else data
+            try:
+                digests.append(cache.put(base64.b64decode(payload, validate=True)))
+            except (binascii.Error, ValueError):
+                raise ValueError(f"Invalid base64 image data: {image.get('filename', '')}")
+            continue
+        sha256 = image.get("sha256", "")
+        if cache.get_path(sha256) is None:
+            missing.append(sha256)
+        else:
+            digests.append(sha256)
+    if missing:
+        raise MissingBlobs(missing)
+    return digests
@@ -0,0 +1,111 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Immutable, versioned registry of ComfyUI's built-in node types.
+
+The registry is loaded from ``data/builtin_node_types.json`` once. Everything
+a request needs is computed up front: the sorted tuple of names, a lowercase
+sorted index for prefix search, the serialized JSON response body and a
+content-hash ETag, so serving the full list costs no work per hit.
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import FrozenSet, List, Optional, Tuple
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(__file__), "data", "builtin_node_types.json")
+
+
+def fuzzy_score(query: str, candidate: str) -> Optional[int]:
+    """Score a subsequence match of ``query`` in ``candidate`` (lower is better).
+
+    Both arguments must already be lowercase. Returns None when the characters
+    of the query do not appear in order in the candidate.
+    """
+    score = 0
+    position = -1
+    for char in query:
+        found = candidate.find(char, position + 1)
+        if found < 0:
+            return None
+        score += found - position - 1
+        position = found
+    return score + (len(candidate) - len(query)) // 4
+
+
+@dataclass(frozen=True)
+class BuiltinRegistry:
+    node_types: Tuple[str, ...]
+    version: str
+    loaded_at: int
+    names: FrozenSet[str] = field(init=False, repr=False)
+    body: bytes = field(init=False, repr=False)
+    etag: str = field(init=False)
+    _lower: Tuple[str, ...] = field(init=False, repr=False)
+    _lower_order: Tuple[int, ...] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        setattr_ = object.__setattr__
+        setattr_(self, "names", frozenset(self.node_types))
+        order = sorted(range(len(self.node_types)), key=lambda i: self.node_types[i].lower())
+        setattr_(self, "_lower", tuple(self.node_types[i].lower() for i in order))
+        setattr_(self, "_lower_order", tuple(order))
+        setattr_(self, "etag", f'W/"{self.version}"')
+        setattr_(self, "body", json.dumps({
+            "node_types": list(self.node_types),
+            "count": len(self.node_types),
+            "version": self.version,
+            "timestamp": self.loaded_at,
+        }, separators=(",", ":")).encode("utf-8"))
+
+    def __contains__(self, node_type: object) -> bool:
+        return node_type in self.names
+
+    def __iter__(self):
+        return iter(self.node_types)
+
+    def __len__(self) -> int:
+        return len(self.node_types)
+
+    def payload(self) -> dict:
+        return json.loads(self.body)
+
+    def prefix_search(self, prefix: str, limit: int = 50) -> List[str]:
+        """Case-insensitive prefix match using the sorted lowercase index."""
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._lower, prefix)
+        results = []
+        for i in range(start, len(self._lower)):
+            if not self._lower[i].startswith(prefix) or len(results) >= limit:
+                break
+            results.append(self.node_types[self._lower_order[i]])
+        return results
+
+    def fuzzy_search(self, query: str, limit: int = 50) -> List[str]:
+        """Subsequence match ranked by how tightly the query characters cluster."""
+        query = query.lower()
+        scored = []
+        for i, lowered in enumerate(self._lower):
+            score = fuzzy_score(query, lowered)
+            if score is not None:
+                scored.append((score, lowered, self.node_types[self._lower_order[i]]))
+        scored.sort()
+        return [name for _, _, name in scored[:limit]]
+
+
+def load_registry(path: Optional[str] = None) -> BuiltinRegistry:
+    """Load the registry from a JSON data file (``{"node_types": [...]}`` or a list)."""
+    with open(path or DEFAULT_REGISTRY_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    names = data["node_types"] if isinstance(data, dict) else data
+    node_types = tuple(sorted(set(names)))
+    version = hashlib.sha256("\n".join(node_types).encode("utf-8")).hexdigest()[:16]
+    return BuiltinRegistry(node_types=node_types, version=version, loaded_at=int(time.time()))
+
+
+BUILTIN_REGISTRY = load_registry(os.getenv("COPILOT_BUILTIN_NODES_FILE"))
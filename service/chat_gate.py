@@ -0,0 +1,373 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Concurrency control for chat requests.
+
+* ``SessionLocks`` - one FIFO lock per session, so turns of the same
+  conversation run one after another instead of interleaving their appends.
+  Entries exist only while a session has requests in flight, and each session
+  may only have a few requests pending.
+* ``Admission`` - a global limit on chats being generated, with a bounded
+  FIFO queue behind it. Past the queue, requests get ``ChatBusy`` (HTTP 429).
+* ``Coalescer`` - identical in-flight requests (same session, message and
+  idempotency key) share one result or one stream instead of each doing the
+  work. Results of requests that carried an explicit idempotency key are
+  replayed for a short while after they finish, so retries do not run again.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from .metrics import REGISTRY
+
+CHAT_ACTIVE = REGISTRY.gauge("copilot_chat_active", "Chats being generated")
+CHAT_QUEUED = REGISTRY.gauge("copilot_chat_queued", "Chats waiting for an admission slot")
+CHAT_REJECTED = REGISTRY.counter("copilot_chat_rejected_total", "Chats answered with 429", ("reason",))
+CHAT_SHARED = REGISTRY.counter(
+    "copilot_chat_shared_total", "Chats served from an identical in-flight or replayed request", ("kind",))
+
+
+class ChatBusy(Exception):
+    """The request was not admitted; answer with HTTP 429."""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+def chat_key(
+    session_id: str,
+    message: str,
+    idempotency_key: Optional[str] = None,
+    intent: Optional[str] = None,
+) -> str:
+    digest = hashlib.sha256(message.encode("utf-8")).hexdigest()[:32]
+    return f"{session_id}\x00{digest}\x00{idempotency_key or ''}\x00{intent or ''}"
+
+
+class _SessionLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class SessionLocks:
+    """Per-session FIFO locks that are dropped as soon as a session goes idle."""
+
+    def __init__(self, max_pending_per_session: int = 4):
+        self.max_pending_per_session = max_pending_per_session
+        self._locks: Dict[str, _SessionLock] = {}
+
+    def pending(self, session_id: str) -> int:
+        entry = self._locks.get(session_id)
+        return entry.users if entry is not None else 0
+
+    def try_reserve(self, session_id: str) -> "SessionSlot":
+        """Take a pending place for the session without waiting; raises ``ChatBusy`` if full."""
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = _SessionLock()
+        if entry.users >= self.max_pending_per_session:
+            CHAT_REJECTED.inc(reason="session")
+            raise ChatBusy("Too many pending requests for this session")
+        entry.users += 1
+        return SessionSlot(self, session_id, entry)
+
+    def _release(self, session_id: str, entry: _SessionLock) -> None:
+        entry.users -= 1
+        if entry.users == 0 and self._locks.get(session_id) is entry:
+            del self._locks[session_id]
+
+    @asynccontextmanager
+    async def hold(self, session_id: str):
+        slot = self.try_reserve(session_id)
+        try:
+            async with slot:
+                yield
+        finally:
+            slot.close()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class SessionSlot:
+    """A pending place in a session's queue; ``async with`` it to hold the session lock."""
+
+    def __init__(self, locks: SessionLocks, session_id: str, entry: _SessionLock):
+        self._locks = locks
+        self._session_id = session_id
+        self._entry = entry
+        self._state = "reserved"
+
+    async def __aenter__(self):
+        await self._entry.lock.acquire()
+        self._state = "locked"
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._state == "locked":
+            self._entry.lock.release()
+            self._state = "reserved"
+
+    def close(self) -> None:
+        """Give the place back; safe to call more than once."""
+        if self._state == "closed":
+            return
+        if self._state == "locked":
+            self._entry.lock.release()
+        self._state = "closed"
+        self._locks._release(self._session_id, self._entry)
+
+
+class Reservation:
+    """A place in the admission queue; ``async with`` it to hold a working slot."""
+
+    def __init__(self, admission: "Admission"):
+        self._admission = admission
+        self._state = "reserved"
+
+    @property
+    def position(self) -> int:
+        """0 if a slot is free now, otherwise the queue position this request would take."""
+        admission = self._admission
+        if admission.active < admission.max_active and not admission._waiters:
+            return 0
+        return len(admission._waiters) + 1
+
+    async def __aenter__(self):
+        await self._admission._acquire()
+        self._state = "active"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Give back the slot (if held) and the reservation; safe to call twice."""
+        if self._state == "active":
+            self._admission._release()
+        if self._state != "closed":
+            self._admission.admitted -= 1
+            self._state = "closed"
+
+
+class Admission:
+    """At most ``max_active`` chats run at once; ``max_queue`` more may wait."""
+
+    def __init__(self, max_active: int = 64, max_queue: int = 256, retry_after: float = 2.0):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def reserve(self) -> Reservation:
+        if self.admitted >= self.max_active + self.max_queue:
+            self.rejected += 1
+            CHAT_REJECTED.inc(reason="queue")
+            raise ChatBusy("Server is busy, retry later", self.retry_after)
+        self.admitted += 1
+        return Reservation(self)
+
+    async def _acquire(self) -> None:
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            CHAT_ACTIVE.set(self.active)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        CHAT_QUEUED.set(len(self._waiters))
+        try:
+            # The releasing request hands its slot over, so ``active`` is unchanged
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+                CHAT_QUEUED.set(len(self._waiters))
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            CHAT_QUEUED.set(len(self._waiters))
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        CHAT_ACTIVE.set(self.active)
+
+
+class _SharedStream:
+    """Runs one chunk stream and fans it out to every subscriber.
+
+    Chat chunks carry the cumulative text, so only the latest chunk is kept and
+    a subscriber that falls behind simply skips to it.
+    """
+
+    def __init__(self, source: AsyncIterator[Any], on_done: Callable[["_SharedStream"], None]):
+        self.latest: Any = None
+        self.sequence = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, source: AsyncIterator[Any]) -> None:
+        try:
+            async for chunk in source:
+                self.latest = chunk
+                self.sequence += 1
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = ConnectionResetError("All subscribers disconnected")
+        except Exception as e:
+            self.error = e
+        finally:
+            await source.aclose()
+            self.done = True
+            self._notify()
+            self._on_done(self)
+
+    async def subscribe(self, is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> AsyncIterator[Any]:
+        self.subscribers += 1
+        seen = 0
+        try:
+            while True:
+                changed = self._changed
+                if self.sequence > seen:
+                    seen = self.sequence
+                    yield self.latest
+                    if is_disconnected is not None and await is_disconnected():
+                        return
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Nobody is listening any more; stop generating (partial output is still saved)
+                self._task.cancel()
+
+
+class Coalescer:
+    """Shares the work of identical in-flight requests."""
+
+    def __init__(self, replay_ttl: float = 120.0, max_replay: int = 1024):
+        self.replay_ttl = replay_ttl
+        self.max_replay = max_replay
+        self.coalesced = 0
+        self.replayed = 0
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self._replay: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+
+    def _remember(self, key: str, kind: str, value: Any) -> None:
+        self._replay[key] = (time.monotonic() + self.replay_ttl, kind, value)
+        self._replay.move_to_end(key)
+        while len(self._replay) > self.max_replay:
+            self._replay.popitem(last=False)
+
+    def _replayed(self, key: str, kind: str) -> Tuple[bool, Any]:
+        entry = self._replay.get(key)
+        if entry is None:
+            return False, None
+        expires, stored_kind, value = entry
+        if expires < time.monotonic() or stored_kind != kind:
+            del self._replay[key]
+            return False, None
+        self.replayed += 1
+        CHAT_SHARED.inc(kind="replayed")
+        return True, value
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]], replayable: bool = False) -> Any:
+        """Await ``factory()``, or the identical call already in flight."""
+        found, value = self._replayed(key, "call")
+        if found:
+            return value
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            CHAT_SHARED.inc(kind="coalesced")
+        else:
+            # A separate task, so one caller disconnecting does not cancel the others
+            task = self._calls[key] = asyncio.ensure_future(factory())
+
+            def finished(done: asyncio.Future) -> None:
+                self._calls.pop(key, None)
+                if not done.cancelled() and done.exception() is None and replayable:
+                    self._remember(key, "call", done.result())
+
+            task.add_done_callback(finished)
+        return await asyncio.shield(task)
+
+    def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[Any]],
+        replayable: bool = False,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> AsyncIterator[Any]:
+        """Subscribe to ``factory()``'s chunks, or to the identical stream already running."""
+        found, last_chunk = self._replayed(key, "stream")
+        if found:
+            return _single(last_chunk)
+        shared = self._streams.get(key)
+        if shared is not None and not shared.done:
+            self.coalesced += 1
+            CHAT_SHARED.inc(kind="coalesced")
+        else:
+            def finished(done: _SharedStream) -> None:
+                if self._streams.get(key) is done:
+                    del self._streams[key]
+                if done.error is None and replayable and done.sequence:
+                    self._remember(key, "stream", done.latest)
+
+            shared = self._streams[key] = _SharedStream(factory(), finished)
+        return shared.subscribe(is_disconnected)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight_calls": len(self._calls),
+            "in_flight_streams": len(self._streams),
+            "replayable": len(self._replay),
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+        }
+
+
+async def _single(item: Any) -> AsyncIterator[Any]:
+    yield item
+
+
+session_locks = SessionLocks(int(os.getenv("COPILOT_CHAT_SESSION_MAX_PENDING", 4)))
+chat_admission = Admission(
+    max_active=int(os.getenv("COPILOT_CHAT_MAX_ACTIVE", 64)),
+    max_queue=int(os.getenv("COPILOT_CHAT_MAX_QUEUE", 256)),
+)
+chat_coalescer = Coalescer(replay_ttl=float(os.getenv("COPILOT_CHAT_REPLAY_TTL", 120)))
@@ -0,0 +1,138 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Pluggable chat responders.
+
+A responder turns a user message into a stream of text deltas. The
+conversation service drives the stream and wraps the deltas into
+``ChatResponse`` chunks, so every responder can stream without knowing about
+HTTP or session storage.
+"""
+
+import asyncio
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into word-sized chunks that keep their trailing whitespace."""
+    return _TOKEN_RE.findall(text)
+
+
+class ChatResponder(ABC):
+    """Interface for anything that can answer a chat message."""
+
+    @abstractmethod
+    def stream(
+        self,
+        session_id: str,
+        message: str,
+        history: List[Dict[str, Any]],
+        ext: Optional[List[Dict[str, Any]]] = None,
+    ) -> AsyncIterator[str]:
+        """Yield the reply as a sequence of text deltas."""
+
+    async def respond(
+        self,
+        session_id: str,
+        message: str,
+        history: List[Dict[str, Any]],
+        ext: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
+        """Return the whole reply at once."""
+        parts = []
+        async for delta in self.stream(session_id, message, history, ext):
+            parts.append(delta)
+        return "".join(parts)
+
+    def cache_key(
+        self,
+        message: str,
+        history: List[Dict[str, Any]],
+        ext: Optional[List[Dict[str, Any]]] = None,
+    ) -> Optional[str]:
+        """Text that fully determines the reply, or None if it must not be cached.
+
+        Responders whose reply depends on more than the message (history,
+        sampling) keep the default and are never cached.
+        """
+        return None
+
+
+class KeywordResponder(ChatResponder):
+    """Canned replies chosen by keywords in the message."""
+
+    def reply_for(self, message: str) -> str:
+        lowered = message.lower()
+        if "hello" in lowered:
+            return "Hello! How can I assist you with ComfyUI today?"
+        if "workflow" in lowered:
+            return "I can help you create a workflow. What kind of workflow are you looking to create?"
+        return f"I received your message: {message}"
+
+    def cache_key(self, message, history, ext=None):
+        lowered = message.lower()
+        # Same branches as reply_for: canned replies depend only on the keyword
+        if "hello" in lowered:
+            return "hello"
+        if "workflow" in lowered:
+            return "workflow"
+        # The fallback echoes the message, so only the exact text gives the same reply
+        return "echo:" + message
+
+    async def stream(self, session_id, message, history, ext=None):
+        for token in tokenize(self.reply_for(message)):
+            yield token
+
+
+class StubLLMResponder(ChatResponder):
+    """Local stand-in for an LLM that emits tokens with a fixed delay."""
+
+    def __init__(self, token_delay: float = 0.02):
+        self.token_delay = token_delay
+
+    async def stream(self, session_id, message, history, ext=None):
+        turns = sum(1 for m in history if m.get("role") == "user")
+        reply = (
+            f"(stub model, turn {turns}) You said: {message}. "
+            "This is a locally generated response used for development and testing."
+        )
+        for token in tokenize(reply):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield token
+
+
+_RESPONDER_FACTORIES: Dict[str, Callable[[], ChatResponder]] = {
+    "keyword": KeywordResponder,
+    "stub": lambda: StubLLMResponder(float(os.getenv("COPILOT_STUB_TOKEN_DELAY", "0.02"))),
+}
+
+_responder: Optional[ChatResponder] = None
+
+
+def register_responder(name: str, factory: Callable[[], ChatResponder]) -> None:
+    """Make a responder selectable through ``COPILOT_CHAT_RESPONDER``."""
+    _RESPONDER_FACTORIES[name] = factory
+
+
+def set_chat_responder(responder: Optional[ChatResponder]) -> None:
+    """Override the active responder (``None`` restores the configured one)."""
+    global _responder
+    _responder = responder
+
+
+def get_chat_responder() -> ChatResponder:
+    """Return the active responder, creating it from the environment if needed."""
+    global _responder
+    if _responder is None:
+        name = os.getenv("COPILOT_CHAT_RESPONDER", "keyword").lower()
+        if name not in _RESPONDER_FACTORIES:
+            raise ValueError(f"Unknown chat responder: {name}")
+        _responder = _RESPONDER_FACTORIES[name]()
+    return _responder
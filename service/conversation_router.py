@@ -1,74 +1,349 @@
-from fastapi import APIRouter, HTTPException, Request, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from starlette.datastructures import UploadFile
 from typing import Optional, List, Dict, Any
 import json
 import asyncio
+import hashlib
+import os
 from .conversation_service import (
-    fetch_messages_sync,
-    workflow_gen,
-    upload_to_oss,
-    invoke_chat,
-    get_workflow_templates,
-    session_messages
+    fetch_messages_page,
+    fetch_payload,
+    generate_workflow,
+    analyze_workflow_request,
+    diff_workflow_request,
+    ingest_events,
+    submit_sweep,
+    sweep_status,
+    cancel_sweep,
+    busy_headers,
+    busy_payload,
+    gated_chat_reply,
+    open_chat_stream,
+    with_intent_ext,
+    encode_chat_chunk,
+    session_store
 )
+from .template_catalog import get_template_catalog
+from .static_assets import etag_matches
+from .chat_gate import ChatBusy
+from .event_hub import get_event_hub
+from .blob_cache import (
+    BlobCacheStorage,
+    MissingBlobs,
+    get_blob_cache,
+    is_sha256,
+    resolve_image_refs,
+)
+from .upload_storage import (
+    UploadTooLarge,
+    get_upload_limits,
+    get_upload_storage,
+    iter_upload_file,
+    store_upload,
+)
+
+from .log import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
 @router.get("/fetch-messages/{session_id}")
-async def get_messages(session_id: str):
+async def get_messages(
+    session_id: str,
+    after: Optional[int] = Query(None, ge=0, description="Only messages with a larger id"),
+    before: Optional[int] = Query(None, ge=0, description="Only messages with a smaller id"),
+    limit: int = Query(50, ge=1, le=500),
+    include_ext: bool = Query(False, description="Include full ext payloads"),
+):
     try:
-        messages = fetch_messages_sync(session_id)
-        return {"messages": messages}
+        return fetch_messages_page(session_id, after, before, limit, include_ext)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/payloads/{ref}")
+async def get_payload(ref: str):
+    payload, status = fetch_payload(ref)
+    headers = {"ETag": f'"{ref}"', "Cache-Control": "private, max-age=31536000, immutable"} if status == 200 else None
+    return JSONResponse(status_code=status, content=payload, headers=headers)
+
 @router.post("/workflow-gen")
-async def generate_workflow(request: Request):
+async def workflow_gen_endpoint(request: Request):
     try:
         data = await request.json()
-        result = await workflow_gen(request)
-        return result
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be JSON")
+    try:
+        payload, status = generate_workflow(data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return JSONResponse(status_code=status, content=payload)
+
+class WorkflowAnalyzeRequest(BaseModel):
+    workflow: Dict[str, Any]
+    downstream_of: Optional[List[Any]] = None
+
+@router.post("/workflow/analyze")
+async def workflow_analyze(body: WorkflowAnalyzeRequest):
+    """Validate a workflow graph and return its execution order."""
+    payload, status = analyze_workflow_request({"workflow": body.workflow, "downstream_of": body.downstream_of})
+    return JSONResponse(status_code=status, content=payload)
+
+class WorkflowDiffRequest(BaseModel):
+    before: Dict[str, Any]
+    after: Dict[str, Any]
+
+@router.post("/workflow/diff")
+async def workflow_diff(body: WorkflowDiffRequest):
+    payload, status = diff_workflow_request({"before": body.before, "after": body.after})
+    return JSONResponse(status_code=status, content=payload)
+
+@router.post("/chat/track_event")
+async def track_event(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Invalid JSON body"})
+    payload, status = ingest_events(data)
+    return JSONResponse(status_code=status, content=payload)
 
-@router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+@router.post("/sweeps")
+async def create_sweep(request: Request):
     try:
-        file_data = await file.read()
-        result = upload_to_oss(file_data, file.filename)
-        return {"url": result}
+        data = await request.json()
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Invalid JSON body"})
+    payload, status = submit_sweep(data)
+    return JSONResponse(status_code=status, content=payload)
+
+@router.get("/sweeps/{job_id}")
+async def get_sweep(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    payload, status = sweep_status(job_id, offset, limit)
+    return JSONResponse(status_code=status, content=payload)
+
+@router.post("/sweeps/{job_id}/cancel")
+async def stop_sweep(job_id: str):
+    payload, status = cancel_sweep(job_id)
+    return JSONResponse(status_code=status, content=payload)
+
+def _content_length(request: Request) -> Optional[int]:
+    value = request.headers.get("content-length")
+    return int(value) if value and value.isdigit() else None
+
+# The ``file`` part is read from the form here rather than declared as
+# ``UploadFile = File(...)``, which would spool the whole body to disk before the
+# handler could check its declared size
+@router.post("/upload", openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {
+    "schema": {"type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}},
+}}}})
+async def upload_file(request: Request):
+    max_bytes, chunk_size = get_upload_limits()
+    declared_size = _content_length(request)
+    if declared_size is not None and declared_size > max_bytes:
+        raise HTTPException(status_code=413, detail=str(UploadTooLarge(max_bytes)))
+    form = await request.form()
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=400, detail="Missing file field")
+        stored = await store_upload(
+            iter_upload_file(file, chunk_size),
+            file.filename,
+            get_upload_storage(),
+            max_bytes=max_bytes,
+        )
+        return stored
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await form.close()
+
+@router.put("/upload/raw")
+async def upload_raw(request: Request, filename: str = ""):
+    """Stream a raw request body into storage without multipart spooling."""
+    max_bytes, _ = get_upload_limits()
+    try:
+        stored = await store_upload(
+            request.stream(),
+            filename,
+            get_upload_storage(),
+            max_bytes=max_bytes,
+            declared_size=_content_length(request),
+        )
+        return stored
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/uploads/{name}")
+async def get_upload(name: str):
+    path = get_upload_storage().path_for(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path)
+
+@router.api_route("/blobs/{sha256}", methods=["HEAD"])
+async def head_blob(sha256: str):
+    """Let clients check whether the server already holds a blob."""
+    path = get_blob_cache().get_path(sha256)
+    if path is None:
+        return Response(status_code=404)
+    return Response(headers={"Content-Length": str(os.path.getsize(path)), "ETag": f'"{sha256}"'})
+
+@router.get("/blobs/{sha256}")
+async def get_blob(sha256: str):
+    path = get_blob_cache().get_path(sha256)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path, headers={"ETag": f'"{sha256}"', "Cache-Control": "public, max-age=31536000, immutable"})
+
+class BlobExistsRequest(BaseModel):
+    digests: List[str]
+
+@router.post("/blobs/exists")
+async def blobs_exist(body: BlobExistsRequest):
+    """Report which of several digests still need to be uploaded."""
+    return {"missing": get_blob_cache().missing(body.digests)}
+
+@router.put("/blobs")
+async def put_blob(request: Request):
+    """Stream a raw body into the blob cache and return its digest."""
+    max_bytes, _ = get_upload_limits()
+    expected = request.headers.get("x-content-sha256", "")
+    if is_sha256(expected) and get_blob_cache().contains(expected):
+        return {"sha256": expected, "deduplicated": True}
+    try:
+        stored = await store_upload(
+            request.stream(),
+            None,
+            BlobCacheStorage(get_blob_cache()),
+            max_bytes=max_bytes,
+            declared_size=_content_length(request),
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return {"sha256": stored["sha256"], "size": stored["size"], "deduplicated": stored["deduplicated"]}
 
 class ChatRequest(BaseModel):
     session_id: str
     message: str
+    idempotency_key: Optional[str] = None
+
+def _busy(e: ChatBusy) -> JSONResponse:
+    return JSONResponse(status_code=429, content=busy_payload(e), headers=busy_headers(e))
 
 @router.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(body: ChatRequest, request: Request):
     try:
-        # Create a mock aiohttp request for backward compatibility
-        class MockRequest:
-            def __init__(self, data):
-                self.data = data
-            
-            async def json(self):
-                return self.data
-        
-        mock_request = MockRequest({"session_id": request.session_id, "message": request.message})
-        
-        # Call the original function with the mock request
-        response = await invoke_chat(mock_request)
-        return response
+        return await gated_chat_reply(
+            body.session_id,
+            body.message,
+            body.idempotency_key or request.headers.get("idempotency-key"),
+        )
+    except ChatBusy as e:
+        return _busy(e)
     except Exception as e:
-        print(f"Error in chat endpoint: {str(e)}")
+        logger.exception("chat endpoint failed")
         raise HTTPException(status_code=500, detail=str(e))
 
+class ChatInvokeRequest(BaseModel):
+    session_id: str
+    prompt: str
+    intent: Optional[str] = None
+    ext: Optional[List[Dict[str, Any]]] = None
+    images: Optional[List[Dict[str, Any]]] = None
+    idempotency_key: Optional[str] = None
+
+@router.post("/chat/invoke")
+async def chat_invoke(body: ChatInvokeRequest, request: Request):
+    """Stream the reply as newline-delimited ChatResponse chunks.
+
+    Identical in-flight requests share one stream. Returns 429 with
+    ``Retry-After`` when the chat queue is full.
+    """
+    try:
+        # Decoding inline base64 and writing blobs to disk stay off the event loop
+        images = await asyncio.to_thread(resolve_image_refs, get_blob_cache(), body.images) if body.images else []
+    except MissingBlobs as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "missing": e.digests})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        ext = await with_intent_ext(body.intent, body.prompt, body.ext)
+        chunks = await open_chat_stream(
+            body.session_id,
+            body.prompt,
+            ext,
+            images,
+            idempotency_key=body.idempotency_key or request.headers.get("idempotency-key"),
+            is_disconnected=request.is_disconnected,
+            intent=body.intent,
+        )
+    except ChatBusy as e:
+        return _busy(e)
+
+    async def ndjson():
+        try:
+            async for chunk in chunks:
+                yield encode_chat_chunk(chunk)
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@router.websocket("/ws")
+async def websocket_events(websocket: WebSocket):
+    """Push events (chat messages of subscribed sessions, server events) to the UI."""
+    await websocket.accept()
+    sessions = websocket.query_params.get("session_id", "").split(",")
+    await get_event_hub().serve(
+        websocket.send_text,
+        websocket.close,
+        websocket.iter_text(),
+        websocket.query_params.get("clientId"),
+        sessions,
+    )
+
 @router.get("/templates")
-async def get_templates():
+async def get_templates(
+    request: Request,
+    q: str = "",
+    node_type: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+):
     try:
-        templates = get_workflow_templates()
-        return {"templates": templates}
+        catalog = get_template_catalog()
+        etag = f'W/"{catalog.version}-{hashlib.sha1(f"{q}|{node_type}|{offset}|{limit}".encode()).hexdigest()[:8]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(catalog.search(q, node_type, offset, limit), headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/templates/{template_id}")
+async def get_template(template_id: str, request: Request):
+    catalog = get_template_catalog()
+    info = catalog.get(template_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    etag = f'W/"{template_id}-{info["updated_at"]}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse({**info, "workflow": catalog.load_workflow(template_id)}, headers={"ETag": etag})
+
+@router.get("/templates/{template_id}/image")
+async def get_template_image(template_id: str):
+    path = get_template_catalog().image_path(template_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return FileResponse(path)
@@ -2,31 +2,47 @@
 # Licensed under the MIT License.
 
 import json
+import math
 import os
 import asyncio
 import time
-import sys
-from pathlib import Path
-from typing import Optional, Dict, Any, TypedDict, List, Union
-
-# Add parent directory to path to allow imports
-sys.path.append(str(Path(__file__).parent.parent))
-
-# Import server mock
-from service.server import app as server
+from typing import Optional, Dict, Any, TypedDict, List, Union, AsyncIterator, Awaitable, Callable
 
 from aiohttp import web
 import aiohttp
 import base64
 
-# Use in-memory dictionary to store session messages
-session_messages = {}
+from .session_store import get_session_store
+from .chat_responder import get_chat_responder
+from .response_cache import get_response_cache
+from .payload_store import get_payload_store
+from .template_catalog import get_template_catalog
+from .event_hub import get_event_hub, session_topic
+from .event_ingest import get_event_ingest
+from .chat_gate import ChatBusy, chat_admission, chat_coalescer, chat_key, session_locks
+from .sweep_jobs import SweepBusy, SweepSpecError, get_sweep_scheduler
+from .workflow_engine import WorkflowGenError, get_workflow_engine, known_node_types
+from .workflow_graph import WorkflowParseError, analyze_workflow, diff_workflows, parse_workflow
+from .log import get_logger
+from .metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY, observe_first_chunk
+from .upload_storage import (
+    UploadTooLarge,
+    get_upload_limits,
+    get_upload_storage,
+    iter_bytes,
+    store_upload,
+)
+
+logger = get_logger(__name__)
+
+# Session messages live in a pluggable store (bounded memory or shared SQLite)
+session_store = get_session_store()
 
 # Add at the beginning of the file
 STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "public")
 
-# Import the server instance and routes
-from .server import server, add_route
+# Import the server instance
+from .server import server
 
 # Make server available globally
 server = server
@@ -65,120 +81,527 @@ class ChatResponse(TypedDict):
 
 # Get workflow template
 def get_workflow_templates():
-    templates = [
-        {
-            "id": 1,
-            "name": "Image Generation",
-            "description": "Generate images using a text prompt",
-            "image": "https://placehold.co/600x400"
-        },
-        {
-            "id": 2,
-            "name": "Image to Image",
-            "description": "Transform an image based on a text prompt",
-            "image": "https://placehold.co/600x400"
-        },
-        {
-            "id": 3,
-            "name": "Image Upscaling",
-            "description": "Upscale and enhance image quality",
-            "image": "https://placehold.co/600x400"
-        }
-    ]
-    
-    return templates
+    return get_template_catalog().list()
+
+def project_message(message: Dict[str, Any], include_ext: bool = False) -> Dict[str, Any]:
+    """Compact view of a stored message; heavy ``ext`` payloads are summarized by type.
+
+    With ``include_ext`` interned payloads are rehydrated from the payload store.
+    """
+    if not message.get("ext"):
+        return message
+    if include_ext:
+        return {**message, "ext": get_payload_store().unpack(message["ext"])}
+    projected = {k: v for k, v in message.items() if k != "ext"}
+    items = [item for item in message["ext"] if isinstance(item, dict)]
+    projected["ext_types"] = [item.get("type") for item in items]
+    refs = [item.get("ref") for item in items]
+    if any(refs):
+        projected["ext_refs"] = refs
+    return projected
+
+def fetch_messages_page(
+    session_id: str,
+    after: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: int = 50,
+    include_ext: bool = False,
+) -> Dict[str, Any]:
+    """Fetch one page of a session's history.
+
+    ``after`` returns only messages newer than that id (an incremental refresh);
+    otherwise the newest ``limit`` messages older than ``before`` are returned.
+    ``next_after`` is the cursor for the next incremental fetch and
+    ``next_before`` the cursor for loading older history.
+    """
+    # Ask for one extra message to learn whether more remain.
+    messages = session_store.page(session_id, after=after, before=before, limit=limit + 1)
+    has_more = len(messages) > limit
+    if has_more:
+        messages = messages[:limit] if after is not None else messages[1:]
+    return {
+        "messages": [project_message(m, include_ext) for m in messages],
+        "has_more": has_more,
+        "next_after": messages[-1]["id"] if messages else after,
+        "next_before": messages[0]["id"] if messages else before,
+    }
+
+def _int_or_none(value: Optional[str]) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
 
 async def fetch_messages(request):
     session_id = request.query.get("session_id")
-    if not session_id or session_id not in session_messages:
+    if not session_id:
         return web.json_response([])
-    return web.json_response(session_messages[session_id])
+    try:
+        page = fetch_messages_page(
+            session_id,
+            after=_int_or_none(request.query.get("after")),
+            before=_int_or_none(request.query.get("before")),
+            limit=min(int(request.query.get("limit", 50)), 500),
+            include_ext=request.query.get("include_ext", "").lower() in ("1", "true"),
+        )
+    except ValueError:
+        return web.json_response({"error": "Invalid pagination parameters"}, status=400)
+    return web.json_response(page)
 
 def fetch_messages_sync(session_id):
-    print("fetch_messages: ", session_id)
-    return session_messages.get(session_id, [])
+    logger.debug("fetch messages", extra={"fields": {"session_id": session_id}})
+    return [project_message(m, include_ext=True) for m in session_store.get(session_id)]
+
+def fetch_payload(ref: str):
+    """A payload interned from a message's ``ext``; returns (payload, status)."""
+    data = get_payload_store().load(ref)
+    if data is None:
+        return {"error": f"Unknown payload: {ref}"}, 404
+    return {"ref": ref, "data": data}, 200
+
+async def get_payload(ref: str):
+    return fetch_payload(ref)
+
+def generate_workflow(data):
+    """Generate a workflow for a request body; returns (payload, status)."""
+    try:
+        workflow, source = get_workflow_engine().generate(data)
+    except WorkflowGenError as e:
+        return {"status": "error", "error": str(e)}, 400
+    logger.debug("workflow generated", extra={"fields": {
+        "workflow_id": workflow["id"], "template": workflow["template"], "cache": source}})
+    return {"status": "success", "cache": source, "workflow": workflow}, 200
 
 async def workflow_gen(request):
     """Handle POST request to generate a workflow."""
-    print("Received workflow_gen request")
     try:
         data = await request.json()
-        # Mock response for workflow generation
-        return web.json_response({
-            "status": "success",
-            "workflow": {
-                "id": "workflow_" + str(hash(str(data)))[:8],
-                "name": data.get("name", "Generated Workflow"),
-                "description": "A generated workflow based on your request",
-                "nodes": [],
-                "connections": []
-            }
-        })
+        payload, status = generate_workflow(data)
+        return web.json_response(payload, status=status)
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
+def analyze_workflow_request(data):
+    """Validate and order a workflow; returns (payload, status)."""
+    if not isinstance(data, dict):
+        return {"error": "Request body must be a JSON object"}, 400
+    try:
+        graph = parse_workflow(data.get("workflow"))
+    except WorkflowParseError as e:
+        return {"error": str(e)}, 400
+    seeds = data.get("downstream_of")
+    if seeds is not None and not isinstance(seeds, list):
+        return {"error": "downstream_of must be a list of node ids"}, 400
+    return analyze_workflow(graph, known_node_types(), seeds), 200
+
+def diff_workflow_request(data):
+    """Structural diff between two workflow versions; returns (payload, status)."""
+    if not isinstance(data, dict):
+        return {"error": "Request body must be a JSON object"}, 400
+    try:
+        before = parse_workflow(data.get("before"))
+        after = parse_workflow(data.get("after"))
+    except WorkflowParseError as e:
+        return {"error": str(e)}, 400
+    return diff_workflows(before, after), 200
+
+async def workflow_analyze(request):
+    payload, status = analyze_workflow_request(await request.json())
+    return web.json_response(payload, status=status)
+
+async def workflow_diff(request):
+    payload, status = diff_workflow_request(await request.json())
+    return web.json_response(payload, status=status)
+
+def ingest_events(data):
+    """Buffer one event, a list of events or ``{"events": [...]}``; returns (payload, status)."""
+    if isinstance(data, dict) and isinstance(data.get("events"), list):
+        events = data["events"]
+    elif isinstance(data, list):
+        events = data
+    else:
+        events = [data]
+    accepted, rejected = get_event_ingest().submit(events)
+    return {"accepted": accepted, "rejected": rejected}, 202
+
+async def track_event(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.json_response({"error": "Invalid JSON body"}, status=400)
+    payload, status = ingest_events(data)
+    return web.json_response(payload, status=status)
+
+def submit_sweep(data):
+    """Start a parameter sweep job; returns (payload, status)."""
+    try:
+        job = get_sweep_scheduler().submit(data)
+    except SweepBusy as e:
+        return {"error": str(e)}, 429
+    except SweepSpecError as e:
+        return {"error": str(e)}, 400
+    return job.summary(), 202
+
+def sweep_status(job_id: str, offset: int = 0, limit: int = 100):
+    """Status and a page of partial results of a sweep job; returns (payload, status)."""
+    page = get_sweep_scheduler().page(job_id, max(offset, 0), min(max(limit, 1), 1000))
+    if page is None:
+        return {"error": f"Unknown sweep job: {job_id}"}, 404
+    return page, 200
+
+def cancel_sweep(job_id: str):
+    """Cancel a sweep job; finished combinations keep their results. Returns (payload, status)."""
+    summary = get_sweep_scheduler().cancel(job_id)
+    if summary is None:
+        return {"error": f"Unknown sweep job: {job_id}"}, 404
+    return summary, 200
+
+async def sweep_submit(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.json_response({"error": "Invalid JSON body"}, status=400)
+    payload, status = submit_sweep(data)
+    return web.json_response(payload, status=status)
+
+async def sweep_get(job_id: str, offset: str = "0", limit: str = "100"):
+    try:
+        return sweep_status(job_id, int(offset), int(limit))
+    except ValueError:
+        return {"error": "offset and limit must be integers"}, 400
+
+async def sweep_cancel(job_id: str):
+    return cancel_sweep(job_id)
+
 async def upload_to_oss(file_data, filename):
-    """Handle file upload to OSS (mock implementation)."""
+    """Store an in-memory file through the configured upload storage and return its URL."""
     try:
-        # In a real implementation, this would upload the file to an object storage service
-        file_url = f"https://example.com/uploads/{filename}"
-        return file_url
-    except Exception as e:
-        print(f"Error uploading file: {e}")
+        max_bytes, chunk_size = get_upload_limits()
+        stored = await store_upload(
+            iter_bytes(file_data, chunk_size),
+            filename,
+            get_upload_storage(),
+            max_bytes=max_bytes,
+            declared_size=len(file_data),
+        )
+        return stored["url"]
+    except Exception:
+        logger.error("upload failed", exc_info=True, extra={"fields": {"upload_name": filename}})
         raise
 
+async def upload_file(request):
+    """Handle a multipart file upload, streaming each part in chunks (aiohttp handler)."""
+    max_bytes, chunk_size = get_upload_limits()
+    try:
+        reader = await request.multipart()
+        field = await reader.next()
+        while field is not None and field.name != "file":
+            field = await reader.next()
+        if field is None:
+            return web.json_response({"error": "Missing file field"}, status=400)
+
+        async def chunks():
+            while True:
+                chunk = await field.read_chunk(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+        stored = await store_upload(
+            chunks(),
+            field.filename,
+            get_upload_storage(),
+            max_bytes=max_bytes,
+            declared_size=request.content_length,
+        )
+        return web.json_response(stored)
+    except UploadTooLarge as e:
+        return web.json_response({"error": str(e)}, status=413)
+
+async def get_upload(name: str):
+    """Serve a stored upload by its content-addressed name (aiohttp handler)."""
+    path = get_upload_storage().path_for(name)
+    if path is None:
+        return {"error": "Not Found"}, 404
+    return web.FileResponse(path)
+
+def save_message(session_id: str, message: Dict[str, Any]) -> int:
+    """Append a message to a session and push it to the session's WebSocket subscribers.
+
+    Large ``ext`` payloads are stored once in the payload store and the saved
+    message keeps references; subscribers still receive the full message.
+    """
+    stored = message
+    if message.get("ext"):
+        stored = {**message, "ext": get_payload_store().pack(session_id, message["ext"])}
+    message_id = session_store.append(session_id, stored)
+    get_event_hub().publish_threadsafe(
+        session_topic(session_id), "chat_message", {"session_id": session_id, "message": {**message, "id": message_id}})
+    return message_id
+
+async def chat_reply(session_id: str, message: str) -> Dict[str, Any]:
+    """Generate a reply to ``message`` and save both turns to the session."""
+    logger.debug("chat request", extra={"fields": {"session_id": session_id, "message_chars": len(message)}})
+
+    history = session_store.get(session_id)
+
+    # Add user message to session
+    save_message(session_id, {"role": "user", "content": message})
+
+    # Generate AI response with the configured responder
+    # Repeat questions the responder marks as cacheable are answered from the cache
+    ai_response = await get_response_cache().respond(get_chat_responder(), session_id, message, history)
+
+    # Add AI response to session
+    save_message(session_id, {"role": "assistant", "content": ai_response})
+
+    logger.debug("chat response", extra={"fields": {"session_id": session_id, "response_chars": len(ai_response)}})
+    # Create response in the format expected by the client
+    return {
+        "session_id": session_id,
+        "response": ai_response,
+        "timestamp": int(time.time())
+    }
+
+async def gated_chat_reply(session_id: str, message: str, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+    """``chat_reply`` behind the session lock and admission limit.
+
+    An identical request already in flight is joined instead of run again.
+    Raises ``ChatBusy`` when the request cannot be admitted.
+    """
+    async def run() -> Dict[str, Any]:
+        reservation = chat_admission.reserve()
+        try:
+            async with session_locks.hold(session_id):
+                async with reservation:
+                    return await chat_reply(session_id, message)
+        finally:
+            reservation.close()
+
+    return await chat_coalescer.run(
+        chat_key(session_id, message, idempotency_key), run, replayable=bool(idempotency_key))
+
+def busy_payload(e: ChatBusy) -> Dict[str, Any]:
+    return {
+        "error": str(e),
+        "retry_after": e.retry_after,
+        "queued": chat_admission.queued,
+    }
+
+def busy_headers(e: ChatBusy) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+
+def _idempotency_key(request, data: Dict[str, Any]) -> Optional[str]:
+    headers = getattr(request, "headers", None) or {}
+    return data.get("idempotency_key") or headers.get("Idempotency-Key")
+
 async def invoke_chat(request):
     """Handle chat messages and generate responses."""
     try:
         data = await request.json()
         session_id = data.get("session_id", "default_session")
         message = data.get("message", "")
-        
-        print(f"Received chat request - Session: {session_id}, Message: {message}")
-        
-        # Initialize session if it doesn't exist
-        if session_id not in session_messages:
-            session_messages[session_id] = []
-        
-        # Add user message to session
-        session_messages[session_id].append({"role": "user", "content": message})
-        
-        # Generate AI response based on message content
-        if "hello" in message.lower():
-            ai_response = "Hello! How can I assist you with ComfyUI today?"
-        elif "workflow" in message.lower():
-            ai_response = "I can help you create a workflow. What kind of workflow are you looking to create?"
-        else:
-            ai_response = f"I received your message: {message}"
-        
-        # Add AI response to session
-        session_messages[session_id].append({"role": "assistant", "content": ai_response})
-        
-        # Create response in the format expected by the client
-        response_data = {
-            "session_id": session_id,
-            "response": ai_response,
-            "timestamp": int(time.time())
-        }
-        print(f"Sending response: {response_data}")
-        
-        # Return a dictionary that FastAPI can convert to JSON
-        return response_data
-        
+        return await gated_chat_reply(session_id, message, _idempotency_key(request, data))
+    except ChatBusy as e:
+        return web.json_response(busy_payload(e), status=429, headers=busy_headers(e))
     except Exception as e:
-        error_msg = f"Error in invoke_chat: {str(e)}"
-        print(error_msg)
+        logger.exception("invoke_chat failed")
         # Return a dictionary with error information
         return {"error": "An error occurred while processing your request", "details": str(e)}
 
-# Define routes using the add_route function
-def setup_routes():
-    """Set up all the routes for the conversation service."""
-    add_route("/workspace/fetch_messages_by_id", fetch_messages, methods=["GET"])
-    add_route("/workspace/fetch_workflow_templates", get_workflow_templates, methods=["GET"])
-    add_route("/workspace/workflow_gen", workflow_gen, methods=["POST"])
-    add_route("/workspace/upload", upload_to_oss, methods=["POST"])
-    add_route("/workspace/chat", invoke_chat, methods=["POST"])
-
-# Call setup_routes to register all routes
-setup_routes()
+async def stream_chat(
+    session_id: str,
+    message: str,
+    ext: Optional[List[ExtItem]] = None,
+    images: Optional[List[str]] = None,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    intent: Optional[str] = None,
+) -> AsyncIterator[ChatResponse]:
+    """Stream a chat reply as ChatResponse chunks.
+
+    Each chunk carries the text generated so far, matching how the UI replaces
+    the message on every chunk; the last chunk has ``finished`` set. The
+    responder stream is closed as soon as ``is_disconnected`` reports that the
+    client went away, and whatever was generated is still saved to the session.
+    ``images`` are blob cache digests of the attached images. Cacheable
+    replies come from the response cache in a single chunk.
+    """
+    history = session_store.get(session_id)
+    user_message = {"role": "user", "content": message}
+    if images:
+        # Attachments are kept as blob digests, never as inline base64
+        user_message["images"] = images
+    save_message(session_id, user_message)
+
+    parts: List[str] = []
+    finished = False
+    deltas = get_response_cache().stream(get_chat_responder(), session_id, message, history, ext, intent)
+    try:
+        async for delta in deltas:
+            if is_disconnected is not None and await is_disconnected():
+                break
+            parts.append(delta)
+            yield ChatResponse(
+                session_id=session_id,
+                text="".join(parts),
+                finished=False,
+                type="message",
+                format="markdown",
+                ext=None,
+            )
+        else:
+            finished = True
+            yield ChatResponse(
+                session_id=session_id,
+                text="".join(parts),
+                finished=True,
+                type="message",
+                format="markdown",
+                ext=ext or None,
+            )
+    finally:
+        await deltas.aclose()
+        save_message(session_id, {
+            "role": "assistant",
+            "content": "".join(parts),
+            "finished": finished,
+        })
+
+NODE_SEARCH_INTENT = "node_search"
+
+def node_search_ext(prompt: str, limit: int = 10) -> ExtItem:
+    """Node search results for ``prompt`` in the shape the UI's NodeSearch card reads."""
+    from .node_service import search_node_index
+
+    nodes = search_node_index(prompt, limit)["nodes"]
+    return ExtItem(type="node", data=[{
+        "name": node["name"],
+        "description": node["description"] or node["category"],
+        "image": "",
+        "github_url": node["github_url"] or "",
+        "category": node["category"],
+    } for node in nodes])
+
+async def with_intent_ext(intent: Optional[str], prompt: str, ext: Optional[List[ExtItem]]) -> Optional[List[ExtItem]]:
+    """Add the ext items an intent asks for (node search results for ``node_search``)."""
+    if intent == NODE_SEARCH_INTENT and prompt.strip():
+        return list(ext or []) + [await asyncio.to_thread(node_search_ext, prompt)]
+    return ext
+
+async def _gated_stream_chat(
+    session_id: str,
+    message: str,
+    ext: Optional[List[ExtItem]] = None,
+    images: Optional[List[str]] = None,
+    intent: Optional[str] = None,
+) -> AsyncIterator[ChatResponse]:
+    # Both places are taken before the first yield, so a full queue raises
+    # ChatBusy while open_chat_stream still waits for the first chunk
+    slot = session_locks.try_reserve(session_id)
+    try:
+        reservation = chat_admission.reserve()
+    except ChatBusy:
+        slot.close()
+        raise
+    try:
+        position = session_locks.pending(session_id) - 1 + reservation.position
+        if position:
+            # Tell the client where it stands instead of keeping it waiting silently
+            yield ChatResponse(
+                session_id=session_id,
+                text="",
+                finished=False,
+                type="queue",
+                format="text",
+                ext=[ExtItem(type="queue_position", data={"position": position})],
+            )
+        async with slot:
+            async with reservation:
+                chunks = stream_chat(session_id, message, ext, images, intent=intent)
+                try:
+                    async for chunk in chunks:
+                        yield chunk
+                finally:
+                    # Save the partial reply now rather than whenever the generator is collected
+                    await chunks.aclose()
+    finally:
+        reservation.close()
+        slot.close()
+
+async def open_chat_stream(
+    session_id: str,
+    message: str,
+    ext: Optional[List[ExtItem]] = None,
+    images: Optional[List[str]] = None,
+    idempotency_key: Optional[str] = None,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    intent: Optional[str] = None,
+) -> AsyncIterator[ChatResponse]:
+    """Start (or join) a gated chat stream.
+
+    Waits for the first chunk, so ``ChatBusy`` is raised here, before the
+    caller has sent any response headers. Identical in-flight requests share
+    one stream; a request that has to wait first gets a ``queue`` chunk with
+    its position.
+    """
+    chunks = chat_coalescer.stream(
+        chat_key(session_id, message, idempotency_key, intent),
+        lambda: _gated_stream_chat(session_id, message, ext, images, intent),
+        replayable=bool(idempotency_key),
+        is_disconnected=is_disconnected,
+    )
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return _empty_stream()
+    except BaseException:
+        await chunks.aclose()
+        raise
+    return _prepend(first, chunks)
+
+async def _prepend(first: ChatResponse, rest: AsyncIterator[ChatResponse]) -> AsyncIterator[ChatResponse]:
+    try:
+        yield first
+        async for chunk in rest:
+            yield chunk
+    finally:
+        await rest.aclose()
+
+async def _empty_stream() -> AsyncIterator[ChatResponse]:
+    return
+    yield
+
+def encode_chat_chunk(chunk: ChatResponse) -> bytes:
+    """Encode one ChatResponse as an NDJSON line."""
+    return (json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8")
+
+async def invoke_chat_stream(request):
+    """Handle chat messages and stream the reply as NDJSON (aiohttp handler)."""
+    data = await request.json()
+    session_id = data.get("session_id", "default_session")
+    message = data.get("prompt", data.get("message", ""))
+
+    started = time.perf_counter()
+    try:
+        intent = data.get("intent")
+        ext = await with_intent_ext(intent, message, data.get("ext"))
+        chunks = await open_chat_stream(
+            session_id, message, ext, idempotency_key=_idempotency_key(request, data), intent=intent)
+    except ChatBusy as e:
+        return web.json_response(busy_payload(e), status=429, headers=busy_headers(e))
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    first = True
+    try:
+        async for chunk in chunks:
+            # write() waits for the transport to drain, which gives backpressure
+            await response.write(encode_chat_chunk(chunk))
+            if first:
+                observe_first_chunk("/workspace/chat/invoke", time.perf_counter() - started)
+                first = False
+    except (ConnectionResetError, asyncio.CancelledError):
+        await chunks.aclose()
+        raise
+    await response.write_eof()
+    return response
+
+async def metrics(request):
+    """Prometheus metrics for the handlers served through the shim."""
+    return web.Response(body=REGISTRY.expose().encode(), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
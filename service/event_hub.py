@@ -0,0 +1,401 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+WebSocket pub/sub hub for pushing events to the UI.
+
+Clients connect to ``/api/ws`` (FastAPI) or ``/workspace/ws`` (aiohttp) and
+are subscribed to their own client topic plus any sessions named in the
+``session_id`` query parameter; they can change session subscriptions with
+``{"subscribe": [...]}`` / ``{"unsubscribe": [...]}`` messages. Chat messages
+saved to a session are published on that session's topic, so open tabs no
+longer need to poll ``fetch-messages``.
+
+An event is serialized once and the same frame is queued for every
+subscriber, so a broadcast costs one ``json.dumps`` plus one append per
+subscriber. Each client has a bounded queue drained by its own writer task;
+when a slow client's queue is full the oldest frame is dropped, or with the
+``disconnect`` policy the client is closed. ``send_sync`` may be called from
+any thread and hands the frame to the event loop.
+
+The hub does not know about aiohttp or Starlette: ``serve()`` takes the
+connection's send/close callables and an iterator of incoming text messages.
+
+A hub only reaches clients connected to its own process. With several
+workers (``main.py --prod --workers N``) set ``COPILOT_WS_RELAY=sqlite``:
+published frames are then also written to a shared SQLite table that every
+worker polls, so a message saved on one worker reaches subscribers on all
+of them.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from .log import get_logger
+from .metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+WS_CLIENTS = REGISTRY.gauge("copilot_ws_clients", "Connected WebSocket clients")
+WS_FRAMES = REGISTRY.counter("copilot_ws_frames_total", "Frames queued to WebSocket clients")
+WS_DROPPED = REGISTRY.counter(
+    "copilot_ws_frames_dropped_total", "Frames dropped or clients closed because a client fell behind", ("policy",))
+
+SLOW_CONSUMER_CLOSE_CODE = 1013  # "try again later"
+DEFAULT_DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db")
+
+
+def session_topic(session_id: str) -> str:
+    return f"session:{session_id}"
+
+
+def client_topic(client_id: str) -> str:
+    return f"client:{client_id}"
+
+
+def encode_event(event: str, data: Any) -> str:
+    return json.dumps({"type": event, "data": data}, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class Subscriber:
+    """One connected client: a bounded frame queue drained by a writer task."""
+
+    def __init__(
+        self,
+        client_id: str,
+        send_text: Callable[[str], Awaitable[Any]],
+        close: Callable[..., Awaitable[Any]],
+        max_queue: int = 256,
+        policy: str = "drop",
+    ):
+        self.client_id = client_id
+        self.topics: Set[str] = set()
+        self.max_queue = max_queue
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self.too_slow = False
+        self._send_text = send_text
+        self._close = close
+        self._queue: Deque[str] = deque()
+        self._wakeup = asyncio.Event()
+
+    def offer(self, frame: str) -> bool:
+        """Queue an encoded frame; never blocks. Returns False if the client is gone."""
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_queue:
+            WS_DROPPED.inc(policy=self.policy)
+            if self.policy == "disconnect":
+                self.closed = self.too_slow = True
+                self._wakeup.set()
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(frame)
+        WS_FRAMES.inc()
+        self._wakeup.set()
+        return True
+
+    async def send_json(self, data: Dict[str, Any]) -> None:
+        self.offer(json.dumps(data, ensure_ascii=False, default=str))
+
+    async def run_writer(self) -> None:
+        try:
+            while True:
+                while self._queue and not self.closed:
+                    await self._send_text(self._queue.popleft())
+                if self.closed:
+                    break
+                self._wakeup.clear()
+                await self._wakeup.wait()
+        except Exception:
+            pass  # The connection went away; the reader side cleans up
+        finally:
+            self.closed = True
+            try:
+                await self._close(code=SLOW_CONSUMER_CLOSE_CODE if self.too_slow else 1000)
+            except Exception:
+                pass
+
+    def stop(self) -> None:
+        self.closed = True
+        self._queue.clear()
+        self._wakeup.set()
+
+
+class SQLiteRelay:
+    """Carries published frames between worker processes through a shared SQLite table.
+
+    Frames are buffered and exchanged in batches: every ``poll_interval`` one
+    worker thread inserts this process's frames and reads the rows other
+    processes wrote since the last poll. Rows older than ``retention``
+    seconds are deleted.
+    """
+
+    PRUNE_EVERY = 50
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        poll_interval: float = 0.2,
+        retention: float = 60.0,
+        max_pending: int = 10000,
+    ):
+        self.path = path or os.path.join(DEFAULT_DB_DIR, "ws_relay.sqlite3")
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = uuid.uuid4().hex
+        self._pending: Deque[Tuple[Optional[str], str]] = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_id = 0
+        self._polls = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Only ever used by one thread at a time: exchanges are awaited one after another
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " origin TEXT NOT NULL,"
+            " topic TEXT,"
+            " frame TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        conn.commit()
+        # Start from the current end of the table rather than replaying old frames
+        self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        return conn
+
+    def send(self, topic: Optional[str], frame: str) -> None:
+        """Queue a frame for the other processes; safe from any thread."""
+        with self._lock:
+            self._pending.append((topic, frame))
+
+    def exchange(self) -> List[Tuple[Optional[str], str]]:
+        """Write queued frames and return the ones other processes wrote; blocking."""
+        if self._conn is None:
+            self._conn = self._connect()
+        with self._lock:
+            outgoing = list(self._pending)
+            self._pending.clear()
+        now = time.time()
+        with self._conn as conn:
+            if outgoing:
+                conn.executemany(
+                    "INSERT INTO events (origin, topic, frame, created_at) VALUES (?, ?, ?, ?)",
+                    [(self.origin, topic, frame, now) for topic, frame in outgoing],
+                )
+            rows = conn.execute(
+                "SELECT id, origin, topic, frame FROM events WHERE id > ? ORDER BY id", (self._last_id,)).fetchall()
+            self._polls += 1
+            if self._polls % self.PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM events WHERE created_at < ?", (now - self.retention,))
+        if rows:
+            self._last_id = rows[-1][0]
+        return [(topic, frame) for _, origin, topic, frame in rows if origin != self.origin]
+
+    async def run(self, deliver: Callable[[Optional[str], str], Any]) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                incoming = await asyncio.to_thread(self.exchange)
+            except Exception:
+                logger.exception("event relay exchange failed")
+                continue
+            for topic, frame in incoming:
+                deliver(topic, frame)
+
+    def close(self) -> None:
+        """Write what is still queued and close the connection; blocking."""
+        try:
+            self.exchange()
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class EventHub:
+    """Topic-based fan-out of events to WebSocket clients."""
+
+    def __init__(self, max_queue: int = 256, policy: str = "drop", relay: Optional[SQLiteRelay] = None):
+        self.max_queue = max_queue
+        self.policy = policy
+        self.relay = relay
+        self.clients: Dict[str, Subscriber] = {}
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._relay_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Bind the hub to the running loop and start relaying frames, if configured."""
+        self._loop = asyncio.get_running_loop()
+        if self.relay is not None and (self._relay_task is None or self._relay_task.done()):
+            self._relay_task = self._loop.create_task(self.relay.run(self._deliver))
+
+    async def close(self) -> None:
+        if self._relay_task is not None:
+            self._relay_task.cancel()
+            await asyncio.gather(self._relay_task, return_exceptions=True)
+            self._relay_task = None
+        if self.relay is not None:
+            await asyncio.to_thread(self.relay.close)
+
+    def subscribe(self, subscriber: Subscriber, topics: Iterable[str]) -> None:
+        for topic in topics:
+            self._topics.setdefault(topic, set()).add(subscriber)
+            subscriber.topics.add(topic)
+
+    def unsubscribe(self, subscriber: Subscriber, topics: Iterable[str]) -> None:
+        for topic in topics:
+            members = self._topics.get(topic)
+            if members is not None:
+                members.discard(subscriber)
+                if not members:
+                    del self._topics[topic]
+            subscriber.topics.discard(topic)
+
+    def subscribers(self, topic: Optional[str] = None) -> int:
+        return len(self.clients) if topic is None else len(self._topics.get(topic, ()))
+
+    def _deliver(self, topic: Optional[str], frame: str) -> int:
+        targets = self.clients.values() if topic is None else self._topics.get(topic, ())
+        delivered = 0
+        for subscriber in list(targets):
+            delivered += subscriber.offer(frame)
+        return delivered
+
+    def publish(self, topic: Optional[str], event: str, data: Any) -> int:
+        """Send an event to a topic (every client when None); must run on the loop."""
+        if self.relay is None and not self.subscribers(topic):
+            return 0
+        frame = encode_event(event, data)
+        if self.relay is not None:
+            self.relay.send(topic, frame)
+        return self._deliver(topic, frame)
+
+    def publish_threadsafe(self, topic: Optional[str], event: str, data: Any) -> None:
+        """``publish`` from any thread; the frame is encoded by the caller."""
+        loop = self._loop
+        local = loop is not None and not loop.is_closed() and self.subscribers(topic) > 0
+        if not local and self.relay is None:
+            return
+        frame = encode_event(event, data)
+        if self.relay is not None:
+            self.relay.send(topic, frame)
+        if not local:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(topic, frame)
+        else:
+            loop.call_soon_threadsafe(self._deliver, topic, frame)
+
+    async def serve(
+        self,
+        send_text: Callable[[str], Awaitable[Any]],
+        close: Callable[..., Awaitable[Any]],
+        incoming: AsyncIterator[str],
+        client_id: Optional[str] = None,
+        sessions: Iterable[str] = (),
+    ) -> None:
+        """Run one connection until the client goes away."""
+        self.start()
+        client_id = client_id or uuid.uuid4().hex
+        previous = self.clients.get(client_id)
+        if previous is not None:
+            # Same client id reconnected; the old connection stops receiving
+            self._detach(previous)
+        subscriber = Subscriber(client_id, send_text, close, self.max_queue, self.policy)
+        self.clients[client_id] = subscriber
+        WS_CLIENTS.set(len(self.clients))
+        self.subscribe(subscriber, [client_topic(client_id)] + [session_topic(s) for s in sessions if s])
+        subscriber.offer(encode_event("status", {"sid": client_id}))
+        writer = asyncio.ensure_future(subscriber.run_writer())
+        try:
+            async for text in incoming:
+                if subscriber.closed:
+                    break
+                self._handle(subscriber, text)
+        finally:
+            self._detach(subscriber)
+            # The client is gone, so there is nobody to flush to; don't wait on a stuck send
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+
+    def _handle(self, subscriber: Subscriber, text: str) -> None:
+        try:
+            message = json.loads(text)
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        for key, action in (("subscribe", self.subscribe), ("unsubscribe", self.unsubscribe)):
+            sessions = message.get(key)
+            if isinstance(sessions, list):
+                action(subscriber, [session_topic(str(s)) for s in sessions])
+        if message.get("type") == "ping":
+            subscriber.offer(encode_event("pong", {}))
+
+    def _detach(self, subscriber: Subscriber) -> None:
+        self.unsubscribe(subscriber, list(subscriber.topics))
+        if self.clients.get(subscriber.client_id) is subscriber:
+            del self.clients[subscriber.client_id]
+        WS_CLIENTS.set(len(self.clients))
+        subscriber.stop()
+
+
+_event_hub: Optional[EventHub] = None
+
+
+def get_event_hub() -> EventHub:
+    global _event_hub
+    if _event_hub is None:
+        relay = None
+        backend = os.getenv("COPILOT_WS_RELAY", "").lower()
+        if backend == "sqlite":
+            relay = SQLiteRelay(
+                os.getenv("COPILOT_WS_RELAY_DB"),
+                poll_interval=float(os.getenv("COPILOT_WS_RELAY_INTERVAL", 0.2)),
+            )
+        elif backend not in ("", "none"):
+            raise ValueError(f"Unknown WebSocket relay backend: {backend}")
+        _event_hub = EventHub(
+            max_queue=int(os.getenv("COPILOT_WS_QUEUE_SIZE", 256)),
+            policy=os.getenv("COPILOT_WS_SLOW_CLIENT_POLICY", "drop"),
+            relay=relay,
+        )
+    return _event_hub
+
+
+async def websocket_handler(request):
+    """aiohttp WebSocket endpoint for the hub."""
+    from aiohttp import WSMsgType, web
+
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+
+    async def incoming():
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT:
+                yield msg.data
+            elif msg.type in (WSMsgType.ERROR, WSMsgType.CLOSE):
+                break
+
+    sessions = request.query.get("session_id", "").split(",")
+    await get_event_hub().serve(ws.send_str, ws.close, incoming(), request.query.get("clientId"), sessions)
+    return ws
@@ -0,0 +1,182 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Batched ingestion of UI analytics events (``/api/chat/track_event``).
+
+The request path only validates events and appends them to a bounded
+in-memory ring buffer; when the buffer is full the oldest events are dropped
+and counted. A background task swaps the buffer out every few seconds and
+appends the batch to an NDJSON file in a worker thread, rotating the file
+once it grows past a size limit and keeping a fixed number of old files.
+Whatever is still buffered is flushed on shutdown (``close()``, or at
+interpreter exit when running inside ComfyUI).
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .log import get_logger
+from .metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+EVENTS_RECEIVED = REGISTRY.counter("copilot_events_received_total", "Analytics events accepted into the buffer")
+EVENTS_DROPPED = REGISTRY.counter(
+    "copilot_events_dropped_total", "Analytics events dropped, by reason", ("reason",))
+EVENTS_WRITTEN = REGISTRY.counter("copilot_events_written_total", "Analytics events written to disk")
+EVENTS_QUEUE_DEPTH = REGISTRY.gauge("copilot_events_queue_depth", "Analytics events waiting to be flushed")
+
+DEFAULT_EVENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db", "events")
+EVENTS_FILE = "events.ndjson"
+
+
+class EventIngest:
+    """Ring buffer of events with periodic, rotating NDJSON flushes."""
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_EVENTS_DIR,
+        capacity: int = 10000,
+        flush_interval: float = 2.0,
+        max_file_bytes: int = 64 * 1024 * 1024,
+        backups: int = 10,
+        max_batch: int = 500,
+    ):
+        self.directory = directory
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_file_bytes = max_file_bytes
+        self.backups = backups
+        self.max_batch = max_batch
+        self.dropped = 0
+        self.written = 0
+        self._buffer: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        # Only one flush writes to the file at a time
+        self._write_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        atexit.register(self.flush)
+
+    def submit(self, events: List[Any]) -> Tuple[int, int]:
+        """Buffer events without touching disk; returns (accepted, rejected)."""
+        received_at = time.time()
+        accepted = []
+        for event in events[:self.max_batch]:
+            if isinstance(event, dict) and isinstance(event.get("event_type"), str):
+                accepted.append({**event, "received_at": received_at})
+        over_batch = max(0, len(events) - self.max_batch)
+        rejected = len(events) - len(accepted)
+        with self._lock:
+            overflow = max(0, len(self._buffer) + len(accepted) - self.capacity)
+            self._buffer.extend(accepted)
+            depth = len(self._buffer)
+        self.dropped += overflow
+        EVENTS_RECEIVED.inc(len(accepted))
+        if overflow:
+            EVENTS_DROPPED.inc(overflow, reason="overflow")
+        if over_batch:
+            EVENTS_DROPPED.inc(over_batch, reason="batch_limit")
+        if rejected > over_batch:
+            EVENTS_DROPPED.inc(rejected - over_batch, reason="invalid")
+        EVENTS_QUEUE_DEPTH.set(depth)
+        self._ensure_flusher()
+        return len(accepted), rejected
+
+    def _ensure_flusher(self) -> None:
+        if (self._task is not None and not self._task.done()) or self._closed:
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        except RuntimeError:
+            pass  # No loop in this thread; events are flushed at close/exit
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("analytics flush failed")
+
+    def _take(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            batch = list(self._buffer)
+            self._buffer.clear()
+        EVENTS_QUEUE_DEPTH.set(0)
+        return batch
+
+    def flush(self) -> int:
+        """Write everything buffered so far; blocking, so call it off the event loop."""
+        with self._write_lock:
+            batch = self._take()
+            if not batch:
+                return 0
+            data = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in batch).encode("utf-8")
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, EVENTS_FILE)
+            # One O_APPEND write per batch, so batches from several workers don't interleave
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            if size >= self.max_file_bytes:
+                self._rotate(path)
+        self.written += len(batch)
+        EVENTS_WRITTEN.inc(len(batch))
+        return len(batch)
+
+    def _rotate(self, path: str) -> None:
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+        try:
+            os.replace(path, os.path.join(self.directory, f"events-{stamp}-{os.getpid()}.ndjson"))
+        except FileNotFoundError:
+            return  # Another worker rotated it first
+        rotated = sorted(
+            name for name in os.listdir(self.directory) if name.startswith("events-") and name.endswith(".ndjson"))
+        for name in rotated[:max(0, len(rotated) - self.backups)]:
+            os.remove(os.path.join(self.directory, name))
+
+    async def close(self) -> None:
+        """Stop the periodic flush and write what is left."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._buffer),
+            "capacity": self.capacity,
+            "dropped": self.dropped,
+            "written": self.written,
+        }
+
+
+_event_ingest: Optional[EventIngest] = None
+
+
+def get_event_ingest() -> EventIngest:
+    global _event_ingest
+    if _event_ingest is None:
+        _event_ingest = EventIngest(
+            directory=os.getenv("COPILOT_EVENTS_DIR") or DEFAULT_EVENTS_DIR,
+            capacity=int(os.getenv("COPILOT_EVENTS_BUFFER", 10000)),
+            flush_interval=float(os.getenv("COPILOT_EVENTS_FLUSH_INTERVAL", 2.0)),
+            max_file_bytes=int(os.getenv("COPILOT_EVENTS_MAX_FILE_BYTES", 64 * 1024 * 1024)),
+            backups=int(os.getenv("COPILOT_EVENTS_BACKUPS", 10)),
+            max_batch=int(os.getenv("COPILOT_EVENTS_MAX_BATCH", 500)),
+        )
+    return _event_ingest
@@ -0,0 +1,254 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Git metadata for installed custom node packs, read straight from disk.
+
+Instead of spawning ``git`` once per pack, ``read_git_info`` parses
+``.git/HEAD``, loose refs, ``packed-refs`` and ``.git/config`` directly. Packs
+are scanned in a thread pool and results are cached by the mtimes of the files
+involved, so a rescan only re-reads packs that changed. ``GitIndex`` maps node
+class names to packs once and answers lookups from memory.
+"""
+
+import configparser
+import inspect
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, TypedDict
+
+
+class GitInfo(TypedDict):
+    pack: str
+    gitRepo: Optional[str]
+    commitHash: Optional[str]
+    branch: Optional[str]
+    url: Optional[str]
+
+
+_GITHUB_RE = re.compile(r"(?:github\.com[:/])([^/]+/[^/]+?)(?:\.git)?/?$")
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0.0
+
+
+def find_git_dir(pack_dir: str) -> Optional[str]:
+    """Return the git directory of a pack, following ``gitdir:`` files."""
+    dot_git = os.path.join(pack_dir, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git
+    content = _read_text(dot_git)
+    if content and content.startswith("gitdir:"):
+        git_dir = content[len("gitdir:"):].strip()
+        return os.path.normpath(os.path.join(pack_dir, git_dir))
+    return None
+
+
+def _common_dir(git_dir: str) -> str:
+    # Worktrees keep refs and config in the directory named by "commondir".
+    common = _read_text(os.path.join(git_dir, "commondir"))
+    if common:
+        return os.path.normpath(os.path.join(git_dir, common.strip()))
+    return git_dir
+
+
+def _resolve_ref(git_dir: str, ref: str) -> Optional[str]:
+    common = _common_dir(git_dir)
+    for base in (git_dir, common):
+        loose = _read_text(os.path.join(base, *ref.split("/")))
+        if loose:
+            return loose.strip()
+    packed = _read_text(os.path.join(common, "packed-refs"))
+    if packed:
+        for line in packed.splitlines():
+            if line.startswith(("#", "^")):
+                continue
+            parts = line.split(" ", 1)
+            if len(parts) == 2 and parts[1].strip() == ref:
+                return parts[0]
+    return None
+
+
+def _remote_url(git_dir: str) -> Optional[str]:
+    content = _read_text(os.path.join(_common_dir(git_dir), "config"))
+    if not content:
+        return None
+    parser = configparser.RawConfigParser(strict=False)
+    try:
+        parser.read_string(content)
+    except configparser.Error:
+        return None
+    sections = [s for s in parser.sections() if s.startswith("remote ")]
+    sections.sort(key=lambda s: s != 'remote "origin"')
+    for section in sections:
+        if parser.has_option(section, "url"):
+            return parser.get(section, "url").strip()
+    return None
+
+
+def read_git_info(pack_dir: str) -> Optional[GitInfo]:
+    """Read the checked-out commit and origin of a pack without running git."""
+    git_dir = find_git_dir(pack_dir)
+    if git_dir is None:
+        return None
+    head = _read_text(os.path.join(git_dir, "HEAD"))
+    if not head:
+        return None
+    head = head.strip()
+    branch = None
+    if head.startswith("ref:"):
+        ref = head[4:].strip()
+        branch = ref.rsplit("/", 1)[-1] if ref.startswith("refs/heads/") else ref
+        commit = _resolve_ref(git_dir, ref)
+    else:
+        commit = head
+
+    remote = _remote_url(git_dir)
+    repo = None
+    url = remote
+    if remote:
+        match = _GITHUB_RE.search(remote)
+        if match:
+            repo = match.group(1)
+            url = f"https://github.com/{repo}"
+    return GitInfo(
+        pack=os.path.basename(os.path.normpath(pack_dir)),
+        gitRepo=repo,
+        commitHash=commit,
+        branch=branch,
+        url=url,
+    )
+
+
+def _cache_key(pack_dir: str) -> Tuple[float, ...]:
+    git_dir = find_git_dir(pack_dir)
+    if git_dir is None:
+        return (_mtime(pack_dir),)
+    common = _common_dir(git_dir)
+    return (
+        _mtime(pack_dir),
+        _mtime(os.path.join(git_dir, "HEAD")),
+        _mtime(os.path.join(common, "packed-refs")),
+        _mtime(os.path.join(common, "refs", "heads")),
+        _mtime(os.path.join(common, "config")),
+    )
+
+
+class GitScanner:
+    """Scans a ``custom_nodes`` directory, re-reading only packs whose files changed."""
+
+    def __init__(self, max_workers: int = 16):
+        self.max_workers = max_workers
+        self._cache: Dict[str, Tuple[Tuple[float, ...], Optional[GitInfo]]] = {}
+
+    def _scan_one(self, pack_dir: str) -> Tuple[str, Optional[GitInfo]]:
+        key = _cache_key(pack_dir)
+        cached = self._cache.get(pack_dir)
+        if cached is not None and cached[0] == key:
+            return pack_dir, cached[1]
+        info = read_git_info(pack_dir)
+        self._cache[pack_dir] = (key, info)
+        return pack_dir, info
+
+    def scan(self, roots: Iterable[str]) -> Dict[str, Optional[GitInfo]]:
+        """Return git info for every pack directory under the given roots."""
+        pack_dirs = []
+        for root in roots:
+            if not os.path.isdir(root):
+                continue
+            for entry in os.scandir(root):
+                if entry.is_dir() and not entry.name.startswith((".", "__")):
+                    pack_dirs.append(entry.path)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = dict(pool.map(self._scan_one, pack_dirs))
+        for stale in set(self._cache) - set(results):
+            del self._cache[stale]
+        return results
+
+
+def _pack_dir_for(node_class: Any, roots: List[str]) -> Optional[str]:
+    """Find the custom node pack directory that defines a node class."""
+    module = getattr(node_class, "RELATIVE_PYTHON_MODULE", None)
+    if isinstance(module, str) and module.startswith("custom_nodes."):
+        name = module.split(".")[1]
+        for root in roots:
+            candidate = os.path.join(root, name)
+            if os.path.isdir(candidate):
+                return candidate
+    try:
+        path = os.path.abspath(inspect.getfile(node_class))
+    except (TypeError, OSError):
+        module_obj = sys.modules.get(getattr(node_class, "__module__", ""))
+        path = getattr(module_obj, "__file__", None)
+        if not path:
+            return None
+        path = os.path.abspath(path)
+    for root in roots:
+        root = os.path.abspath(root)
+        if path.startswith(root + os.sep):
+            return os.path.join(root, os.path.relpath(path, root).split(os.sep)[0])
+    return None
+
+
+class GitIndex:
+    """In-memory index from node class name to the git info of its pack."""
+
+    def __init__(self, scanner: Optional[GitScanner] = None, min_refresh_interval: float = 30.0):
+        self.scanner = scanner or GitScanner()
+        self.min_refresh_interval = min_refresh_interval
+        self._node_to_pack: Dict[str, str] = {}
+        self._packs: Dict[str, Optional[GitInfo]] = {}
+        self._mapped_count = -1
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._last_refresh > 0
+
+    def refresh(self, roots: List[str], node_classes: Mapping[str, Any], force: bool = False) -> None:
+        """Rescan packs and, if the set of node classes changed, rebuild the class map."""
+        if not force and time.monotonic() - self._last_refresh < self.min_refresh_interval:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._last_refresh < self.min_refresh_interval:
+                return
+            packs = self.scanner.scan(roots)
+            if len(node_classes) != self._mapped_count:
+                node_to_pack = {}
+                for name, node_class in list(node_classes.items()):
+                    pack_dir = _pack_dir_for(node_class, roots)
+                    if pack_dir is not None:
+                        node_to_pack[name] = pack_dir
+                self._node_to_pack = node_to_pack
+                self._mapped_count = len(node_classes)
+            self._packs = packs
+            self._last_refresh = time.monotonic()
+
+    def lookup(self, node_type: str) -> Optional[GitInfo]:
+        pack_dir = self._node_to_pack.get(node_type)
+        if pack_dir is None:
+            return None
+        return self._packs.get(pack_dir)
+
+    def contains(self, node_type: str) -> bool:
+        return node_type in self._node_to_pack
+
+    def packs(self) -> Dict[str, Optional[GitInfo]]:
+        return dict(self._packs)
@@ -0,0 +1,45 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Process lifecycle helpers: startup warmup.
+
+Draining on shutdown is left to uvicorn: ``main.py --prod`` sets
+``timeout_graceful_shutdown``, so uvicorn stops accepting connections and
+waits that long for in-flight requests, chat streams included, before it
+cancels them and runs the lifespan shutdown.
+"""
+
+import asyncio
+import time
+
+
+async def warmup() -> dict:
+    """Load catalogs, registries and caches before the server accepts traffic."""
+    from .builtin_registry import BUILTIN_REGISTRY
+    from .blob_cache import get_blob_cache
+    from .conversation_service import session_store
+    from .model_hashes import get_model_hash_index, start_model_scan
+    from .node_service import get_node_resolver, load_node_search_index, refresh_git_index, start_git_index_refresh
+    from .template_catalog import get_template_catalog
+
+    started = time.perf_counter()
+    catalog = get_template_catalog()
+    await asyncio.to_thread(catalog.refresh, True)
+    git_index = await refresh_git_index(force=True)
+    start_git_index_refresh()
+    get_node_resolver()
+    await asyncio.to_thread(get_blob_cache)
+    search_index = await asyncio.to_thread(load_node_search_index)
+    # Hashing new model files can take minutes, so that scan is left running in the background
+    model_hashes = await asyncio.to_thread(get_model_hash_index)
+    start_model_scan()
+    return {
+        "templates": len(catalog.list()),
+        "builtin_node_types": len(BUILTIN_REGISTRY),
+        "custom_node_packs": len(git_index.packs()),
+        "searchable_nodes": len(search_index),
+        "indexed_models": len(model_hashes.files()),
+        "session_store": type(session_store).__name__,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
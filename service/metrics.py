@@ -0,0 +1,305 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Lightweight request instrumentation with Prometheus text exposition.
+
+Counters, gauges and histograms live in a process-wide ``REGISTRY``.
+``MetricsMiddleware`` instruments the FastAPI app at the ASGI level (so
+streaming responses report time to first chunk and their full size), and
+``instrument_handler`` does the same for handlers served by the aiohttp shim.
+Values are per process; with several workers each one reports its own series.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # one slot per bucket, then +Inf, sum and count
+                series = self._series[key] = [0.0] * (len(self.buckets) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return int(series[-1]) if series else 0
+
+    def _samples(self):
+        for key, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for bound, hits in zip(self.buckets + (float("inf"),), series):
+                cumulative += hits
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(series[-2])}"
+            yield f"{self.name}_count{labels} {_format_value(series[-1])}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.setdefault(metric.name, metric)
+        return self._metrics[metric.name]
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def expose(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "copilot_http_request_duration_seconds", "Time until the response body finished",
+    ("server", "method", "route", "status"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "copilot_http_requests_in_flight", "Requests currently being handled", ("server", "route"))
+REQUEST_BYTES = REGISTRY.counter(
+    "copilot_http_request_bytes_total", "Request body bytes received", ("server", "route"))
+RESPONSE_BYTES = REGISTRY.counter(
+    "copilot_http_response_bytes_total", "Response body bytes sent", ("server", "route"))
+RESPONSE_SIZE = REGISTRY.histogram(
+    "copilot_http_response_size_bytes", "Response body size", ("server", "route"), SIZE_BUCKETS)
+TIME_TO_FIRST_CHUNK = REGISTRY.histogram(
+    "copilot_http_time_to_first_chunk_seconds", "Time until the first body chunk was sent",
+    ("server", "route"))
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _route_template(scope: dict) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    # Unmatched paths share one label so arbitrary URLs cannot explode cardinality.
+    return path or "unmatched"
+
+
+RouteTemplate = Tuple[Optional[Iterable[str]], str]  # (methods, or None for any; path template)
+
+
+class RouteTemplates:
+    """Resolves a request method and path to the full template of the route that serves it.
+
+    ``templates`` returns the app's ``(methods, path)`` routes, router prefixes
+    included, in matching order; it is called on first use. A path whose
+    method no route accepts (a 405) gets the first template matching the path.
+    Resolved requests are cached.
+    """
+
+    def __init__(self, templates: Callable[[], Iterable[RouteTemplate]], cache_size: int = 4096):
+        self._templates = templates
+        self._compiled: Optional[List[Tuple[Optional[frozenset], object, str]]] = None
+        self._cache: Dict[Tuple[str, str], str] = {}
+        self.cache_size = cache_size
+
+    def resolve(self, method: str, path: str) -> str:
+        key = (method, path)
+        template = self._cache.get(key)
+        if template is not None:
+            return template
+        if self._compiled is None:
+            from starlette.routing import compile_path
+
+            self._compiled = [
+                (frozenset(m.upper() for m in methods) if methods is not None else None, compile_path(t)[0], t)
+                for methods, t in self._templates()
+            ]
+        matches = [(methods, t) for methods, regex, t in self._compiled if regex.match(path)]
+        template = next((t for methods, t in matches if methods is None or method in methods), None)
+        if template is None:
+            template = matches[0][1] if matches else "unmatched"
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[key] = template
+        return template
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests, sizes and first-chunk time."""
+
+    def __init__(self, app, server: str = "fastapi", routes: Optional[Callable[[], Iterable[RouteTemplate]]] = None):
+        self.app = app
+        self.server = server
+        # Resolving up front labels in-flight requests by route; without a
+        # table, the route is only known once the app has handled the request
+        self.routes = RouteTemplates(routes) if routes is not None else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        state = {"status": "500", "first_chunk": None, "bytes": 0, "received": 0}
+        route = self.routes.resolve(scope["method"], scope["path"]) if self.routes is not None else None
+        in_flight_route = route or "all"
+        REQUESTS_IN_FLIGHT.inc(server=self.server, route=in_flight_route)
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+            return message
+
+        async def timing_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = str(message["status"])
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                if body and state["first_chunk"] is None:
+                    state["first_chunk"] = time.perf_counter() - started
+                state["bytes"] += len(body)
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, timing_send)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(server=self.server, route=in_flight_route)
+            route = route or _route_template(scope)
+            labels = {"server": self.server, "route": route}
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - started, method=scope["method"], status=state["status"], **labels)
+            REQUEST_BYTES.inc(state["received"], **labels)
+            RESPONSE_BYTES.inc(state["bytes"], **labels)
+            RESPONSE_SIZE.observe(state["bytes"], **labels)
+            if state["first_chunk"] is not None:
+                TIME_TO_FIRST_CHUNK.observe(state["first_chunk"], **labels)
+
+
+def instrument_handler(handler: Callable, route: str, method: str, server: str = "aiohttp") -> Callable:
+    """Wrap an aiohttp handler with the same metrics as ``MetricsMiddleware``."""
+    labels = {"server": server, "route": route}
+
+    async def wrapper(request):
+        started = time.perf_counter()
+        status = "500"
+        response = None
+        REQUESTS_IN_FLIGHT.inc(**labels)
+        try:
+            response = await handler(request)
+            status = str(response.status)
+            return response
+        except Exception as e:
+            status = str(getattr(e, "status", 500))
+            raise
+        finally:
+            REQUESTS_IN_FLIGHT.dec(**labels)
+            REQUEST_LATENCY.observe(time.perf_counter() - started, method=method, status=status, **labels)
+            if request.content_length:
+                REQUEST_BYTES.inc(request.content_length, **labels)
+            # Streamed responses have written their whole body by the time the handler returns
+            sent = getattr(response, "body_length", 0) or 0
+            RESPONSE_BYTES.inc(sent, **labels)
+            RESPONSE_SIZE.observe(sent, **labels)
+
+    wrapper.__name__ = getattr(handler, "__name__", "handler")
+    return wrapper
+
+
+def observe_first_chunk(route: str, seconds: float, server: str = "aiohttp") -> None:
+    """Record time to first chunk for a streaming handler that measures it itself."""
+    TIME_TO_FIRST_CHUNK.observe(seconds, server=server, route=route)
@@ -0,0 +1,414 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+SHA-256 index of the model files in ComfyUI's model folders.
+
+The UI identifies models on Civitai by file hash. Hashing a multi-GB
+checkpoint takes seconds, so the server keeps an index instead:
+
+* the model folders come from ``folder_paths`` (or ``COPILOT_MODEL_DIRS``
+  outside ComfyUI) and are walked with ``os.scandir``;
+* results are stored in SQLite keyed by path together with size and mtime,
+  so a rescan only hashes files that are new or changed;
+* files are hashed through ``mmap`` in large chunks on a worker pool. The
+  default pool is threads, since ``hashlib`` releases the GIL while hashing;
+  ``COPILOT_MODEL_HASH_POOL=process`` uses a spawned process pool instead;
+* lookups by full SHA-256 or by its 10-character AutoV2 prefix are answered
+  from in-memory dicts.
+
+Scans run in the background; each hashed file is committed as soon as it is
+done, so an interrupted scan keeps its progress.
+"""
+
+import asyncio
+import hashlib
+import mmap
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, TypedDict
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db")
+MODEL_EXTENSIONS = frozenset((".safetensors", ".sft", ".ckpt", ".pt", ".pth", ".bin", ".pkl", ".gguf", ".onnx"))
+# Folders that hold configs or code rather than model files
+SKIPPED_FOLDERS = frozenset(("custom_nodes", "configs"))
+AUTOV2_LENGTH = 10
+
+
+class ModelFile(TypedDict):
+    path: str
+    folder: str
+    name: str
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+def hash_file(path: str, chunk_size: int = 16 * 1024 * 1024) -> str:
+    """SHA-256 of a file, read through a memory map in ``chunk_size`` slices."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for start in range(0, len(view), chunk_size):
+                    digest.update(view[start:start + chunk_size])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def get_model_roots() -> Dict[str, Tuple[List[str], Set[str]]]:
+    """Model folder name -> (directories, file extensions) to index."""
+    configured = os.getenv("COPILOT_MODEL_DIRS")
+    if configured:
+        return {os.path.basename(os.path.normpath(d)): ([d], set(MODEL_EXTENSIONS))
+                for d in configured.split(os.pathsep) if d}
+    try:
+        import folder_paths
+        folders = folder_paths.folder_names_and_paths
+    except (ImportError, AttributeError):
+        return {}
+    roots = {}
+    for name, (paths, extensions) in folders.items():
+        if name in SKIPPED_FOLDERS:
+            continue
+        wanted = {e.lower() for e in extensions if e} or set(MODEL_EXTENSIONS)
+        roots[name] = (list(paths), wanted)
+    return roots
+
+
+def iter_model_files(directory: str, extensions: Set[str]) -> Iterable[Tuple[str, os.stat_result]]:
+    """Model files under ``directory``; symlinks are followed, but each directory is walked once."""
+    stack = [directory]
+    visited: Set[Tuple[int, int]] = set()
+    while stack:
+        current = stack.pop()
+        try:
+            # os.stat rather than DirEntry.stat, which leaves st_ino at 0 on Windows
+            stat = os.stat(current)
+            if (stat.st_dev, stat.st_ino) in visited:
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=True):
+                            stack.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in extensions:
+                            yield entry.path, entry.stat(follow_symlinks=True)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+class _ScanLock:
+    """Exclusive lock on a file, held by one process at a time."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.name == "nt":
+                import msvcrt
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            os.close(fd)
+                            return False
+                        # LK_LOCK gives up after 10 seconds; keep waiting
+            else:
+                import fcntl
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    return False
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        try:
+            if os.name == "nt":
+                import msvcrt
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class ModelHashIndex:
+    """SQLite-backed hash index with in-memory lookups."""
+
+    def __init__(self, path: Optional[str] = None, workers: int = 4, pool: str = "thread"):
+        self.path = path or os.path.join(DEFAULT_DB_DIR, "model_hashes.sqlite3")
+        self.workers = workers
+        self.pool = pool
+        self.scanning = False
+        self.last_scan: Optional[Dict[str, Any]] = None
+        self._files: Dict[str, ModelFile] = {}
+        self._by_hash: Dict[str, Set[str]] = {}
+        self._by_autov2: Dict[str, Set[str]] = {}
+        self._scan_lock = threading.Lock()
+        # Guards the lookup dicts, which the scan thread updates while requests read them
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS model_hashes ("
+            " path TEXT PRIMARY KEY,"
+            " folder TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " hashed_at REAL NOT NULL)"
+        )
+        conn.commit()
+        self._load()
+
+    def _load(self) -> None:
+        """Replace the lookup dicts with the rows in SQLite, which other workers may have added."""
+        files: Dict[str, ModelFile] = {}
+        by_hash: Dict[str, Set[str]] = {}
+        by_autov2: Dict[str, Set[str]] = {}
+        for row in self._conn().execute("SELECT path, folder, size, mtime_ns, sha256 FROM model_hashes"):
+            files[row[0]] = ModelFile(path=row[0], folder=row[1], name=os.path.basename(row[0]),
+                                      size=row[2], mtime_ns=row[3], sha256=row[4])
+            by_hash.setdefault(row[4], set()).add(row[0])
+            by_autov2.setdefault(row[4][:AUTOV2_LENGTH], set()).add(row[4])
+        with self._lock:
+            self._files, self._by_hash, self._by_autov2 = files, by_hash, by_autov2
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def _add(self, entry: ModelFile) -> None:
+        with self._lock:
+            self._discard(entry["path"])
+            self._files[entry["path"]] = entry
+            self._by_hash.setdefault(entry["sha256"], set()).add(entry["path"])
+            self._by_autov2.setdefault(entry["sha256"][:AUTOV2_LENGTH], set()).add(entry["sha256"])
+
+    def _remove(self, path: str) -> None:
+        with self._lock:
+            self._discard(path)
+
+    def _discard(self, path: str) -> None:
+        old = self._files.pop(path, None)
+        if old is None:
+            return
+        paths = self._by_hash.get(old["sha256"])
+        if paths is not None:
+            paths.discard(path)
+            if not paths:
+                del self._by_hash[old["sha256"]]
+                prefix = old["sha256"][:AUTOV2_LENGTH]
+                self._by_autov2[prefix].discard(old["sha256"])
+                if not self._by_autov2[prefix]:
+                    del self._by_autov2[prefix]
+
+    def _executor(self) -> Executor:
+        if self.pool == "process":
+            # Spawned, not forked: the server process has threads of its own
+            return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return ThreadPoolExecutor(self.workers, thread_name_prefix="model-hash")
+
+    def scan(self, roots: Dict[str, Tuple[List[str], Set[str]]]) -> Optional[Dict[str, Any]]:
+        """Bring the index in line with the files on disk; None if a scan is already running.
+
+        Worker processes share the database, and a lock file next to it lets
+        only one of them scan at a time. A worker that finds another one
+        scanning waits for it and loads its results instead of walking the
+        folders again.
+        """
+        if not self._scan_lock.acquire(blocking=False):
+            return None
+        self.scanning = True
+        started = time.perf_counter()
+        file_lock = _ScanLock(self.path + ".scan.lock")
+        try:
+            if not file_lock.acquire(blocking=False):
+                file_lock.acquire()
+                file_lock.release()
+                self._load()
+                self.last_scan = {
+                    "files": len(self._files),
+                    "scanned_by": "another worker",
+                    "seconds": round(time.perf_counter() - started, 3),
+                    "finished_at": time.time(),
+                }
+                return self.last_scan
+            try:
+                return self._scan(roots, started)
+            finally:
+                file_lock.release()
+        finally:
+            self.scanning = False
+            self._scan_lock.release()
+
+    def _scan(self, roots: Dict[str, Tuple[List[str], Set[str]]], started: float) -> Dict[str, Any]:
+        self._load()
+        seen: Dict[str, Tuple[str, os.stat_result]] = {}
+        for folder, (directories, extensions) in roots.items():
+            for directory in directories:
+                for path, stat in iter_model_files(directory, extensions):
+                    seen.setdefault(os.path.abspath(path), (folder, stat))
+
+        changed = [
+            (path, folder, stat) for path, (folder, stat) in seen.items()
+            if (path not in self._files
+                or self._files[path]["size"] != stat.st_size
+                or self._files[path]["mtime_ns"] != stat.st_mtime_ns)
+        ]
+        removed = [path for path in self._files if path not in seen]
+        conn = self._conn()
+        with conn:
+            conn.executemany("DELETE FROM model_hashes WHERE path = ?", [(p,) for p in removed])
+        for path in removed:
+            self._remove(path)
+
+        hashed_bytes = failed = 0
+        if changed:
+            with self._executor() as pool:
+                futures = {pool.submit(hash_file, path): (path, folder, stat) for path, folder, stat in changed}
+                for future in as_completed(futures):
+                    path, folder, stat = futures[future]
+                    try:
+                        sha256 = future.result()
+                    except OSError as e:
+                        failed += 1
+                        logger.warning("model hash failed", extra={"fields": {"path": path, "error": str(e)}})
+                        continue
+                    entry = ModelFile(path=path, folder=folder, name=os.path.basename(path),
+                                      size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=sha256)
+                    with conn:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO model_hashes"
+                            " (path, folder, size, mtime_ns, sha256, hashed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                            (path, folder, stat.st_size, stat.st_mtime_ns, sha256, time.time()),
+                        )
+                    self._add(entry)
+                    hashed_bytes += stat.st_size
+        self.last_scan = {
+            "files": len(self._files),
+            "hashed": len(changed) - failed,
+            "failed": failed,
+            "removed": len(removed),
+            "hashed_bytes": hashed_bytes,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": time.time(),
+        }
+        return self.last_scan
+
+    def lookup(self, sha256: str) -> List[ModelFile]:
+        """Files with this SHA-256, or with a SHA-256 starting with this AutoV2 hash."""
+        sha256 = sha256.lower()
+        with self._lock:
+            hashes = sorted(self._by_autov2.get(sha256, ())) if len(sha256) == AUTOV2_LENGTH else [sha256]
+            return [self._files[p] for h in hashes for p in sorted(self._by_hash.get(h, ()))]
+
+    def files(self, folder: Optional[str] = None) -> List[ModelFile]:
+        with self._lock:
+            return [e for e in self._files.values() if folder is None or e["folder"] == folder]
+
+    def status(self) -> Dict[str, Any]:
+        return {"files": len(self._files), "scanning": self.scanning, "last_scan": self.last_scan}
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+_model_hash_index: Optional[ModelHashIndex] = None
+_scan_task: Optional[asyncio.Task] = None
+
+
+def get_model_hash_index() -> ModelHashIndex:
+    global _model_hash_index
+    if _model_hash_index is None:
+        _model_hash_index = ModelHashIndex(
+            os.getenv("COPILOT_MODEL_HASH_DB"),
+            workers=int(os.getenv("COPILOT_MODEL_HASH_WORKERS", 4)),
+            pool=os.getenv("COPILOT_MODEL_HASH_POOL", "thread").lower(),
+        )
+    return _model_hash_index
+
+
+def start_model_scan() -> bool:
+    """Rescan the model folders in the background; False if a scan is already running."""
+    global _scan_task
+    if _scan_task is not None and not _scan_task.done():
+        return False
+    index = get_model_hash_index()
+
+    async def run():
+        try:
+            stats = await asyncio.to_thread(index.scan, get_model_roots())
+            if stats is not None:
+                logger.info("model hash scan complete", extra={"fields": stats})
+        except Exception:
+            logger.exception("model hash scan failed")
+
+    _scan_task = asyncio.ensure_future(run())
+    return True
+
+
+def _is_hex(value: str) -> bool:
+    return all(c in "0123456789abcdefABCDEF" for c in value)
+
+
+async def get_model_by_hash(sha256: str):
+    """Model files with a SHA-256 (64 hex chars) or AutoV2 hash (10 hex chars)."""
+    if len(sha256) not in (64, AUTOV2_LENGTH) or not _is_hex(sha256):
+        return {"error": "Expected a SHA-256 or AutoV2 hex hash"}, 400
+    index = get_model_hash_index()
+    if index.last_scan is None:
+        start_model_scan()
+    files = index.lookup(sha256)
+    if not files:
+        return {"error": f"No model with hash {sha256}", "scanning": index.scanning}, 404
+    return {"sha256": files[0]["sha256"], "files": files}, 200
+
+
+async def list_model_hashes(folder: Optional[str] = None):
+    index = get_model_hash_index()
+    if index.last_scan is None:
+        start_model_scan()
+    return {**index.status(), "models": index.files(folder)}, 200
+
+
+async def rescan_models():
+    started = start_model_scan()
+    return {"started": started, **get_model_hash_index().status()}, 202
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+from typing import Optional
+from .model_hashes import get_model_by_hash, list_model_hashes, rescan_models
+
+router = APIRouter()
+
+@router.get("/hash/{sha256}")
+async def model_by_hash(sha256: str):
+    """Installed model files with a SHA-256 or AutoV2 hash, from the hash index."""
+    payload, status = await get_model_by_hash(sha256)
+    return JSONResponse(status_code=status, content=payload)
+
+@router.get("/hashes")
+async def model_hashes(folder: Optional[str] = Query(None, description="Only this model folder, e.g. loras")):
+    payload, status = await list_model_hashes(folder)
+    return JSONResponse(status_code=status, content=payload)
+
+@router.post("/rescan")
+async def rescan():
+    payload, status = await rescan_models()
+    return JSONResponse(status_code=status, content=payload)
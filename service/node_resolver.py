@@ -0,0 +1,151 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Batch resolution of custom node types to their source repositories.
+
+``NodeRepoResolver`` dedupes the requested types, answers what it can from a
+TTL cache persisted in SQLite (so it survives restarts and is shared between
+workers), and resolves the remaining misses concurrently under a bounded
+semaphore. Concurrent requests for the same type share a single lookup.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db")
+
+RepoInfo = Dict[str, Any]
+RepoLookup = Callable[[str], Awaitable[Optional[RepoInfo]]]
+
+
+class RepoCache:
+    """TTL cache of resolved repo info, in memory with an SQLite write-through."""
+
+    def __init__(self, path: Optional[str] = None, ttl_seconds: float = 24 * 3600,
+                 negative_ttl_seconds: float = 600):
+        self.path = path or os.path.join(DEFAULT_DB_DIR, "node_repos.sqlite3")
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._memory: Dict[str, Tuple[float, Optional[RepoInfo]]] = {}
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS node_repos ("
+            " node_type TEXT PRIMARY KEY,"
+            " expires_at REAL NOT NULL,"
+            " payload TEXT)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, node_types: Iterable[str]) -> Tuple[Dict[str, Optional[RepoInfo]], List[str]]:
+        """Split node types into cached results and misses."""
+        now = time.time()
+        found: Dict[str, Optional[RepoInfo]] = {}
+        pending = []
+        for node_type in node_types:
+            cached = self._memory.get(node_type)
+            if cached is not None and cached[0] > now:
+                found[node_type] = cached[1]
+            else:
+                pending.append(node_type)
+
+        misses = []
+        for start in range(0, len(pending), 500):
+            batch = pending[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT node_type, expires_at, payload FROM node_repos"
+                f" WHERE node_type IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            stored = {row[0]: row for row in rows}
+            for node_type in batch:
+                row = stored.get(node_type)
+                if row is not None and row[1] > now:
+                    info = json.loads(row[2]) if row[2] is not None else None
+                    self._memory[node_type] = (row[1], info)
+                    found[node_type] = info
+                else:
+                    misses.append(node_type)
+        return found, misses
+
+    def put_many(self, results: Dict[str, Optional[RepoInfo]]) -> None:
+        if not results:
+            return
+        now = time.time()
+        rows = []
+        for node_type, info in results.items():
+            expires_at = now + (self.ttl_seconds if info is not None else self.negative_ttl_seconds)
+            self._memory[node_type] = (expires_at, info)
+            rows.append((node_type, expires_at, json.dumps(info) if info is not None else None))
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO node_repos (node_type, expires_at, payload) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def clear(self) -> None:
+        self._memory.clear()
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM node_repos")
+
+
+class NodeRepoResolver:
+    """Resolves many node types at once through a cache and a bounded lookup pool."""
+
+    def __init__(self, lookup: RepoLookup, cache: RepoCache, concurrency: int = 16):
+        self.lookup = lookup
+        self.cache = cache
+        self.concurrency = concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, "asyncio.Future[Optional[RepoInfo]]"] = {}
+
+    async def _resolve_one(self, node_type: str) -> Optional[RepoInfo]:
+        future = self._inflight.get(node_type)
+        if future is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[node_type] = future
+        try:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+            async with self._semaphore:
+                info = await self.lookup(node_type)
+            future.set_result(info)
+            return info
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[node_type]
+
+    async def resolve_many(self, node_types: Iterable[str]) -> Dict[str, Optional[RepoInfo]]:
+        """Return repo info for each distinct node type (``None`` when unknown)."""
+        unique = list(dict.fromkeys(node_types))
+        found, misses = self.cache.get_many(unique)
+        if misses:
+            results = await asyncio.gather(*(self._resolve_one(t) for t in misses))
+            resolved = dict(zip(misses, results))
+            self.cache.put_many(resolved)
+            found.update(resolved)
+        return {t: found[t] for t in unique}
+
+    async def resolve(self, node_type: str) -> Optional[RepoInfo]:
+        return (await self.resolve_many([node_type]))[node_type]
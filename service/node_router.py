@@ -1,7 +1,12 @@
-import time
-from fastapi import APIRouter, HTTPException, Query
+import asyncio
+import hashlib
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
-from .node_service import fetch_node_repos, get_git_repo, BUILT_IN_NODE_TYPES
+from .node_service import fetch_node_repos, get_git_repo, search_node_index
+from .builtin_registry import BUILTIN_REGISTRY
+from .static_assets import etag_matches
 
 router = APIRouter()
 
@@ -19,10 +24,15 @@ async def get_node_repos(node_types: str = Query(..., description="Comma-separat
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/git-info/{node_type}")
-async def get_node_git_info(node_type: str):
+class NodeReposRequest(BaseModel):
+    node_types: List[str]
+
+@router.post("/repos")
+async def post_node_repos(request: NodeReposRequest):
+    """Batch variant of GET /repos for type lists too long for a query string."""
     try:
-        result = await get_git_repo(node_type)
+        node_type_list = [t.strip() for t in request.node_types if t and t.strip()]
+        result = await fetch_node_repos(node_type_list)
         if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], int):
             error, status_code = result
             raise HTTPException(status_code=status_code, detail=error)
@@ -32,18 +42,50 @@ async def get_node_git_info(node_type: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def _get_builtin_node_types():
-    """Helper function to get built-in node types without causing recursion."""
-    return {
-        "node_types": sorted(list(BUILT_IN_NODE_TYPES)),
-        "count": len(BUILT_IN_NODE_TYPES),
-        "timestamp": int(time.time())
-    }
+@router.get("/search")
+async def search_nodes(
+    q: str = Query(..., min_length=1, description="Free-text query"),
+    limit: int = Query(20, ge=1, le=100),
+    category: Optional[str] = Query(None, description="Only nodes under this category prefix"),
+):
+    """Rank node types by name, category, input/output types and description."""
+    return await asyncio.to_thread(search_node_index, q, limit, category)
 
-@router.get("/builtin-types")
-async def get_builtin_node_types():
+@router.get("/git-info/{node_type}")
+async def get_node_git_info(node_type: str):
     try:
-        result = await _get_builtin_node_types()
+        result = await get_git_repo(node_type)
+        if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], int):
+            error, status_code = result
+            raise HTTPException(status_code=status_code, detail=error)
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/builtin-types")
+async def get_builtin_node_types(
+    request: Request,
+    prefix: Optional[str] = None,
+    q: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """Serve the precomputed built-in registry, or a prefix/fuzzy search over it."""
+    registry = BUILTIN_REGISTRY
+    if not prefix and not q:
+        headers = {"ETag": registry.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), registry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=registry.body, media_type="application/json", headers=headers)
+
+    etag = f'W/"{registry.version}-{hashlib.sha1(f"{prefix}|{q}|{limit}".encode()).hexdigest()[:8]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    matches = registry.prefix_search(prefix, limit) if prefix else registry.fuzzy_search(q, limit)
+    return JSONResponse({
+        "node_types": matches,
+        "count": len(matches),
+        "version": registry.version,
+    }, headers=headers)
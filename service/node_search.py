@@ -0,0 +1,591 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Local search index over node types, for the chat's node search results.
+
+Each node is indexed by its name, display name, category, input/output types
+and description. Two rankers are combined:
+
+* lexical - BM25 over words (CamelCase and snake_case names are split), with
+  each posting's BM25 weight precomputed at build time and postings stored
+  highest weight first, so very common words cost a bounded amount of work
+  per query. Query words missing
+  from the vocabulary are split into two known words ("controlnet") or
+  expanded to similar words through a trigram index, so run-together names,
+  typos and partial names still match.
+* semantic - optional. When NumPy is installed, every node gets an embedding
+  and the query is scored against all of them in one matrix multiply. The
+  bundled ``HashingEmbedder`` is a local stand-in for an embedding model.
+
+The two rankings are merged with reciprocal rank fusion. The index is written
+to a single binary file and opened with ``mmap``: loading it reads only a
+small header, and postings, vocabulary and documents are read in place.
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Sized, Tuple, TypedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db", "node_search.idx")
+
+MAGIC = b"CPNSIDX1"
+FORMAT_VERSION = 1
+
+# Each field's words count this many times towards term frequency
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "display_name": 3.0,
+    "category": 2.0,
+    "input_types": 1.5,
+    "output_types": 1.5,
+    "description": 1.0,
+}
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+# Postings read per query term; lists are impact-ordered, so this drops only the weakest matches
+MAX_POSTINGS_PER_TERM = 2048
+
+_WORD_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+|[^\W\d_]+")
+
+
+class NodeDoc(TypedDict):
+    name: str
+    display_name: str
+    category: str
+    description: str
+    input_types: List[str]
+    output_types: List[str]
+    source: str
+    github_url: Optional[str]
+
+
+def words(text: str) -> List[str]:
+    """Lowercase words of ``text``; ``KSamplerAdvanced`` gives ksampler, advanced."""
+    return [w.lower() for w in _WORD_RE.findall(text)]
+
+
+def trigrams(term: str) -> List[str]:
+    padded = f"${term}$"
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+def doc_terms(doc: NodeDoc, plain_words: Optional[set] = None) -> Dict[str, float]:
+    """Field-weighted term frequencies of a document.
+
+    Words (as opposed to whole joined names) are also added to ``plain_words``.
+    """
+    tf: Dict[str, float] = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = doc.get(field) or ""
+        text = " ".join(value) if isinstance(value, list) else value
+        for word in words(text):
+            tf[word] = tf.get(word, 0.0) + weight
+            if plain_words is not None:
+                plain_words.add(word)
+        if field == "name" and value:
+            # The whole name as one word too, so "ksampleradvanced" matches exactly
+            whole = "".join(words(value))
+            if whole:
+                tf[whole] = tf.get(whole, 0.0) + weight
+    return tf
+
+
+class HashingEmbedder:
+    """Feature-hashing text embedder; a local stand-in for an embedding model."""
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for word in words(text):
+            for feature in [word] + trigrams(word):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                vector[digest % self.dim] += 1.0 if digest & (1 << 63) else -1.0
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector] if norm else vector
+
+
+def doc_text(doc: NodeDoc) -> str:
+    return " ".join([
+        doc["name"], doc["display_name"], doc["category"],
+        " ".join(doc["input_types"]), " ".join(doc["output_types"]), doc["description"],
+    ])
+
+
+class _StringTable:
+    """Sorted strings stored as offsets into a UTF-8 blob, searched in place."""
+
+    __slots__ = ("offsets", "blob", "count")
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+        self.count = len(offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def find(self, key: str) -> int:
+        target = key.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.count and self[lo] == target else -1
+
+
+def _align(buffer: bytearray) -> None:
+    buffer.extend(b"\0" * (-len(buffer) % 8))
+
+
+def build_index(
+    docs: Sequence[NodeDoc],
+    path: str,
+    key: str = "",
+    embedder: Optional[HashingEmbedder] = None,
+) -> None:
+    """Write the search index for ``docs`` to ``path`` (atomically)."""
+    docs = sorted(docs, key=lambda d: d["name"])
+    term_postings: Dict[str, List[Tuple[int, float]]] = {}
+    plain_words: set = set()
+    lengths = []
+    for doc_id, doc in enumerate(docs):
+        tf = doc_terms(doc, plain_words)
+        lengths.append(sum(tf.values()))
+        for term, freq in tf.items():
+            term_postings.setdefault(term, []).append((doc_id, freq))
+    n_docs = len(docs)
+    avg_len = (sum(lengths) / n_docs) if n_docs else 1.0
+
+    terms = sorted(term_postings, key=lambda t: t.encode("utf-8"))
+    post_offsets = array("I", [0])
+    post_docs = array("I")
+    post_weights = array("f")
+    for term in terms:
+        postings = term_postings[term]
+        df = len(postings)
+        idf = max(0.0, _idf(n_docs, df))
+        impacts = []
+        for doc_id, freq in postings:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / avg_len)
+            impacts.append((idf * freq * (BM25_K1 + 1) / (freq + norm), doc_id))
+        # Highest impact first, so queries can stop early on very common terms
+        impacts.sort(key=lambda item: (-item[0], item[1]))
+        post_weights.extend(weight for weight, _ in impacts)
+        post_docs.extend(doc_id for _, doc_id in impacts)
+        post_offsets.append(len(post_docs))
+
+    trigram_terms: Dict[str, List[int]] = {}
+    for term_id, term in enumerate(terms):
+        if term not in plain_words:
+            # Whole joined names are matched exactly, never through typo expansion
+            continue
+        for gram in trigrams(term):
+            trigram_terms.setdefault(gram, []).append(term_id)
+    grams = sorted(trigram_terms, key=lambda g: g.encode("utf-8"))
+    gram_offsets = array("I", [0])
+    gram_terms = array("I")
+    for gram in grams:
+        gram_terms.extend(trigram_terms[gram])
+        gram_offsets.append(len(gram_terms))
+
+    categories = sorted({doc["category"] for doc in docs})
+    category_ids = {c: i for i, c in enumerate(categories)}
+    doc_categories = array("I", (category_ids[doc["category"]] for doc in docs))
+    doc_offsets = array("I", [0])
+    doc_blob = bytearray()
+    for doc in docs:
+        doc_blob += json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        doc_offsets.append(len(doc_blob))
+
+    sections: Dict[str, Any] = {}
+    sections.update(_string_table("terms", terms))
+    sections.update(_string_table("grams", grams))
+    sections.update({
+        "doc_offsets": doc_offsets,
+        "doc_blob": bytes(doc_blob),
+        "doc_categories": doc_categories,
+        "post_offsets": post_offsets,
+        "post_docs": post_docs,
+        "post_weights": post_weights,
+        "gram_offsets": gram_offsets,
+        "gram_terms": gram_terms,
+    })
+    if embedder is not None:
+        matrix = array("f")
+        for doc in docs:
+            matrix.extend(embedder.embed(doc_text(doc)))
+        sections["embeddings"] = matrix
+
+    body = bytearray()
+    layout = {}
+    for name, data in sections.items():
+        _align(body)
+        raw = data.tobytes() if isinstance(data, array) else data
+        layout[name] = [len(body), len(raw), data.typecode if isinstance(data, array) else "B"]
+        body += raw
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "key": key,
+        "byteorder": sys.byteorder,
+        "docs": n_docs,
+        "terms": len(terms),
+        "categories": categories,
+        "embedder": embedder and {"name": embedder.name, "dim": embedder.dim},
+        "sections": layout,
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack("<I", len(header)) + header
+    padding = b"\0" * (-len(prefix) % 8)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(prefix + padding)
+        f.write(body)
+    os.replace(temp, path)
+
+
+def _string_table(name: str, strings: Iterable[str]) -> Dict[str, Any]:
+    offsets = array("I", [0])
+    blob = bytearray()
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+    return {f"{name}_offsets": offsets, f"{name}_blob": bytes(blob)}
+
+
+def _idf(n_docs: int, df: int) -> float:
+    return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+class NodeSearchIndex:
+    """A memory-mapped index file written by ``build_index``."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        # Every view into the map, so close() can release them before unmapping
+        self._views = [view]
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a node search index")
+        (header_len,) = struct.unpack_from("<I", view, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(view[start:start + header_len]))
+        if self.header["format"] != FORMAT_VERSION or self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written by an incompatible version")
+        base = start + header_len
+        base += -base % 8
+        self._sections: Dict[str, memoryview] = {}
+        for name, (offset, length, typecode) in self.header["sections"].items():
+            raw = view[base + offset:base + offset + length]
+            self._views.append(raw)
+            if typecode != "B":
+                raw = raw.cast(typecode)
+                self._views.append(raw)
+            self._sections[name] = raw
+        self._body_offset = base
+        s = self._sections
+        self.terms = _StringTable(s["terms_offsets"], s["terms_blob"])
+        self.grams = _StringTable(s["grams_offsets"], s["grams_blob"])
+        self.categories: List[str] = self.header["categories"]
+        self._embeddings = None
+        embedder = self.header.get("embedder")
+        if embedder and numpy is not None:
+            offset, length, _ = self.header["sections"]["embeddings"]
+            self._embeddings = numpy.frombuffer(
+                self._mmap, dtype=numpy.float32, count=length // 4, offset=base + offset,
+            ).reshape(self.header["docs"], embedder["dim"])
+
+    @property
+    def key(self) -> str:
+        return self.header["key"]
+
+    def __len__(self) -> int:
+        return self.header["docs"]
+
+    def doc(self, doc_id: int) -> NodeDoc:
+        offsets = self._sections["doc_offsets"]
+        return json.loads(bytes(self._sections["doc_blob"][offsets[doc_id]:offsets[doc_id + 1]]))
+
+    def _expand(self, word: str, limit: int = 3, threshold: float = 0.4) -> List[Tuple[int, float]]:
+        """Vocabulary terms similar to ``word`` (trigram Jaccard), with their similarity."""
+        grams = trigrams(word)
+        shared: Dict[int, int] = {}
+        offsets, term_ids = self._sections["gram_offsets"], self._sections["gram_terms"]
+        for gram in grams:
+            g = self.grams.find(gram)
+            if g >= 0:
+                for term_id in term_ids[offsets[g]:offsets[g + 1]]:
+                    shared[term_id] = shared.get(term_id, 0) + 1
+        scored = []
+        for term_id, count in shared.items():
+            if count * 2 < len(grams):
+                continue
+            term = self.terms[term_id].decode("utf-8")
+            similarity = count / (len(grams) + len(term) - count)
+            if similarity >= threshold:
+                scored.append((similarity, term_id))
+        return [(term_id, similarity) for similarity, term_id in heapq.nlargest(limit, scored)]
+
+    def _split(self, word: str) -> List[Tuple[int, float]]:
+        """Both halves of a run-together word ("controlnet") when each is a known term."""
+        for cut in range(len(word) - 2, 2, -1):
+            head, tail = self.terms.find(word[:cut]), self.terms.find(word[cut:])
+            if head >= 0 and tail >= 0:
+                return [(head, 1.0), (tail, 1.0)]
+        return []
+
+    def lexical(self, query: str, limit: int = 100) -> List[Tuple[int, float]]:
+        """BM25 ranking; unknown query words are matched through similar terms."""
+        offsets = self._sections["post_offsets"]
+        docs, weights = self._sections["post_docs"], self._sections["post_weights"]
+        scores: Dict[int, float] = {}
+        for word in dict.fromkeys(words(query)):
+            term_id = self.terms.find(word)
+            expanded = [(term_id, 1.0)] if term_id >= 0 else self._split(word) or self._expand(word)
+            for term_id, boost in expanded:
+                start = offsets[term_id]
+                end = min(offsets[term_id + 1], start + MAX_POSTINGS_PER_TERM)
+                get = scores.get
+                for doc_id, weight in zip(docs[start:end], weights[start:end]):
+                    scores[doc_id] = get(doc_id, 0.0) + weight * boost
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    @property
+    def has_embeddings(self) -> bool:
+        return self._embeddings is not None
+
+    def semantic(self, vector: Sequence[float], limit: int = 100) -> List[Tuple[int, float]]:
+        """Cosine top-k against every node embedding (needs NumPy)."""
+        if self._embeddings is None or not len(self._embeddings):
+            return []
+        scores = self._embeddings @ numpy.asarray(vector, dtype=numpy.float32)
+        limit = min(limit, len(scores))
+        top = numpy.argpartition(-scores, limit - 1)[:limit]
+        top = top[numpy.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        category: Optional[str] = None,
+        embedder: Optional[HashingEmbedder] = None,
+    ) -> List[Dict[str, Any]]:
+        """Top ``limit`` nodes for ``query``, optionally under a category prefix."""
+        depth = max(100, limit * 5)
+        rankings = [self.lexical(query, depth)]
+        if embedder is not None and self.has_embeddings:
+            rankings.append(self.semantic(embedder.embed(query), depth))
+        fused: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, (doc_id, _) in enumerate(ranking):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        allowed = None
+        if category:
+            prefix = category.lower()
+            allowed = {i for i, c in enumerate(self.categories) if c.lower().startswith(prefix)}
+        doc_categories = self._sections["doc_categories"]
+        results = []
+        for doc_id, score in sorted(fused.items(), key=lambda item: -item[1]):
+            if allowed is not None and doc_categories[doc_id] not in allowed:
+                continue
+            doc = dict(self.doc(doc_id))
+            doc["score"] = round(score, 6)
+            results.append(doc)
+            if len(results) >= limit:
+                break
+        return results
+
+    def close(self) -> None:
+        self._sections.clear()
+        self.terms = self.grams = None
+        self._embeddings = None
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._mmap.close()
+
+
+def _type_names(value: Any) -> List[str]:
+    if isinstance(value, (list, tuple)) and value and isinstance(value[0], (list, tuple)):
+        return ["COMBO"]
+    if isinstance(value, (list, tuple)) and value:
+        value = value[0]
+    if isinstance(value, (list, tuple)):
+        return ["COMBO"]
+    return [str(value)] if value else []
+
+
+def describe_node(name: str, node_class: Any, display_names: Mapping[str, str], source: str) -> NodeDoc:
+    """Build a search document from a ComfyUI node class (any attribute may be missing)."""
+    input_types: List[str] = []
+    try:
+        spec = node_class.INPUT_TYPES() if hasattr(node_class, "INPUT_TYPES") else {}
+        for section in ("required", "optional"):
+            for entry in (spec.get(section) or {}).values():
+                input_types.extend(_type_names(entry))
+    except Exception:
+        pass
+    outputs = getattr(node_class, "RETURN_TYPES", ()) or ()
+    return NodeDoc(
+        name=name,
+        display_name=display_names.get(name, ""),
+        category=str(getattr(node_class, "CATEGORY", "") or ""),
+        description=str(getattr(node_class, "DESCRIPTION", "") or ""),
+        input_types=sorted(set(input_types)),
+        output_types=sorted({str(t) if not isinstance(t, (list, tuple)) else "COMBO" for t in outputs}),
+        source=source,
+        github_url=None,
+    )
+
+
+def _sources(node_classes: Mapping[str, Any], builtin_names: Iterable[str]) -> Optional[Tuple[int, int, int, int]]:
+    if not isinstance(builtin_names, Sized):
+        return None
+    return id(node_classes), len(node_classes), id(builtin_names), len(builtin_names)
+
+
+class NodeSearch:
+    """Keeps an on-disk index in step with the registered node types."""
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, embedder: Optional[HashingEmbedder] = None):
+        self.path = path
+        self.embedder = embedder
+        self._index: Optional[NodeSearchIndex] = None
+        # Node names the current index was built from; the index key is derived from them
+        self._names: Optional[frozenset] = None
+        # Identity and size of the mappings _names was last checked against
+        self._sources: Optional[Tuple[int, int, int, int]] = None
+        # Serializes rebuilds
+        self._lock = threading.Lock()
+        # Guards the current index and its reader counts
+        self._idle = threading.Condition()
+        self._readers: Dict[int, int] = {}
+
+    def _index_key(self, names: Iterable[str]) -> str:
+        digest = hashlib.sha256()
+        for name in sorted(names):
+            digest.update(name.encode("utf-8") + b"\n")
+        embedder = self.embedder and f"{self.embedder.name}:{self.embedder.dim}"
+        digest.update(f"v{FORMAT_VERSION}|{embedder}".encode())
+        return digest.hexdigest()[:16]
+
+    def index(
+        self,
+        node_classes: Mapping[str, Any],
+        display_names: Mapping[str, str],
+        builtin_names: Iterable[str],
+        github_url: Optional[Callable[[str], Optional[str]]] = None,
+    ) -> NodeSearchIndex:
+        """Return the index, reloading or rebuilding it when the node set changed.
+
+        Node registries only grow in practice, so the same mapping objects with
+        the same sizes are taken as unchanged; otherwise the names are compared.
+        """
+        sources = _sources(node_classes, builtin_names)
+        index = self._index
+        if index is not None and sources is not None and sources == self._sources:
+            return index
+        builtin = set(builtin_names)
+        names = frozenset(node_classes).union(builtin)
+        if index is not None and names == self._names:
+            with self._idle:
+                if self._index is index:
+                    self._sources = sources
+            return index
+        with self._lock:
+            if self._index is not None and names == self._names:
+                self._sources = sources
+                return self._index
+            key = self._index_key(names)
+            # Unmap the current file before it is reopened or replaced; Windows
+            # cannot replace a file that is still mapped
+            self._retire()
+            index = None
+            if os.path.exists(self.path):
+                try:
+                    index = NodeSearchIndex(self.path)
+                except (OSError, ValueError):
+                    index = None
+                if index is not None and index.key != key:
+                    index.close()
+                    index = None
+            if index is None:
+                docs = []
+                for name in names:
+                    source = "builtin" if name in builtin else "custom"
+                    doc = describe_node(name, node_classes.get(name), display_names, source)
+                    doc["github_url"] = github_url(name) if github_url and source == "custom" else None
+                    docs.append(doc)
+                build_index(docs, self.path, key, self.embedder)
+                index = NodeSearchIndex(self.path)
+            with self._idle:
+                self._index, self._names, self._sources = index, names, sources
+            return index
+
+    def _retire(self) -> None:
+        """Drop the current index and close it once no search is using it."""
+        with self._idle:
+            previous, self._index, self._names, self._sources = self._index, None, None, None
+            while previous is not None and self._readers.get(id(previous)):
+                self._idle.wait()
+        if previous is not None:
+            previous.close()
+
+    @contextmanager
+    def reading(self, *args: Any, **kwargs: Any) -> Iterator[NodeSearchIndex]:
+        """``index(...)``, kept open until the block exits even if a rebuild starts meanwhile."""
+        while True:
+            index = self.index(*args, **kwargs)
+            with self._idle:
+                if index is self._index:
+                    self._readers[id(index)] = self._readers.get(id(index), 0) + 1
+                    break
+        try:
+            yield index
+        finally:
+            with self._idle:
+                self._readers[id(index)] -= 1
+                if not self._readers[id(index)]:
+                    del self._readers[id(index)]
+                    self._idle.notify_all()
+
+
+_node_search: Optional[NodeSearch] = None
+
+
+def get_node_search() -> NodeSearch:
+    global _node_search
+    if _node_search is None:
+        embedder = None
+        if numpy is not None and os.getenv("COPILOT_NODE_SEARCH_EMBEDDINGS", "1") != "0":
+            embedder = HashingEmbedder(int(os.getenv("COPILOT_NODE_SEARCH_EMBEDDING_DIM", 256)))
+        _node_search = NodeSearch(os.getenv("COPILOT_NODE_SEARCH_INDEX", DEFAULT_INDEX_PATH), embedder)
+    return _node_search
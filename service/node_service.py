@@ -2,87 +2,146 @@
 # Licensed under the MIT License.
 
 
+import asyncio
 import inspect
 import json
 import os
-import sys
-import subprocess
 import json
 import time
-from pathlib import Path
 from typing import Dict, List, Any, Optional, Union, TypedDict
 
-# Add parent directory to path to allow imports
-sys.path.append(str(Path(__file__).parent.parent))
+# Import the server instance
+from .server import server
+from .node_resolver import NodeRepoResolver, RepoCache
+from .git_scanner import GitIndex, GitScanner
+from .builtin_registry import BUILTIN_REGISTRY
+from .node_search import NodeSearchIndex, get_node_search
+from .log import get_logger
 
-# Import the server instance and add_route function
-from .server import server, add_route
+logger = get_logger(__name__)
 
 # Mock NODE_CLASS_MAPPINGS since we don't have the actual nodes module
 NODE_CLASS_MAPPINGS = {}
 
-# Define routes
-def setup_routes():
-    """Set up all the routes for the node service."""
-    add_route("/nodes/fetch_repos", fetch_node_repos, methods=["GET"])
-    add_route("/nodes/git-info/{node_type}", get_git_repo, methods=["GET"])
-    add_route("/nodes/builtin-types", get_builtin_node_types, methods=["GET"])
-
-# Note: setup_routes() will be called after all functions are defined
-
-# Built-in node types for ComfyUI
-BUILT_IN_NODE_TYPES = {
-    # Core nodes
-    "BasicScheduler", "CLIPLoader", "CLIPMergeSimple", "CLIPSave", "CLIPSetLastLayer",
-    "CLIPTextEncode", "CLIPTextEncodeSDXL", "CLIPTextEncodeSDXLRefiner", "CLIPVisionEncode",
-    "CLIPVisionLoader", "Canny", "CheckpointLoader", "CheckpointLoaderSimple", "CheckpointSave",
-    
-    # Conditioning nodes
-    "ConditioningAverage", "ConditioningCombine", "ConditioningConcat", "ConditioningSetArea",
-    "ConditioningSetAreaPercentage", "ConditioningSetAreaStrength", "ConditioningSetMask",
-    "ConditioningSetMaskAndCombine", "ConditioningSetMaskOrCombine", "ConditioningSetPosition",
-    "ConditioningSetPositionAndCombine", "ConditioningSetRegion", "ConditioningSetTimestepRange",
-    
-    # ControlNet and LoRA
-    "ControlLoraLoader", "ControlNetApply", "ControlNetApplyAdvanced", "ControlNetLoader", 
-    "LoraLoader", "LoraLoaderModelOnly",
-    
-    # Image processing
-    "CropImage", "ImageScale", "ImageScaleBy", "ImageScaleToTotalPixels", "ImageUpscaleWithModel",
-    "ImageBlend", "ImageBlur", "ImageCompositeMasked", "ImageCrop", "ImageInvert",
-    "ImagePadForOutpaint", "ImageQuantize", "ImageSharpen", "ImageToMask",
-    
-    # Latent space
-    "VAEDecode", "VAEEncode", "VAELoader", "VAESave", "VAEDecodeTiled", "VAEEncodeForInpaint", 
-    "VAEEncodeTiled", "LatentUpscale", "LatentUpscaleBy", "LatentFromBatch",
-    
-    # Loading/saving
-    "LoadImage", "LoadImageMask", "LoadLatent", "SaveImage", "SaveLatent",
-    "SaveAnimatedPNG", "SaveAnimatedWEBP",
-    
-    # Model operations
-    "ModelMergeAdd", "ModelMergeBlocks", "ModelMergeSimple", "ModelMergeSubtract",
-    "ModelSamplingContinuousEDM", "ModelSamplingDiscrete", "PatchModelAddDownscale",
-    "StyleModelApply", "StyleModelLoader", "UNETLoader", "UpscaleModelLoader",
-    
-    # Samplers and schedulers
-    "SamplerCustom", "SamplerDPMPP_2M_SDE", "SamplerDPMPP_SDE", "BasicScheduler",
-    "PolyexponentialScheduler", "SDTurboScheduler", "VPScheduler",
-    
-    # Other utilities
-    "MaskComposite", "MaskToImage", "PerpNeg", "PhotoMakerEncode", "PhotoMakerLoader",
-    "PorterDuffImageComposite", "PreviewImage", "RebatchImages", "RebatchLatents",
-    "RepeatImageBatch", "RepeatLatentBatch", "RescaleCFG", "SD_4XUpscale_Conditioning",
-    "SVD_img2vid_Conditioning", "SelfAttentionGuidance", "SetLatentNoiseMask",
-    "SolidMask", "SplitImageWithAlpha", "SplitSigmas", "StableZero123_Conditioning",
-    "StableZero123_Conditioning_Batched", "TomePatchModel", "VideoLinearCFGGuidance",
-    "unCLIPCheckpointLoader", "unCLIPConditioning"
-}
+# Built-in node types for ComfyUI, loaded from service/data/builtin_node_types.json
+BUILT_IN_NODE_TYPES = BUILTIN_REGISTRY.names
+
+async def lookup_repo_info(node_type: str) -> Optional[Dict[str, Any]]:
+    """Resolve a node type that is not installed locally (mock data for now)."""
+    return {
+        "gitRepo": f"example/{node_type}",
+        "commitHash": f"abc123{node_type[:4]}",
+        "url": f"https://github.com/example/{node_type}"
+    }
+
+_node_resolver: Optional[NodeRepoResolver] = None
+
+def get_node_resolver() -> NodeRepoResolver:
+    """Return the process-wide node repo resolver."""
+    global _node_resolver
+    if _node_resolver is None:
+        cache = RepoCache(
+            os.getenv("COPILOT_NODE_REPO_CACHE"),
+            ttl_seconds=float(os.getenv("COPILOT_NODE_REPO_TTL", 24 * 3600)),
+        )
+        _node_resolver = NodeRepoResolver(
+            lookup_repo_info,
+            cache,
+            concurrency=int(os.getenv("COPILOT_NODE_REPO_CONCURRENCY", 16)),
+        )
+    return _node_resolver
+
+git_index = GitIndex(
+    GitScanner(max_workers=int(os.getenv("COPILOT_GIT_SCAN_WORKERS", 16))),
+    min_refresh_interval=float(os.getenv("COPILOT_GIT_SCAN_INTERVAL", 30)),
+)
+
+def get_custom_node_roots() -> List[str]:
+    """Directories that hold installed custom node packs."""
+    configured = os.getenv("COPILOT_CUSTOM_NODES_DIR")
+    if configured:
+        return configured.split(os.pathsep)
+    try:
+        import folder_paths
+        return list(folder_paths.get_folder_paths("custom_nodes"))
+    except (ImportError, KeyError, AttributeError):
+        return []
+
+def get_node_class_mappings() -> Dict[str, Any]:
+    """ComfyUI's node class registry, or the local mock outside ComfyUI."""
+    try:
+        import nodes
+        return nodes.NODE_CLASS_MAPPINGS
+    except (ImportError, AttributeError):
+        return NODE_CLASS_MAPPINGS
+
+def get_node_display_names() -> Dict[str, str]:
+    try:
+        import nodes
+        return nodes.NODE_DISPLAY_NAME_MAPPINGS
+    except (ImportError, AttributeError):
+        return {}
+
+def _node_search_sources():
+    def github_url(node_type: str) -> Optional[str]:
+        repo = git_index.lookup(node_type)
+        return repo and repo.get("url")
+
+    return get_node_class_mappings(), get_node_display_names(), BUILTIN_REGISTRY.node_types, github_url
+
+def load_node_search_index() -> NodeSearchIndex:
+    """The node search index, rebuilt (blocking) when the registered nodes changed."""
+    return get_node_search().index(*_node_search_sources())
+
+def search_node_index(q: str, limit: int = 20, category: Optional[str] = None) -> Dict[str, Any]:
+    started = time.perf_counter()
+    node_search = get_node_search()
+    with node_search.reading(*_node_search_sources()) as index:
+        nodes = index.search(q, limit, category, node_search.embedder)
+    return {
+        "query": q,
+        "nodes": nodes,
+        "count": len(nodes),
+        "took_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+async def refresh_git_index(force: bool = False) -> GitIndex:
+    """Rescan custom node packs off the event loop (cheap when nothing changed)."""
+    roots = get_custom_node_roots()
+    if roots:
+        await asyncio.to_thread(git_index.refresh, roots, get_node_class_mappings(), force)
+    return git_index
+
+_git_refresh_task: Optional[asyncio.Task] = None
+
+def start_git_index_refresh() -> bool:
+    """Rescan custom node packs every ``COPILOT_GIT_SCAN_INTERVAL`` seconds in the background; False if already running."""
+    global _git_refresh_task
+    if _git_refresh_task is not None and not _git_refresh_task.done():
+        return False
+
+    async def run():
+        while True:
+            await asyncio.sleep(git_index.min_refresh_interval)
+            try:
+                await refresh_git_index(force=True)
+            except Exception:
+                logger.exception("git index refresh failed")
+
+    _git_refresh_task = asyncio.ensure_future(run())
+    return True
+
+async def current_git_index() -> GitIndex:
+    """The git index kept fresh in the background; only a request before the first scan waits for one."""
+    start_git_index_refresh()
+    if not git_index.ready:
+        await refresh_git_index()
+    return git_index
 
 async def get_git_repo(node_type: str):
     """Get git repository information for a specific node type."""
     if not node_type:
-        raise HTTPException(status_code=400, detail="Node type is required")
+        return {"error": "Node type is required"}, 400
     
     if node_type in BUILT_IN_NODE_TYPES:
         return {
@@ -90,14 +149,18 @@ async def get_git_repo(node_type: str):
             "node_type": node_type
         }
     
-    # For non-built-in nodes, return mock data
+    index = await current_git_index()
+    if index.contains(node_type):
+        repo = index.lookup(node_type)
+    else:
+        repo = await get_node_resolver().resolve(node_type)
     return {
         "is_builtin": False,
         "node_type": node_type,
-        "repo_info": {
-            "git_repo": f"example/{node_type}",
-            "commit_hash": f"abc123{node_type[:4]}",
-            "url": f"https://github.com/example/{node_type}"
+        "repo_info": repo and {
+            "git_repo": repo["gitRepo"],
+            "commit_hash": repo["commitHash"],
+            "url": repo["url"]
         }
     }
 
@@ -105,32 +168,36 @@ async def fetch_node_repos(node_types: List[str]):
     """Fetch repository information for multiple node types."""
     try:
         if not node_types:
-            raise HTTPException(status_code=400, detail="NodeTypes parameter is required and should be a list of node types")
             return {"error": "NodeTypes parameter is required and should be a list of node types"}, 400
         
+        index = await current_git_index()
         repos_mapping = {}
-        for node_type in node_types:
+        unresolved = []
+        for node_type in dict.fromkeys(node_types):
             if node_type in BUILT_IN_NODE_TYPES:
                 continue  # Skip built-in types
-                
-            # Add mock repository data
-            repos_mapping[node_type] = {
-                "gitRepo": f"example/{node_type}",
-                "commitHash": f"abc123{node_type[:4]}",
-                "url": f"https://github.com/example/{node_type}"
-            }
+            if index.contains(node_type):
+                repos_mapping[node_type] = index.lookup(node_type)
+            else:
+                unresolved.append(node_type)
         
-        return repos_mapping
+        if unresolved:
+            resolved = await get_node_resolver().resolve_many(unresolved)
+            repos_mapping.update((t, repo) for t, repo in resolved.items() if repo is not None)
+        return {t: repo for t, repo in repos_mapping.items() if repo is not None}
     except Exception as e:
         return {"error": f"Error fetching node repositories: {str(e)}"}, 500
 
 async def get_builtin_node_types():
     """Get a list of all built-in node types."""
-    return {
-        "node_types": sorted(list(BUILT_IN_NODE_TYPES)),
-        "count": len(BUILT_IN_NODE_TYPES),
-        "timestamp": int(time.time())
-    }
+    return BUILTIN_REGISTRY.payload()
 
-# Call setup_routes to register all routes
-setup_routes()
+async def search_nodes(q: str = "", limit: str = "20", category: Optional[str] = None):
+    """Search node types by name, category, input/output types and description."""
+    if not q.strip():
+        return {"error": "q is required"}, 400
+    try:
+        limit = min(max(int(limit), 1), 100)
+    except ValueError:
+        return {"error": "limit must be an integer"}, 400
+    return await asyncio.to_thread(search_node_index, q, limit, category)
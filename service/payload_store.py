@@ -0,0 +1,422 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Deduplicated, compressed storage of ``ext`` payloads in session history.
+
+Chat turns carry whole workflow graphs in ``ext``; a session that iterates
+on one workflow would otherwise store near-identical copies of it in every
+message. Before a message is saved, each large ``ext`` item is interned here
+and replaced by ``{"type": ..., "ref": <sha256>}``:
+
+* a payload is keyed by the SHA-256 of its canonical JSON, so identical
+  payloads are stored once;
+* a new revision is stored as a JSON Patch (RFC 6902 add/remove/replace)
+  against the previous payload of the same type in the session, when the
+  patch is much smaller than the payload and the delta chain is short;
+* stored records are zlib-compressed; only a small LRU of recently used
+  payloads is kept as plain canonical JSON.
+
+Items are rehydrated when history is fetched with ``include_ext`` or through
+``load()``. A full payload and the patches built on it form a chain that is
+evicted (memory) or pruned (SQLite) as a unit, so a patch never outlives its
+base.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from .metrics import REGISTRY
+
+PAYLOAD_BYTES = REGISTRY.gauge("copilot_payload_store_bytes", "Compressed bytes held by the ext payload store")
+PAYLOAD_INTERNED = REGISTRY.counter(
+    "copilot_payload_store_interned_total", "Ext payloads interned, by how they were stored", ("kind",))
+
+
+def canonical_json(value: Any) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _equal(a: Any, b: Any) -> bool:
+    # Type-strict, so 1 / 1.0 / True are not confused with each other
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_equal(v, b[k]) for k, v in a.items())
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def json_diff(before: Any, after: Any, path: str = "") -> List[Dict[str, Any]]:
+    """JSON Patch operations that turn ``before`` into ``after``."""
+    if type(before) is not type(after):
+        return [{"op": "replace", "path": path, "value": after}]
+    ops: List[Dict[str, Any]] = []
+    if isinstance(before, dict):
+        for key in before:
+            if key not in after:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in after.items():
+            if key not in before:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+            else:
+                ops.extend(json_diff(before[key], value, f"{path}/{_escape(key)}"))
+        return ops
+    if isinstance(before, list):
+        # Keep the common head and tail; diff the middle element-wise when the
+        # lengths match, otherwise remove the old middle and insert the new one.
+        head = 0
+        limit = min(len(before), len(after))
+        while head < limit and _equal(before[head], after[head]):
+            head += 1
+        tail = 0
+        while tail < limit - head and _equal(before[-1 - tail], after[-1 - tail]):
+            tail += 1
+        old_middle = before[head:len(before) - tail]
+        new_middle = after[head:len(after) - tail]
+        if len(old_middle) == len(new_middle):
+            for offset, (x, y) in enumerate(zip(old_middle, new_middle)):
+                ops.extend(json_diff(x, y, f"{path}/{head + offset}"))
+            return ops
+        for index in reversed(range(head, head + len(old_middle))):
+            ops.append({"op": "remove", "path": f"{path}/{index}"})
+        for offset, value in enumerate(new_middle):
+            ops.append({"op": "add", "path": f"{path}/{head + offset}", "value": value})
+        return ops
+    if before != after:
+        ops.append({"op": "replace", "path": path, "value": after})
+    return ops
+
+
+def apply_patch(document: Any, ops: List[Dict[str, Any]]) -> Any:
+    """Apply ``json_diff`` output to ``document`` in place; returns the result."""
+    for op in ops:
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        if not tokens:
+            document = op["value"]
+            continue
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+        last = tokens[-1]
+        kind = op["op"]
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last)
+            if kind == "add":
+                parent.insert(index, op["value"])
+            elif kind == "remove":
+                del parent[index]
+            else:
+                parent[index] = op["value"]
+        elif kind == "remove":
+            del parent[last]
+        else:
+            parent[last] = op["value"]
+    return document
+
+
+class PayloadRecord(NamedTuple):
+    base: Optional[str]  # ref the patch applies to; None for a full payload
+    root: str  # ref of the full payload at the start of the chain
+    depth: int  # number of patches between this record and its root
+    blob: bytes  # zlib-compressed canonical JSON, or JSON Patch when ``base`` is set
+
+
+class MemoryPayloadBackend:
+    """Process-local records, evicted a whole chain at a time, least recently used first."""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._records: Dict[str, PayloadRecord] = {}
+        self._chains: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    def get(self, ref: str) -> Optional[PayloadRecord]:
+        record = self._records.get(ref)
+        if record is not None and record.root in self._chains:
+            self._chains.move_to_end(record.root)
+        return record
+
+    def put(self, ref: str, record: PayloadRecord) -> None:
+        self._records[ref] = record
+        self._chains.setdefault(record.root, []).append(ref)
+        self._chains.move_to_end(record.root)
+        self.bytes += len(record.blob)
+        while self.bytes > self.max_bytes and len(self._chains) > 1:
+            _, refs = self._chains.popitem(last=False)
+            for old in refs:
+                self.bytes -= len(self._records.pop(old).blob)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+class SQLitePayloadBackend:
+    """Records in a ``payloads`` table next to the SQLite session store.
+
+    Chains not used for ``ttl_seconds`` are pruned as a unit.
+    """
+
+    PRUNE_EVERY = 500
+    TOUCH_INTERVAL = 3600.0
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = 30 * 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._puts = 0
+        self._touched: Dict[str, float] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS payloads ("
+            " ref TEXT PRIMARY KEY,"
+            " base TEXT,"
+            " root TEXT NOT NULL,"
+            " depth INTEGER NOT NULL,"
+            " blob BLOB NOT NULL,"
+            " used_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_payloads_root ON payloads (root)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _touch(self, root: str) -> None:
+        # Reads keep a chain alive, but at most one write per chain per interval
+        now = time.time()
+        if now - self._touched.get(root, 0.0) < self.TOUCH_INTERVAL:
+            return
+        self._touched[root] = now
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE payloads SET used_at = ? WHERE root = ?", (now, root))
+
+    def get(self, ref: str) -> Optional[PayloadRecord]:
+        row = self._conn().execute(
+            "SELECT base, root, depth, blob FROM payloads WHERE ref = ?", (ref,)).fetchone()
+        if row is None:
+            return None
+        record = PayloadRecord(row[0], row[1], row[2], bytes(row[3]))
+        self._touch(record.root)
+        return record
+
+    def put(self, ref: str, record: PayloadRecord) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO payloads (ref, base, root, depth, blob, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (ref, record.base, record.root, record.depth, record.blob, time.time()),
+            )
+        self._puts += 1
+        if self._puts % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        if self.ttl_seconds is None:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "DELETE FROM payloads WHERE root IN ("
+                " SELECT root FROM payloads GROUP BY root HAVING MAX(used_at) < ?)",
+                (time.time() - self.ttl_seconds,),
+            )
+        self._touched.clear()
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM payloads").fetchone()[0]
+
+
+class PayloadStore:
+    """Interns ``ext`` payloads and rehydrates references to them."""
+
+    def __init__(
+        self,
+        backend=None,
+        min_bytes: int = 1024,
+        max_chain: int = 16,
+        hot_entries: int = 64,
+        max_heads: int = 4096,
+        level: int = 6,
+    ):
+        self.backend = backend if backend is not None else MemoryPayloadBackend()
+        self.min_bytes = min_bytes
+        self.max_chain = max_chain
+        self.hot_entries = hot_entries
+        self.max_heads = max_heads
+        self.level = level
+        self._hot: "OrderedDict[str, bytes]" = OrderedDict()
+        # Latest payload per (session, ext type): the base for the next revision
+        self._heads: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def _remember(self, ref: str, canonical: bytes) -> None:
+        self._hot[ref] = canonical
+        self._hot.move_to_end(ref)
+        while len(self._hot) > self.hot_entries:
+            self._hot.popitem(last=False)
+
+    def _canonical(self, ref: str) -> Optional[bytes]:
+        canonical = self._hot.get(ref)
+        if canonical is not None:
+            self._hot.move_to_end(ref)
+            return canonical
+        # Walk back to the nearest hot or full payload, then replay the patches
+        patches: List[bytes] = []
+        current: Optional[str] = ref
+        document: Any = None
+        while current is not None:
+            hot = self._hot.get(current)
+            if hot is not None:
+                document = json.loads(hot)
+                break
+            record = self.backend.get(current)
+            if record is None:
+                return None
+            if record.base is None:
+                document = json.loads(zlib.decompress(record.blob))
+                break
+            patches.append(record.blob)
+            current = record.base
+        for blob in reversed(patches):
+            document = apply_patch(document, json.loads(zlib.decompress(blob)))
+        canonical = canonical_json(document)
+        self._remember(ref, canonical)
+        return canonical
+
+    def intern(self, data: Any, lineage: Optional[Tuple[str, str]] = None) -> str:
+        """Store ``data`` once and return its ref.
+
+        ``lineage`` names the (session, ext type) the payload belongs to; the
+        previous payload of that lineage is used as the patch base.
+        """
+        return self._intern(canonical_json(data), data, lineage)
+
+    def _intern(self, canonical: bytes, data: Any, lineage: Optional[Tuple[str, str]]) -> str:
+        ref = hashlib.sha256(canonical).hexdigest()
+        with self._lock:
+            if self.backend.get(ref) is not None:
+                PAYLOAD_INTERNED.inc(kind="duplicate")
+            else:
+                record = self._encode(ref, canonical, data, self._heads.get(lineage) if lineage else None)
+                self.backend.put(ref, record)
+                self.raw_bytes += len(canonical)
+                self.stored_bytes += len(record.blob)
+                PAYLOAD_INTERNED.inc(kind="full" if record.base is None else "patch")
+                if isinstance(self.backend, MemoryPayloadBackend):
+                    PAYLOAD_BYTES.set(self.backend.bytes)
+            self._remember(ref, canonical)
+            if lineage is not None:
+                self._heads[lineage] = ref
+                self._heads.move_to_end(lineage)
+                while len(self._heads) > self.max_heads:
+                    self._heads.popitem(last=False)
+        return ref
+
+    def _encode(self, ref: str, canonical: bytes, data: Any, base_ref: Optional[str]) -> PayloadRecord:
+        full = PayloadRecord(None, ref, 0, zlib.compress(canonical, self.level))
+        base = self.backend.get(base_ref) if base_ref else None
+        if base is None or base.depth + 1 > self.max_chain:
+            return full
+        base_canonical = self._canonical(base_ref)
+        if base_canonical is None:
+            return full
+        patch = canonical_json(json_diff(json.loads(base_canonical), data))
+        if len(patch) * 2 > len(canonical):
+            return full
+        return PayloadRecord(base_ref, base.root, base.depth + 1, zlib.compress(patch, self.level))
+
+    def load(self, ref: str) -> Optional[Any]:
+        """The payload stored under ``ref``, or None if it has been evicted."""
+        with self._lock:
+            canonical = self._canonical(ref)
+        return None if canonical is None else json.loads(canonical)
+
+    def pack(self, session_id: str, ext: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+        """Replace large ext items with references; small ones are kept inline."""
+        if not ext:
+            return ext
+        packed = []
+        for item in ext:
+            data = item.get("data") if isinstance(item, dict) else None
+            canonical = canonical_json(data) if data is not None else b""
+            if len(canonical) < self.min_bytes:
+                packed.append(item)
+                continue
+            ref = self._intern(canonical, data, (session_id, str(item.get("type"))))
+            packed.append({**{k: v for k, v in item.items() if k != "data"}, "ref": ref})
+        return packed
+
+    def unpack(self, ext: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+        """Rehydrate referenced items; evicted payloads come back with ``missing: true``."""
+        if not ext or not any(isinstance(item, dict) and "ref" in item for item in ext):
+            return ext
+        items = []
+        for item in ext:
+            if not isinstance(item, dict) or "ref" not in item:
+                items.append(item)
+                continue
+            data = self.load(item["ref"])
+            rest = {k: v for k, v in item.items() if k != "ref"}
+            items.append({**rest, "data": data} if data is not None else {**item, "missing": True})
+        return items
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "payloads": len(self.backend),
+            "hot": len(self._hot),
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+            "ratio": round(self.raw_bytes / self.stored_bytes, 2) if self.stored_bytes else 0.0,
+        }
+
+
+_payload_store: Optional[PayloadStore] = None
+
+
+def get_payload_store() -> PayloadStore:
+    """Return the process-wide payload store, next to the configured session store."""
+    global _payload_store
+    if _payload_store is None:
+        if os.getenv("COPILOT_SESSION_STORE", "memory").lower() == "sqlite":
+            from .session_store import DEFAULT_DB_DIR, _env_ttl
+
+            backend = SQLitePayloadBackend(
+                os.getenv("COPILOT_SESSION_DB") or os.path.join(DEFAULT_DB_DIR, "sessions.sqlite3"),
+                ttl_seconds=_env_ttl("COPILOT_SESSION_TTL", 30 * 24 * 3600),
+            )
+        else:
+            backend = MemoryPayloadBackend(int(os.getenv("COPILOT_PAYLOAD_MAX_BYTES", 256 * 1024 * 1024)))
+        _payload_store = PayloadStore(
+            backend,
+            min_bytes=int(os.getenv("COPILOT_PAYLOAD_MIN_BYTES", 1024)),
+            max_chain=int(os.getenv("COPILOT_PAYLOAD_MAX_CHAIN", 16)),
+            hot_entries=int(os.getenv("COPILOT_PAYLOAD_HOT_ENTRIES", 64)),
+        )
+    return _payload_store
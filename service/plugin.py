@@ -0,0 +1,80 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Route table of the workspace API and lazy mounting for the ComfyUI plugin.
+
+Importing this module is cheap: it names each handler by module and
+attribute instead of importing it. ``mount_lazy_routes`` adds the routes to
+ComfyUI's aiohttp app straight away, but each handler's module (and with it
+the session store, catalogs and caches) is only imported when its first
+request arrives. ``register_routes`` registers the same table eagerly with the
+shim in ``server.py``; ``create_app`` and ``mount_routes`` call it when no
+routes are registered yet.
+"""
+
+import importlib
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+# (method, path, module, handler attribute)
+ROUTES: Tuple[Tuple[str, str, str, str], ...] = (
+    ("GET", "/workspace/fetch_messages_by_id", "conversation_service", "fetch_messages"),
+    ("GET", "/workspace/payloads/{ref}", "conversation_service", "get_payload"),
+    ("GET", "/workspace/fetch_workflow_templates", "conversation_service", "get_workflow_templates"),
+    ("POST", "/workspace/workflow_gen", "conversation_service", "workflow_gen"),
+    ("POST", "/workspace/workflow/analyze", "conversation_service", "workflow_analyze"),
+    ("POST", "/workspace/workflow/diff", "conversation_service", "workflow_diff"),
+    ("POST", "/workspace/sweeps", "conversation_service", "sweep_submit"),
+    ("GET", "/workspace/sweeps/{job_id}", "conversation_service", "sweep_get"),
+    ("POST", "/workspace/sweeps/{job_id}/cancel", "conversation_service", "sweep_cancel"),
+    ("POST", "/workspace/upload", "conversation_service", "upload_file"),
+    ("GET", "/workspace/uploads/{name}", "conversation_service", "get_upload"),
+    ("POST", "/workspace/chat", "conversation_service", "invoke_chat"),
+    ("POST", "/workspace/chat/invoke", "conversation_service", "invoke_chat_stream"),
+    ("POST", "/workspace/chat/track_event", "conversation_service", "track_event"),
+    ("GET", "/workspace/metrics", "conversation_service", "metrics"),
+    ("GET", "/workspace/ws", "event_hub", "websocket_handler"),
+    ("GET", "/workspace/models/hash/{sha256}", "model_hashes", "get_model_by_hash"),
+    ("GET", "/workspace/models/hashes", "model_hashes", "list_model_hashes"),
+    ("POST", "/workspace/models/rescan", "model_hashes", "rescan_models"),
+    ("GET", "/nodes/fetch_repos", "node_service", "fetch_node_repos"),
+    ("GET", "/nodes/git-info/{node_type}", "node_service", "get_git_repo"),
+    ("GET", "/nodes/builtin-types", "node_service", "get_builtin_node_types"),
+    ("GET", "/nodes/search", "node_service", "search_nodes"),
+)
+
+
+def load_handler(module: str, attr: str) -> Callable:
+    return getattr(importlib.import_module(f"{__package__}.{module}"), attr)
+
+
+def register_routes() -> None:
+    """Import every handler and register it with the ``server.py`` shim."""
+    from .server import add_route
+
+    for method, path, module, attr in ROUTES:
+        add_route(path, load_handler(module, attr), methods=[method])
+
+
+def _lazy_handler(method: str, path: str, module: str, attr: str) -> Callable:
+    resolved: Dict[str, Any] = {}
+
+    async def handler(request):
+        wrapper = resolved.get("wrapper")
+        if wrapper is None:
+            from .metrics import instrument_handler
+            from .server import adapt_handler
+
+            wrapper = resolved["wrapper"] = instrument_handler(adapt_handler(load_handler(module, attr)), path, method)
+        return await wrapper(request)
+
+    handler.__name__ = attr
+    return handler
+
+
+def mount_lazy_routes(application, prefixes: Iterable[str] = ("",)) -> None:
+    """Add every route to an aiohttp app, importing handler modules on first use."""
+    for method, path, module, attr in ROUTES:
+        handler = _lazy_handler(method, path, module, attr)
+        for prefix in prefixes:
+            application.router.add_route(method, prefix + path, handler)
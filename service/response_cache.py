@@ -0,0 +1,179 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Response cache in front of the chat responder.
+
+A reply is cached only when the responder says it can be: ``cache_key()``
+returns the text that fully determines its reply (for the keyword responder,
+just the matched keyword), or None. The cache key combines the responder,
+the chat intent, that text and a digest of the request's ``ext`` context, so
+repeat questions are answered without touching the responder at all.
+
+Entries are evicted least recently used first once the entry or byte limit is
+reached, and expire after a TTL.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from .chat_responder import ChatResponder
+from .metrics import REGISTRY
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "copilot_chat_cache_requests_total", "Chat replies by response cache outcome", ("result",))
+CACHE_BYTES = REGISTRY.gauge("copilot_chat_cache_bytes", "Bytes of replies held by the response cache")
+
+
+def _digest(responder: ChatResponder, intent: Optional[str], key: str, ext: Optional[List[Dict[str, Any]]]) -> str:
+    material = json.dumps(
+        [type(responder).__name__, intent or "", key, ext or []],
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache of whole chat replies, bounded by entries and bytes."""
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def key_for(
+        self,
+        responder: ChatResponder,
+        message: str,
+        history: List[Dict[str, Any]],
+        ext: Optional[List[Dict[str, Any]]] = None,
+        intent: Optional[str] = None,
+    ) -> Optional[str]:
+        """The cache key of a request, or None when the responder marks it uncacheable."""
+        if self.max_entries <= 0:
+            return None
+        key = responder.cache_key(message, history, ext)
+        return None if key is None else _digest(responder, intent, key, ext)
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            self.bypassed += 1
+            CACHE_REQUESTS.inc(result="bypass")
+            return None
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            CACHE_REQUESTS.inc(result="miss")
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        CACHE_REQUESTS.inc(result="hit")
+        return entry[1]
+
+    def put(self, key: str, reply: str) -> None:
+        size = len(reply.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, reply)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        CACHE_BYTES.set(self._bytes)
+
+    def _remove(self, key: str) -> None:
+        _, reply = self._entries.pop(key)
+        self._bytes -= len(reply.encode("utf-8"))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        CACHE_BYTES.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def respond(
+        self,
+        responder: ChatResponder,
+        session_id: str,
+        message: str,
+        history: List[Dict[str, Any]],
+        ext: Optional[List[Dict[str, Any]]] = None,
+        intent: Optional[str] = None,
+    ) -> str:
+        """``responder.respond`` through the cache."""
+        key = self.key_for(responder, message, history, ext, intent)
+        reply = self.get(key)
+        if reply is None:
+            reply = await responder.respond(session_id, message, history, ext)
+            if key is not None:
+                self.put(key, reply)
+        return reply
+
+    async def stream(
+        self,
+        responder: ChatResponder,
+        session_id: str,
+        message: str,
+        history: List[Dict[str, Any]],
+        ext: Optional[List[Dict[str, Any]]] = None,
+        intent: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """``responder.stream`` through the cache; a hit is one delta.
+
+        Only streams that run to completion are stored.
+        """
+        key = self.key_for(responder, message, history, ext, intent)
+        reply = self.get(key)
+        if reply is not None:
+            yield reply
+            return
+        parts = []
+        deltas = responder.stream(session_id, message, history, ext)
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                yield delta
+        finally:
+            await deltas.aclose()
+        if key is not None:
+            self.put(key, "".join(parts))
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            max_entries=int(os.getenv("COPILOT_CHAT_CACHE_ENTRIES", 2048)),
+            max_bytes=int(os.getenv("COPILOT_CHAT_CACHE_MAX_BYTES", 16 * 1024 * 1024)),
+            ttl=float(os.getenv("COPILOT_CHAT_CACHE_TTL", 3600)),
+        )
+    return _response_cache
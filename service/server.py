@@ -1,55 +1,174 @@
 """
 Mock server module to handle imports for the ComfyUI-Copilot application.
 This is a temporary solution to make the application run.
+
+Routes registered through ``add_route``/``add_routes`` are compiled into a
+per-segment trie, so ``{param}`` templates match in O(path length) and their
+values are extracted. ``create_app`` serves the registered handlers from a
+standalone aiohttp application through that trie, and ``mount_routes`` adds
+them to an existing one. Both register the service's own route table
+(``plugin.register_routes()``) when nothing else has been registered; the
+ComfyUI plugin mounts that table lazily instead.
+
+``PromptServer.send``/``send_sync`` publish through the WebSocket hub in
+``event_hub.py``: to one client when ``sid`` is given, otherwise to all.
 """
-from typing import Dict, Any, Optional, List, Callable
+import inspect
+import json
+from typing import Dict, Any, Optional, List, Callable, Iterable, Tuple
 from dataclasses import dataclass
 
-class WebSocket:
-    """Mock WebSocket class for handling WebSocket connections."""
-    async def send_json(self, data: Dict[str, Any]) -> None:
-        """Mock send_json method."""
-        pass
+from aiohttp import web
+
+from .event_hub import Subscriber, client_topic, get_event_hub
+from .metrics import instrument_handler
+
+# A connected client of the event hub (has ``send_json``)
+WebSocket = Subscriber
+
+class _TrieNode:
+    __slots__ = ("static", "param", "param_name", "handlers", "template")
+
+    def __init__(self):
+        self.static: Dict[str, "_TrieNode"] = {}
+        self.param: Optional["_TrieNode"] = None
+        self.param_name: Optional[str] = None
+        self.handlers: Dict[str, Callable] = {}
+        self.template: Optional[str] = None
+
+def _split_path(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+class RouteTrie:
+    """Method/path dispatch table with ``{name}`` path parameters."""
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self._routes: Dict[Tuple[str, str], Callable] = {}
+
+    def add(self, method: str, path: str, handler: Callable) -> None:
+        node = self.root
+        for segment in _split_path(path):
+            if segment.startswith("{") and segment.endswith("}"):
+                name = segment[1:-1]
+                if node.param is None:
+                    node.param = _TrieNode()
+                    node.param_name = name
+                elif node.param_name != name:
+                    raise ValueError(
+                        f"Conflicting path parameter {{{name}}} in {path}, "
+                        f"already registered as {{{node.param_name}}}"
+                    )
+                node = node.param
+            else:
+                node = node.static.setdefault(segment, _TrieNode())
+        method = method.upper()
+        node.handlers[method] = handler
+        node.template = path
+        self._routes[(method, path)] = handler
+
+    def _find(self, segments: List[str]) -> Tuple[Optional[_TrieNode], Dict[str, str]]:
+        # Static segments win over parameters; backtrack only on a dead end.
+        params: Dict[str, str] = {}
+
+        def walk(node: _TrieNode, index: int) -> Optional[_TrieNode]:
+            if index == len(segments):
+                return node if node.handlers else None
+            segment = segments[index]
+            child = node.static.get(segment)
+            if child is not None:
+                found = walk(child, index + 1)
+                if found is not None:
+                    return found
+            if node.param is not None:
+                found = walk(node.param, index + 1)
+                if found is not None:
+                    params[node.param_name] = segment
+                    return found
+            return None
+
+        return walk(self.root, 0), params
+
+    def resolve(self, method: str, path: str) -> Optional[Tuple[Callable, Dict[str, str], str]]:
+        """Return the handler, path parameters and route template for a request, or None."""
+        node, params = self._find(_split_path(path))
+        if node is None:
+            return None
+        handler = node.handlers.get(method.upper())
+        if handler is None and method.upper() == "HEAD":
+            handler = node.handlers.get("GET")
+        return (handler, params, node.template) if handler is not None else None
+
+    def match(self, method: str, path: str) -> Optional[Tuple[Callable, Dict[str, str]]]:
+        """Return the handler and path parameters for a request, or None."""
+        resolved = self.resolve(method, path)
+        return resolved[:2] if resolved is not None else None
+
+    def allowed_methods(self, path: str) -> List[str]:
+        node, _ = self._find(_split_path(path))
+        return sorted(node.handlers) if node is not None else []
+
+    def routes(self) -> List[Tuple[str, str, Callable]]:
+        """Registered ``(method, path, handler)`` triples in registration order."""
+        return [(method, path, handler) for (method, path), handler in self._routes.items()]
 
 @dataclass
 class PromptServer:
     """Mock PromptServer class for handling server routes and WebSocket connections."""
     instance: 'PromptServer' = None
-    
+
     def __init__(self):
         self.app = {}
         self.routes = self.Routes()
         self.user_namespace = {}
-        self.sockets: List[WebSocket] = []
         PromptServer.instance = self
-    
+
+    @property
+    def sockets(self) -> Dict[str, WebSocket]:
+        """Connected clients by client id."""
+        return get_event_hub().clients
+
     class Routes:
         """Mock Routes class for defining server routes."""
         def __init__(self):
             self.get_routes = {}
             self.post_routes = {}
-        
+            self.trie = RouteTrie()
+
+        def add(self, method: str, path: str, handler: Callable) -> None:
+            """Register a handler for one method and path template."""
+            method = method.upper()
+            if method == 'GET':
+                self.get_routes[path] = handler
+            elif method == 'POST':
+                self.post_routes[path] = handler
+            self.trie.add(method, path, handler)
+
         def get(self, path: str):
             """Mock GET route decorator."""
             def decorator(func):
-                self.get_routes[path] = func
+                self.add('GET', path, func)
                 return func
             return decorator
-        
+
         def post(self, path: str):
             """Mock POST route decorator."""
             def decorator(func):
-                self.post_routes[path] = func
+                self.add('POST', path, func)
                 return func
             return decorator
-    
+
+        def match(self, method: str, path: str) -> Optional[Tuple[Callable, Dict[str, str]]]:
+            """Find the handler and path parameters for a request."""
+            return self.trie.match(method, path)
+
     def send_sync(self, event: str, data: Dict[str, Any], sid: str = None) -> None:
-        """Mock send_sync method for sending synchronous events."""
-        pass
-    
-    def send(self, event: str, data: Dict[str, Any], sid: str = None) -> None:
-        """Mock send method for sending events."""
-        pass
+        """Send an event from any thread; it is delivered on the event loop."""
+        get_event_hub().publish_threadsafe(client_topic(sid) if sid else None, event, data)
+
+    async def send(self, event: str, data: Dict[str, Any], sid: str = None) -> None:
+        """Send an event to one client (``sid``) or to every connected client."""
+        get_event_hub().publish(client_topic(sid) if sid else None, event, data)
 
 # Create and expose the PromptServer instance
 app = {}
@@ -60,29 +179,116 @@ PromptServerClass = PromptServer.__class__
 
 # Define the server functions
 def add_route(path: str, handler: Callable, methods: Optional[List[str]] = None, name: str = None) -> None:
-    """Mock method to add routes."""
+    """Register a handler for the given methods."""
     if methods is None:
         methods = ['GET']
-    
-    if 'GET' in methods:
-        PromptServer.routes.get_routes[path] = handler
-    if 'POST' in methods:
-        PromptServer.routes.post_routes[path] = handler
+
+    for method in methods:
+        PromptServer.routes.add(method, path, handler)
 
 def add_routes(routes: Dict[str, Callable]) -> None:
-    """Mock method to add multiple routes."""
+    """Register several handlers keyed by ``"METHOD /path"`` (GET when no method is given)."""
     for path, handler in routes.items():
-        if path.startswith('GET '):
-            PromptServer.routes.get_routes[path[4:]] = handler
-        elif path.startswith('POST '):
-            PromptServer.routes.post_routes[path[5:]] = handler
+        method, _, rest = path.partition(' ')
+        if rest and method.isupper():
+            PromptServer.routes.add(method, rest, handler)
         else:
-            PromptServer.routes.get_routes[path] = handler
+            PromptServer.routes.add('GET', path, handler)
 
 def add_static_path(prefix: str, path: str) -> None:
     """Mock method to add static paths."""
     # In a real implementation, this would configure static file serving
     pass
 
+def _to_response(result: Any) -> web.StreamResponse:
+    if isinstance(result, web.StreamResponse):
+        return result
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], int):
+        body, status = result
+        return web.json_response(body, status=status)
+    return web.json_response(result, dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
+
+def adapt_handler(handler: Callable) -> Callable[[web.Request], Any]:
+    """Wrap a registered handler as an aiohttp handler.
+
+    Handlers with a ``request`` parameter receive the aiohttp request. Others
+    are called with their parameters bound from path parameters, then from the
+    query string (``List`` parameters split on commas). Plain return values are
+    sent as JSON and ``(body, status)`` tuples set the status code.
+    """
+    signature = inspect.signature(handler)
+    wants_request = 'request' in signature.parameters
+
+    async def wrapper(request: web.Request) -> web.StreamResponse:
+        if wants_request:
+            result = handler(request)
+        else:
+            path_params = request.get('route_params') or request.match_info
+            kwargs = {}
+            for name, parameter in signature.parameters.items():
+                if name in path_params:
+                    kwargs[name] = path_params[name]
+                elif name in request.query:
+                    value = request.query[name]
+                    if 'List' in str(parameter.annotation) or parameter.annotation is list:
+                        value = [v.strip() for v in value.split(',') if v.strip()]
+                    kwargs[name] = value
+            try:
+                signature.bind(**kwargs)
+            except TypeError as e:
+                return web.json_response({'error': str(e)}, status=400)
+            result = handler(**kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return _to_response(result)
+
+    wrapper.__name__ = getattr(handler, '__name__', 'handler')
+    return wrapper
+
+def _dispatcher(routes: Any) -> Callable[[web.Request], Any]:
+    adapted: Dict[Tuple[str, str], Callable] = {}
+
+    async def dispatch(request: web.Request) -> web.StreamResponse:
+        resolved = routes.trie.resolve(request.method, request.path)
+        if resolved is None:
+            allowed = routes.trie.allowed_methods(request.path)
+            if allowed:
+                raise web.HTTPMethodNotAllowed(request.method, allowed)
+            raise web.HTTPNotFound()
+        handler, params, template = resolved
+        request['route_params'] = params
+        key = (request.method, template)
+        wrapper = adapted.get(key)
+        if wrapper is None:
+            wrapper = adapted[key] = instrument_handler(adapt_handler(handler), template, request.method)
+        return await wrapper(request)
+
+    return dispatch
+
+def _ensure_routes() -> None:
+    # The service's route table is registered on first use unless routes were added already
+    if not PromptServer.routes.trie.routes():
+        from .plugin import register_routes
+        register_routes()
+
+def create_app(prefix: str = '') -> web.Application:
+    """Build a standalone aiohttp app that dispatches through the route trie."""
+    _ensure_routes()
+    application = web.Application()
+    application.router.add_route('*', prefix + '/{tail:.*}', _dispatcher(PromptServer.routes))
+    return application
+
+def mount_routes(application: web.Application, prefixes: Iterable[str] = ('',)) -> None:
+    """Add every registered route to an existing aiohttp app under each prefix.
+
+    Routes are added individually rather than through a catch-all so that other
+    handlers on a shared app (e.g. other ComfyUI extensions) are not shadowed.
+    """
+    _ensure_routes()
+    for method, path, handler in PromptServer.routes.trie.routes():
+        wrapper = instrument_handler(adapt_handler(handler), path, method)
+        for prefix in prefixes:
+            application.router.add_route(method, prefix + path, wrapper)
+
 # Make the server instance available as 'server'
 server = PromptServer
@@ -0,0 +1,356 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Session message storage for the conversation service.
+
+Two backends are provided:
+
+* ``MemorySessionStore`` - process-local LRU/TTL store with per-session and
+  global message caps, so resident memory stays bounded.
+* ``SQLiteSessionStore`` - append-only SQLite database in WAL mode that can be
+  shared by several worker processes.
+
+Every stored message gets an ``id`` that increases monotonically, which
+``page()`` uses as a cursor for paginated and incremental (``after``) reads.
+
+``get_session_store()`` picks the backend from the environment
+(``COPILOT_SESSION_STORE=memory|sqlite``).
+"""
+
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+DEFAULT_DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db")
+
+
+class SessionStore(ABC):
+    """Interface for storing chat messages grouped by session."""
+
+    @abstractmethod
+    def append(self, session_id: str, message: Dict[str, Any]) -> int:
+        """Append a message to a session, creating the session if needed; return its id."""
+
+    @abstractmethod
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        """Return the messages of a session in insertion order."""
+
+    @abstractmethod
+    def page(
+        self,
+        session_id: str,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` messages in id order.
+
+        With ``after``, the oldest messages newer than that id (incremental
+        fetch); otherwise the newest messages, older than ``before`` if given.
+        """
+
+    @abstractmethod
+    def exists(self, session_id: str) -> bool:
+        """Return True if the session has any stored messages."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Drop a session and all of its messages."""
+
+    def extend(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Append several messages to a session."""
+        for message in messages:
+            self.append(session_id, message)
+
+    def close(self) -> None:
+        """Release any resources held by the store."""
+
+
+class _MemorySession:
+    __slots__ = ("messages", "touched")
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[Dict[str, Any]] = deque(maxlen=max_messages)
+        self.touched = time.monotonic()
+
+
+class MemorySessionStore(SessionStore):
+    """In-memory session store with LRU eviction, idle TTL and message caps."""
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        max_messages_per_session: int = 200,
+        max_total_messages: int = 50000,
+        ttl_seconds: Optional[float] = 24 * 3600,
+    ):
+        self.max_sessions = max_sessions
+        self.max_messages_per_session = max_messages_per_session
+        self.max_total_messages = max_total_messages
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, _MemorySession]" = OrderedDict()
+        self._total = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _expired(self, session: _MemorySession, now: float) -> bool:
+        return self.ttl_seconds is not None and now - session.touched > self.ttl_seconds
+
+    def _drop(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._total -= len(session.messages)
+
+    def _evict(self, now: float) -> None:
+        # Oldest sessions sit at the front of the OrderedDict; the most recently
+        # used session is never evicted for exceeding a cap.
+        while len(self._sessions) > 1:
+            session_id, session = next(iter(self._sessions.items()))
+            if (
+                len(self._sessions) > self.max_sessions
+                or self._total > self.max_total_messages
+                or self._expired(session, now)
+            ):
+                self._drop(session_id)
+            else:
+                break
+
+    def _lookup(self, session_id: str, now: float) -> Optional[_MemorySession]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if self._expired(session, now):
+            self._drop(session_id)
+            return None
+        return session
+
+    def append(self, session_id: str, message: Dict[str, Any]) -> int:
+        now = time.monotonic()
+        with self._lock:
+            session = self._lookup(session_id, now)
+            if session is None:
+                session = _MemorySession(self.max_messages_per_session)
+                self._sessions[session_id] = session
+            if len(session.messages) == session.messages.maxlen:
+                self._total -= 1
+            message_id = next(self._ids)
+            session.messages.append({**message, "id": message_id})
+            self._total += 1
+            session.touched = now
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+            return message_id
+
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            session = self._lookup(session_id, now)
+            if session is None:
+                return []
+            session.touched = now
+            self._sessions.move_to_end(session_id)
+            return list(session.messages)
+
+    def page(self, session_id, after=None, before=None, limit=50):
+        now = time.monotonic()
+        with self._lock:
+            session = self._lookup(session_id, now)
+            if session is None:
+                return []
+            session.touched = now
+            self._sessions.move_to_end(session_id)
+            # Walk from the newest end so the cost follows the size of the delta.
+            picked = []
+            for message in reversed(session.messages):
+                if after is not None and message["id"] <= after:
+                    break
+                if before is not None and message["id"] >= before:
+                    continue
+                picked.append(message)
+                if after is None and len(picked) >= limit:
+                    break
+        picked.reverse()
+        return picked[:limit] if after is not None else picked
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._lookup(session_id, time.monotonic()) is not None
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._drop(session_id)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Append-only SQLite session store that can be shared between workers.
+
+    Each thread gets its own connection; WAL mode lets readers run alongside the
+    single writer. Reads return at most ``max_messages_per_session`` of the most
+    recent messages, and sessions idle for longer than ``ttl_seconds`` are
+    pruned periodically.
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_messages_per_session: int = 200,
+        ttl_seconds: Optional[float] = 30 * 24 * 3600,
+    ):
+        self.path = path or os.path.join(DEFAULT_DB_DIR, "sessions.sqlite3")
+        self.max_messages_per_session = max_messages_per_session
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._appends = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " session_id TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session_id: str, message: Dict[str, Any]) -> int:
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO messages (session_id, created_at, payload) VALUES (?, ?, ?)",
+                (session_id, time.time(), json.dumps(message, ensure_ascii=False)),
+            )
+        self._appends += 1
+        if self._appends % self.PRUNE_EVERY == 0:
+            self.prune()
+        return cursor.lastrowid
+
+    def extend(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO messages (session_id, created_at, payload) VALUES (?, ?, ?)",
+                [(session_id, now, json.dumps(m, ensure_ascii=False)) for m in messages],
+            )
+
+    @staticmethod
+    def _decode(row) -> Dict[str, Any]:
+        message = json.loads(row[1])
+        message["id"] = row[0]
+        return message
+
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT id, payload FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.max_messages_per_session),
+        ).fetchall()
+        return [self._decode(row) for row in reversed(rows)]
+
+    def page(self, session_id, after=None, before=None, limit=50):
+        conn = self._conn()
+        if after is not None:
+            rows = conn.execute(
+                "SELECT id, payload FROM messages WHERE session_id = ? AND id > ?"
+                " ORDER BY id LIMIT ?",
+                (session_id, after, limit),
+            ).fetchall()
+            return [self._decode(row) for row in rows]
+        rows = conn.execute(
+            "SELECT id, payload FROM messages WHERE session_id = ? AND id < ?"
+            " ORDER BY id DESC LIMIT ?",
+            (session_id, before if before is not None else 2 ** 63 - 1, limit),
+        ).fetchall()
+        return [self._decode(row) for row in reversed(rows)]
+
+    def exists(self, session_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM messages WHERE session_id = ? LIMIT 1", (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def delete(self, session_id: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+
+    def prune(self) -> None:
+        """Remove idle sessions and messages beyond the per-session cap."""
+        conn = self._conn()
+        with conn:
+            if self.ttl_seconds is not None:
+                conn.execute(
+                    "DELETE FROM messages WHERE session_id IN ("
+                    " SELECT session_id FROM messages GROUP BY session_id"
+                    " HAVING MAX(created_at) < ?)",
+                    (time.time() - self.ttl_seconds,),
+                )
+            conn.execute(
+                "DELETE FROM messages WHERE id IN ("
+                " SELECT id FROM (SELECT id, ROW_NUMBER() OVER"
+                " (PARTITION BY session_id ORDER BY id DESC) AS rn FROM messages)"
+                " WHERE rn > ?)",
+                (self.max_messages_per_session,),
+            )
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_ttl(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if not value:
+        return default
+    ttl = float(value)
+    return ttl if ttl > 0 else None
+
+
+def get_session_store() -> SessionStore:
+    """Create the session store configured by the environment."""
+    backend = os.getenv("COPILOT_SESSION_STORE", "memory").lower()
+    max_per_session = _env_int("COPILOT_SESSION_MAX_MESSAGES", 200)
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            path=os.getenv("COPILOT_SESSION_DB"),
+            max_messages_per_session=max_per_session,
+            ttl_seconds=_env_ttl("COPILOT_SESSION_TTL", 30 * 24 * 3600),
+        )
+    if backend != "memory":
+        raise ValueError(f"Unknown session store backend: {backend}")
+    return MemorySessionStore(
+        max_sessions=_env_int("COPILOT_SESSION_MAX_SESSIONS", 1000),
+        max_messages_per_session=max_per_session,
+        max_total_messages=_env_int("COPILOT_SESSION_MAX_TOTAL_MESSAGES", 50000),
+        ttl_seconds=_env_ttl("COPILOT_SESSION_TTL", 24 * 3600),
+    )
@@ -0,0 +1,232 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Static asset serving for the built UI bundles.
+
+``StaticAssets`` indexes a build directory once, so serving a request costs a
+dictionary lookup rather than ``exists()``/``stat()`` calls. Compressible
+files get gzip (and brotli, when the ``brotli`` package is installed)
+variants that are generated on first use, or all at once by
+``precompress()``, and kept in a cache directory keyed by the source file's
+size and mtime. Small files, ``index.html`` included, are held in memory.
+
+Content-hashed file names (``vendor-react-V04_Axys.js``) are served as
+immutable; everything else must be revalidated with the ETag. The index is
+not rescanned, so restart the server after rebuilding the UI.
+
+The class is framework-neutral: ``respond()`` returns a ``StaticResponse``
+that ``main.py`` turns into a Starlette response and ``__init__.py`` into an
+aiohttp one.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db", "static")
+
+COMPRESSIBLE_EXTENSIONS = {".js", ".mjs", ".css", ".html", ".json", ".svg", ".txt", ".map", ".xml", ".wasm"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Vite/Rollup append an 8 character base64url content hash: name-V04_Axys.js
+_HASHED_NAME_RE = re.compile(r"-(?=[\w-]{0,7}[A-Z0-9_])[\w-]{8}\.\w+$")
+
+_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+
+def supported_encodings() -> List[str]:
+    """Encodings this process can produce, most preferred first."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists ``etag``, using weak comparison (RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == opaque:
+            return True
+    return False
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    accepted = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return accepted
+
+
+class StaticResponse(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: Optional[bytes] = None
+    path: Optional[str] = None
+    stat: Optional[os.stat_result] = None
+
+
+class Asset:
+    __slots__ = ("path", "stat", "etag", "content_type", "compressible", "immutable", "variants", "memory")
+
+    def __init__(self, path: str, stat: os.stat_result, rel: str):
+        self.path = path
+        self.stat = stat
+        self.etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type in ("application/javascript", "image/svg+xml"):
+            self.content_type += "; charset=utf-8"
+        self.compressible = os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+        self.immutable = bool(_HASHED_NAME_RE.search(os.path.basename(rel)))
+        # encoding -> (path, stat) of a compressed variant on disk
+        self.variants: Dict[str, tuple] = {}
+        # encoding ("identity" included) -> bytes, for small files only
+        self.memory: Dict[str, bytes] = {}
+
+
+class StaticAssets:
+    """Indexed, precompressed view over a directory of built UI files."""
+
+    def __init__(
+        self,
+        root: str,
+        cache_dir: Optional[str] = None,
+        min_compress_size: int = 1024,
+        max_memory_size: int = 64 * 1024,
+    ):
+        self.root = os.path.abspath(root)
+        self.cache_dir = os.path.join(
+            cache_dir or DEFAULT_CACHE_DIR, hashlib.sha1(self.root.encode()).hexdigest()[:12])
+        self.min_compress_size = min_compress_size
+        self.max_memory_size = max_memory_size
+        self._assets: Dict[str, Asset] = {}
+        self._lock = threading.Lock()
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+                self._assets[rel] = Asset(path, os.stat(path), rel)
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    def get(self, rel_path: str) -> Optional[Asset]:
+        return self._assets.get(rel_path.lstrip("/"))
+
+    def _wants_compression(self, asset: Asset) -> bool:
+        return asset.compressible and asset.stat.st_size >= self.min_compress_size
+
+    def _compress(self, asset: Asset, encoding: str) -> None:
+        """Create (or find) the cached ``encoding`` variant of an asset."""
+        with self._lock:
+            if encoding in asset.variants or encoding in asset.memory:
+                return
+            rel = os.path.relpath(asset.path, self.root)
+            target = os.path.join(self.cache_dir, f"{rel}.{asset.etag}{_EXTENSIONS[encoding]}")
+            if not os.path.exists(target):
+                with open(asset.path, "rb") as f:
+                    data = f.read()
+                if encoding == "br":
+                    compressed = brotli.compress(data, quality=11)
+                else:
+                    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                temp = f"{target}.{os.getpid()}.tmp"
+                with open(temp, "wb") as f:
+                    f.write(compressed)
+                os.replace(temp, target)
+            stat = os.stat(target)
+            if stat.st_size >= asset.stat.st_size:
+                # Not worth it; remember that by storing the identity file instead
+                asset.variants[encoding] = (asset.path, asset.stat)
+            elif stat.st_size <= self.max_memory_size:
+                with open(target, "rb") as f:
+                    asset.memory[encoding] = f.read()
+            else:
+                asset.variants[encoding] = (target, stat)
+
+    def precompress(self) -> int:
+        """Generate every compressed variant up front; returns how many assets qualified."""
+        count = 0
+        for asset in self._assets.values():
+            if self._wants_compression(asset):
+                for encoding in supported_encodings():
+                    self._compress(asset, encoding)
+                count += 1
+            if asset.stat.st_size <= self.max_memory_size and "identity" not in asset.memory:
+                with open(asset.path, "rb") as f:
+                    asset.memory["identity"] = f.read()
+        return count
+
+    def _negotiate(self, asset: Asset, accept_encoding: Optional[str]) -> Optional[str]:
+        if not self._wants_compression(asset):
+            return None
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding in supported_encodings():
+            if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return None
+
+    async def respond(
+        self,
+        asset: Asset,
+        accept_encoding: Optional[str] = None,
+        if_none_match: Optional[str] = None,
+    ) -> StaticResponse:
+        """Pick the best representation of ``asset`` for a request."""
+        encoding = self._negotiate(asset, accept_encoding)
+        if encoding is not None and encoding not in asset.variants and encoding not in asset.memory:
+            await asyncio.to_thread(self._compress, asset, encoding)
+        # A variant no smaller than the original is recorded as the original itself
+        if encoding is not None and asset.variants.get(encoding, (None,))[0] == asset.path:
+            encoding = None
+
+        etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if asset.immutable else REVALIDATE_CACHE_CONTROL,
+            "Content-Type": asset.content_type,
+        }
+        if asset.compressible:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(if_none_match, etag):
+            return StaticResponse(304, headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        key = encoding or "identity"
+        if key == "identity" and key not in asset.memory and asset.stat.st_size <= self.max_memory_size:
+            asset.memory[key] = await asyncio.to_thread(_read, asset.path)
+        if key in asset.memory:
+            return StaticResponse(200, headers, body=asset.memory[key])
+        path, stat = asset.variants[encoding] if encoding else (asset.path, asset.stat)
+        return StaticResponse(200, headers, path=path, stat=stat)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
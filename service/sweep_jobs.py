@@ -0,0 +1,512 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Parameter-sweep jobs for the parameter debug feature.
+
+A sweep spec names test values per node parameter, in the same shape the UI
+builds (``{"params": {"<node id>": {"<param>": [values...]}}}``), plus an
+optional base ``workflow``. The scheduler turns one submission into a job:
+
+* combinations are produced lazily (``itertools.product`` over the
+  parameter axes), so a large grid never exists in memory as a list;
+* each combination is keyed by content hash of executor, workflow and
+  values; results are kept in a shared LRU and identical combinations that
+  are already running in another job are awaited rather than started again;
+* combinations run on a bounded pool shared by all jobs, through a pluggable
+  ``SweepExecutor`` (``StubExecutor`` is a local stand-in). A worker slot is
+  held until the executor run itself ends, and a run that no job is waiting
+  for any more is cancelled;
+* status, partial results and cancellation are available while it runs.
+
+With ``COPILOT_SWEEP_STORE=sqlite`` (the default under ``main.py --prod``
+with several workers) the worker that runs a job copies its status and
+results to a shared SQLite database every ``flush_interval`` seconds, so
+any worker can report on the job. Cancelling a job from another worker sets
+a flag that its owner picks up on the next flush.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .log import get_logger
+from .workflow_engine import content_hash
+
+logger = get_logger(__name__)
+
+Axis = Tuple[str, str, List[Any]]  # (node id, parameter name, values)
+
+DEFAULT_DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db")
+
+
+class SweepSpecError(ValueError):
+    """Raised when a sweep spec is malformed or too large."""
+
+
+class SweepBusy(SweepSpecError):
+    """Raised when ``max_jobs`` jobs are already running; answer with HTTP 429."""
+
+
+def parse_axes(params: Any) -> List[Axis]:
+    """Validate ``{"<node id>": {"<param>": [values]}}`` into sorted axes with unique values."""
+    if not isinstance(params, dict) or not params:
+        raise SweepSpecError("params must be a non-empty object of node id -> {param: [values]}")
+    axes = []
+    for node_id, node_params in params.items():
+        if not isinstance(node_params, dict):
+            raise SweepSpecError(f"params[{node_id!r}] must be an object")
+        for name, values in node_params.items():
+            if not isinstance(values, list):
+                raise SweepSpecError(f"params[{node_id!r}][{name!r}] must be a list of values")
+            unique = list({json.dumps(v, sort_keys=True, default=str): v for v in values}.values())
+            if unique:
+                axes.append((str(node_id), str(name), unique))
+    if not axes:
+        raise SweepSpecError("params has no values to sweep")
+    axes.sort(key=lambda axis: (axis[0], axis[1]))
+    return axes
+
+
+def count_combinations(axes: List[Axis]) -> int:
+    total = 1
+    for _, _, values in axes:
+        total *= len(values)
+    return total
+
+
+def iter_combinations(axes: List[Axis]) -> Iterator[Dict[str, Dict[str, Any]]]:
+    """Yield each combination as ``{node id: {param: value}}``, one at a time."""
+    for values in itertools.product(*(axis[2] for axis in axes)):
+        combination: Dict[str, Dict[str, Any]] = {}
+        for (node_id, name, _), value in zip(axes, values):
+            combination.setdefault(node_id, {})[name] = value
+        yield combination
+
+
+class SweepExecutor(ABC):
+    """Runs one combination of a sweep."""
+
+    name = "executor"
+
+    @abstractmethod
+    async def run(self, workflow: Optional[Dict[str, Any]], params: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Evaluate ``workflow`` with ``params`` applied and return a JSON-able result."""
+
+
+class StubExecutor(SweepExecutor):
+    """Local stand-in that returns a deterministic fake output after a delay."""
+
+    name = "stub"
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+
+    async def run(self, workflow, params):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        digest = content_hash({"workflow": workflow, "params": params})
+        return {"output": f"stub_{digest[:12]}.png", "score": int(digest[:8], 16) / 0xFFFFFFFF}
+
+
+_EXECUTOR_FACTORIES: Dict[str, Callable[[], SweepExecutor]] = {
+    "stub": lambda: StubExecutor(float(os.getenv("COPILOT_SWEEP_STUB_DELAY", "0.05"))),
+}
+
+
+def register_executor(name: str, factory: Callable[[], SweepExecutor]) -> None:
+    """Make an executor selectable through ``COPILOT_SWEEP_EXECUTOR``."""
+    _EXECUTOR_FACTORIES[name] = factory
+
+
+class SweepJob:
+    """State of one submitted sweep."""
+
+    def __init__(self, job_id: str, axes: List[Axis], workflow: Optional[Dict[str, Any]], total: int):
+        self.id = job_id
+        self.axes = axes
+        self.workflow = workflow
+        self.workflow_hash = content_hash(workflow)
+        self.total = total
+        self.status = "queued"
+        self.completed = 0
+        self.cached = 0
+        self.failed = 0
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.results: List[Dict[str, Any]] = []
+        self.task: Optional[asyncio.Task] = None
+        # Results and status already copied to the sweep store
+        self.stored_results = 0
+        self.stored_status: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "cancelled", "failed")
+
+    def axes_info(self) -> List[Dict[str, Any]]:
+        return [{"node_id": n, "param": p, "values": len(v)} for n, p, v in self.axes]
+
+    def page(self, offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+        """Summary plus a page of the results so far, in completion order."""
+        payload = self.summary()
+        payload["axes"] = self.axes_info()
+        payload["results"] = self.results[offset:offset + limit]
+        payload["next_offset"] = offset + len(payload["results"])
+        return payload
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "cached": self.cached,
+            "failed": self.failed,
+            "progress": round(self.completed / self.total, 4) if self.total else 1.0,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class SQLiteSweepStore:
+    """Job status and results in SQLite, shared by the worker processes.
+
+    Each thread gets its own connection. Only the worker running a job writes
+    its rows; other workers read them and can flag the job for cancellation.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: Optional[str] = None, keep_jobs: int = 256):
+        self.path = path or os.path.join(DEFAULT_DB_DIR, "sweeps.sqlite3")
+        self.keep_jobs = keep_jobs
+        self._local = threading.local()
+        self._syncs = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sweep_jobs ("
+            " id TEXT PRIMARY KEY,"
+            " created_at REAL NOT NULL,"
+            " done INTEGER NOT NULL DEFAULT 0,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " summary TEXT NOT NULL,"
+            " axes TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sweep_results ("
+            " job_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " entry TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, seq))"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def sync(self, updates: List[Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]], int]],
+             running: Iterable[str]) -> Set[str]:
+        """Write (summary, axes, new results, first seq) updates; return running ids flagged for cancellation."""
+        conn = self._conn()
+        with conn:
+            for summary, axes, entries, start in updates:
+                conn.execute(
+                    "INSERT INTO sweep_jobs (id, created_at, done, summary, axes) VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT(id) DO UPDATE SET done = excluded.done, summary = excluded.summary",
+                    (summary["id"], summary["created_at"], summary["finished_at"] is not None,
+                     json.dumps(summary), json.dumps(axes)),
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO sweep_results (job_id, seq, entry) VALUES (?, ?, ?)",
+                    [(summary["id"], start + i, json.dumps(entry, ensure_ascii=False, default=str))
+                     for i, entry in enumerate(entries)],
+                )
+        self._syncs += 1
+        if self._syncs % self.PRUNE_EVERY == 0:
+            self.prune()
+        running = list(running)
+        if not running:
+            return set()
+        marks = ",".join("?" * len(running))
+        return {row[0] for row in conn.execute(
+            f"SELECT id FROM sweep_jobs WHERE cancel_requested = 1 AND id IN ({marks})", running)}
+
+    def page(self, job_id: str, offset: int = 0, limit: int = 100) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute("SELECT summary, axes FROM sweep_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        results = [json.loads(entry) for (entry,) in conn.execute(
+            "SELECT entry FROM sweep_results WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (job_id, offset, limit))]
+        return {**json.loads(row[0]), "axes": json.loads(row[1]), "results": results,
+                "next_offset": offset + len(results)}
+
+    def request_cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Flag a job for cancellation by the worker running it; returns its last stored summary."""
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE sweep_jobs SET cancel_requested = 1 WHERE id = ? AND done = 0", (job_id,))
+            row = conn.execute("SELECT summary FROM sweep_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def prune(self) -> None:
+        """Forget finished jobs beyond the ``keep_jobs`` most recent ones."""
+        conn = self._conn()
+        with conn:
+            stale = [row[0] for row in conn.execute(
+                "SELECT id FROM sweep_jobs WHERE done = 1 ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                (self.keep_jobs,))]
+            conn.executemany("DELETE FROM sweep_results WHERE job_id = ?", [(i,) for i in stale])
+            conn.executemany("DELETE FROM sweep_jobs WHERE id = ?", [(i,) for i in stale])
+
+
+class SweepScheduler:
+    """Runs sweep jobs on a worker pool shared by every job."""
+
+    def __init__(
+        self,
+        executor: SweepExecutor,
+        max_workers: int = 4,
+        max_combinations: int = 10000,
+        max_jobs: int = 64,
+        max_cached_results: int = 50000,
+        store: Optional[SQLiteSweepStore] = None,
+        flush_interval: float = 0.5,
+    ):
+        self.executor = executor
+        self.max_workers = max_workers
+        self.max_combinations = max_combinations
+        self.max_jobs = max_jobs
+        self.max_cached_results = max_cached_results
+        self.jobs: "OrderedDict[str, SweepJob]" = OrderedDict()
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._running: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, int] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.store = store
+        self.flush_interval = flush_interval
+        self._flusher: Optional[asyncio.Task] = None
+
+    def submit(self, spec: Any) -> SweepJob:
+        """Validate a spec and start its job; raises ``SweepSpecError`` (``SweepBusy`` when full)."""
+        if not isinstance(spec, dict):
+            raise SweepSpecError("Sweep spec must be a JSON object")
+        axes = parse_axes(spec.get("params"))
+        workflow = spec.get("workflow")
+        if workflow is not None and not isinstance(workflow, dict):
+            raise SweepSpecError("workflow must be an object")
+        total = count_combinations(axes)
+        if total > self.max_combinations:
+            raise SweepSpecError(f"Sweep has {total} combinations; the limit is {self.max_combinations}")
+        self._evict_jobs()
+        if len(self.jobs) >= self.max_jobs:
+            raise SweepBusy(f"{self.max_jobs} sweep jobs are already running; try again later")
+        job = SweepJob(uuid.uuid4().hex, axes, workflow, total)
+        self.jobs[job.id] = job
+        job.task = asyncio.ensure_future(self._run(job))
+        if self.store is not None and (self._flusher is None or self._flusher.done()):
+            self._flusher = asyncio.ensure_future(self._flush_loop())
+        return job
+
+    def _evict_jobs(self) -> None:
+        # Forget the oldest finished jobs; running jobs are never dropped
+        while len(self.jobs) >= self.max_jobs:
+            oldest = next((j for j in self.jobs.values() if j.done), None)
+            if oldest is None:
+                break
+            del self.jobs[oldest.id]
+
+    def get(self, job_id: str) -> Optional[SweepJob]:
+        return self.jobs.get(job_id)
+
+    def page(self, job_id: str, offset: int = 0, limit: int = 100) -> Optional[Dict[str, Any]]:
+        """A page of a job's status and results, from this worker or the shared store."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.page(offset, limit)
+        return self.store.page(job_id, offset, limit) if self.store is not None else None
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a job here, or flag it for the worker running it; returns its summary."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            if not job.done and job.task is not None:
+                job.task.cancel()
+            return job.summary()
+        return self.store.request_cancel(job_id) if self.store is not None else None
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("sweep store flush failed")
+            if all(job.stored_status == job.status and job.done for job in self.jobs.values()):
+                return
+
+    async def flush(self) -> None:
+        """Copy new results and status changes to the store; cancel jobs flagged elsewhere."""
+        updates, marks = [], []
+        for job in self.jobs.values():
+            count = len(job.results)
+            if job.stored_status == job.status and job.stored_results == count:
+                continue
+            updates.append((job.summary(), job.axes_info(), job.results[job.stored_results:count],
+                            job.stored_results))
+            marks.append((job, count, job.status))
+        running = [job.id for job in self.jobs.values() if not job.done]
+        cancelled = await asyncio.to_thread(self.store.sync, updates, running)
+        for job, count, status in marks:
+            job.stored_results, job.stored_status = count, status
+        for job_id in cancelled:
+            self.cancel(job_id)
+
+    async def _run(self, job: SweepJob) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        job.status = "running"
+        pending = set()
+        try:
+            for index, params in enumerate(iter_combinations(job.axes)):
+                key = content_hash({"executor": self.executor.name, "workflow": job.workflow_hash, "params": params})
+                if self._record_cached(job, index, params, key):
+                    continue
+                running = self._running.get(key)
+                cached = running is not None
+                if running is None:
+                    # Expansion only advances when a worker slot is free; the slot
+                    # belongs to the executor run and is released in _finished
+                    await self._slots.acquire()
+                    # Another job may have started or finished it meanwhile
+                    running = self._running.get(key)
+                    if running is not None or self._record_cached(job, index, params, key):
+                        self._slots.release()
+                        if running is None:
+                            continue
+                        cached = True
+                    else:
+                        running = self._start(key, job.workflow, params)
+                task = self._watch(job, index, params, key, running, cached)
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception:
+            logger.exception("sweep job failed", extra={"fields": {"job_id": job.id}})
+            job.status = "failed"
+        finally:
+            for task in list(pending):
+                task.cancel()
+            job.finished_at = time.time()
+
+    def _record_cached(self, job: SweepJob, index: int, params: Dict[str, Dict[str, Any]], key: str) -> bool:
+        result = self._results.get(key)
+        if result is None:
+            return False
+        self._results.move_to_end(key)
+        job.cached += 1
+        job.completed += 1
+        job.results.append({"index": index, "params": params, "cached": True, "result": result})
+        return True
+
+    def _start(self, key: str, workflow: Optional[Dict[str, Any]], params: Dict[str, Dict[str, Any]]) -> asyncio.Future:
+        running = self._running[key] = asyncio.ensure_future(self.executor.run(workflow, params))
+        running.add_done_callback(lambda done: self._finished(key, done))
+        return running
+
+    def _watch(self, job, index, params, key, running, cached) -> asyncio.Task:
+        # Every job waiting on a run is counted; when the last one stops
+        # waiting, the run is cancelled rather than left holding its slot
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        task = asyncio.ensure_future(self._collect(job, index, params, running, cached))
+        task.add_done_callback(lambda _: self._leave(key, running))
+        return task
+
+    def _leave(self, key: str, running: asyncio.Future) -> None:
+        waiters = self._waiters.get(key, 0) - 1
+        if waiters > 0:
+            self._waiters[key] = waiters
+            return
+        self._waiters.pop(key, None)
+        if not running.done():
+            running.cancel()
+
+    async def _collect(self, job: SweepJob, index: int, params: Dict[str, Dict[str, Any]],
+                       running: asyncio.Future, cached: bool) -> None:
+        entry = {"index": index, "params": params, "cached": cached}
+        try:
+            # Shielded, so one job being cancelled does not cancel a run other jobs share
+            entry["result"] = await asyncio.shield(running)
+            job.cached += cached
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failed += 1
+            entry["error"] = str(e)
+        job.completed += 1
+        job.results.append(entry)
+
+    def _finished(self, key: str, done: asyncio.Future) -> None:
+        if self._running.get(key) is done:
+            del self._running[key]
+        self._slots.release()
+        if done.cancelled() or done.exception() is not None:
+            return
+        self._results[key] = done.result()
+        while len(self._results) > self.max_cached_results:
+            self._results.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "jobs": len(self.jobs),
+            "running_jobs": sum(1 for j in self.jobs.values() if not j.done),
+            "running_combinations": len(self._running),
+            "cached_results": len(self._results),
+        }
+
+
+_scheduler: Optional[SweepScheduler] = None
+
+
+def get_sweep_scheduler() -> SweepScheduler:
+    """Return the process-wide scheduler, configured from the environment."""
+    global _scheduler
+    if _scheduler is None:
+        name = os.getenv("COPILOT_SWEEP_EXECUTOR", "stub").lower()
+        if name not in _EXECUTOR_FACTORIES:
+            raise ValueError(f"Unknown sweep executor: {name}")
+        store = None
+        backend = os.getenv("COPILOT_SWEEP_STORE", "memory").lower()
+        if backend == "sqlite":
+            store = SQLiteSweepStore(os.getenv("COPILOT_SWEEP_DB"))
+        elif backend != "memory":
+            raise ValueError(f"Unknown sweep store backend: {backend}")
+        _scheduler = SweepScheduler(
+            _EXECUTOR_FACTORIES[name](),
+            max_workers=int(os.getenv("COPILOT_SWEEP_WORKERS", 4)),
+            max_combinations=int(os.getenv("COPILOT_SWEEP_MAX_COMBINATIONS", 10000)),
+            max_jobs=int(os.getenv("COPILOT_SWEEP_MAX_JOBS", 64)),
+            store=store,
+        )
+    return _scheduler
@@ -0,0 +1,241 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Workflow template catalog backed by the JSON files in ``public/workflows``.
+
+The directory is scanned once and then re-checked by mtime at most every
+``check_interval`` seconds, so templates can be added or edited without a
+restart. Each file is parsed only when it is new or has changed; its metadata
+(name, description, node types) feeds an inverted index used for search.
+Listing and searching never re-read unchanged files.
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple, TypedDict
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "public", "workflows")
+
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z]|\d|\b)|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+class TemplateInfo(TypedDict):
+    id: str
+    name: str
+    description: str
+    image: Optional[str]
+    node_types: List[str]
+    node_count: int
+    updated_at: int
+
+
+def tokenize(text: str) -> Set[str]:
+    """Lowercase word tokens, including the parts of CamelCase identifiers."""
+    tokens = set()
+    for word in _WORD_RE.findall(text or ""):
+        tokens.add(word.lower())
+        for part in _CAMEL_RE.findall(word):
+            tokens.add(part.lower())
+    return tokens
+
+
+class _Entry:
+    __slots__ = ("path", "mtime", "size", "info", "tokens")
+
+    def __init__(self, path: str, mtime: float, size: int):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.info: Optional[TemplateInfo] = None
+        self.tokens: Set[str] = set()
+
+
+class TemplateCatalog:
+    """Indexed, hot-reloading view over a directory of workflow templates."""
+
+    def __init__(self, directory: Optional[str] = None, check_interval: float = 2.0):
+        self.directory = directory or DEFAULT_TEMPLATE_DIR
+        self.check_interval = check_interval
+        self._entries: Dict[str, _Entry] = {}
+        self._index: Dict[str, Set[str]] = {}
+        self._sorted_tokens: List[str] = []
+        self._order: List[str] = []
+        self._version = ""
+        self._last_check = 0.0
+        self._lock = threading.RLock()
+
+    @property
+    def version(self) -> str:
+        """Content version of the catalog, suitable for building ETags."""
+        self.refresh()
+        return self._version
+
+    def refresh(self, force: bool = False) -> bool:
+        """Re-stat the directory if the check interval elapsed; return True on change."""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return False
+        with self._lock:
+            if not force and now - self._last_check < self.check_interval:
+                return False
+            self._last_check = now
+            return self._rescan()
+
+    def _rescan(self) -> bool:
+        seen: Dict[str, Tuple[str, float, int]] = {}
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith(".json"):
+                    st = entry.stat()
+                    seen[entry.name[:-5]] = (entry.path, st.st_mtime, st.st_size)
+
+        changed = set(self._entries) - set(seen)
+        for template_id in changed:
+            self._unindex(template_id)
+            del self._entries[template_id]
+        for template_id, (path, mtime, size) in seen.items():
+            current = self._entries.get(template_id)
+            if current is not None and current.mtime == mtime and current.size == size:
+                continue
+            if current is not None:
+                self._unindex(template_id)
+            entry = _Entry(path, mtime, size)
+            self._entries[template_id] = entry
+            self._parse(template_id, entry)
+            self._index_entry(template_id, entry)
+            changed.add(template_id)
+
+        if changed or not self._version:
+            self._order = sorted(self._entries, key=lambda t: (self._entries[t].info["name"].lower(), t))
+            self._sorted_tokens = sorted(self._index)
+            digest = hashlib.sha1()
+            for template_id in self._order:
+                entry = self._entries[template_id]
+                digest.update(f"{template_id}:{entry.mtime}:{entry.size};".encode())
+            self._version = digest.hexdigest()[:16]
+        return bool(changed)
+
+    def _parse(self, template_id: str, entry: _Entry) -> None:
+        try:
+            with open(entry.path, "r", encoding="utf-8") as f:
+                workflow = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("failed to load workflow template", extra={"fields": {"path": entry.path, "error": str(e)}})
+            workflow = {}
+        if not isinstance(workflow, dict):
+            workflow = {}
+        extra = workflow.get("extra") if isinstance(workflow.get("extra"), dict) else {}
+        nodes = workflow.get("nodes") if isinstance(workflow.get("nodes"), list) else []
+        node_types = sorted({n["type"] for n in nodes if isinstance(n, dict) and isinstance(n.get("type"), str)})
+        name = workflow.get("name") or extra.get("name") or template_id.replace("_", " ").title()
+        description = workflow.get("description") or extra.get("description") or ""
+        image_path = os.path.join(self.directory, template_id + ".png")
+        entry.info = TemplateInfo(
+            id=template_id,
+            name=str(name),
+            description=str(description),
+            image=f"/api/templates/{template_id}/image" if os.path.exists(image_path) else None,
+            node_types=node_types,
+            node_count=len(nodes),
+            updated_at=int(entry.mtime),
+        )
+
+    def _index_entry(self, template_id: str, entry: _Entry) -> None:
+        info = entry.info
+        tokens = tokenize(info["name"]) | tokenize(info["description"]) | tokenize(template_id)
+        for node_type in info["node_types"]:
+            tokens |= tokenize(node_type)
+        entry.tokens = tokens
+        for token in tokens:
+            self._index.setdefault(token, set()).add(template_id)
+
+    def _unindex(self, template_id: str) -> None:
+        for token in self._entries[template_id].tokens:
+            ids = self._index.get(token)
+            if ids is not None:
+                ids.discard(template_id)
+                if not ids:
+                    del self._index[token]
+
+    def _match_prefix(self, prefix: str) -> Set[str]:
+        matches: Set[str] = set()
+        start = bisect.bisect_left(self._sorted_tokens, prefix)
+        for token in self._sorted_tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            matches |= self._index[token]
+        return matches
+
+    def search(
+        self,
+        query: str = "",
+        node_type: Optional[str] = None,
+        offset: int = 0,
+        limit: int = 50,
+    ) -> Dict[str, Any]:
+        """Return a page of templates matching every query term (prefix match)."""
+        self.refresh()
+        with self._lock:
+            candidates: Optional[Set[str]] = None
+            for term in sorted(tokenize(query), key=len, reverse=True):
+                matches = self._match_prefix(term)
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    break
+            if node_type:
+                with_type = {t for t in (candidates if candidates is not None else self._entries)
+                             if node_type in self._entries[t].info["node_types"]}
+                candidates = with_type
+            ordered = self._order if candidates is None else [t for t in self._order if t in candidates]
+            page = [self._entries[t].info for t in ordered[offset:offset + limit]]
+            return {"templates": page, "total": len(ordered), "offset": offset, "limit": limit}
+
+    def list(self) -> List[TemplateInfo]:
+        """Return every template's metadata in catalog order."""
+        self.refresh()
+        with self._lock:
+            return [self._entries[t].info for t in self._order]
+
+    def get(self, template_id: str) -> Optional[TemplateInfo]:
+        self.refresh()
+        entry = self._entries.get(template_id)
+        return entry.info if entry is not None else None
+
+    def load_workflow(self, template_id: str) -> Optional[Dict[str, Any]]:
+        """Read the full workflow JSON of a template."""
+        entry = self._entries.get(template_id) if self.get(template_id) else None
+        if entry is None:
+            return None
+        with open(entry.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def image_path(self, template_id: str) -> Optional[str]:
+        if template_id not in self._entries:
+            return None
+        path = os.path.join(self.directory, template_id + ".png")
+        return path if os.path.exists(path) else None
+
+
+_catalog: Optional[TemplateCatalog] = None
+
+
+def get_template_catalog() -> TemplateCatalog:
+    """Return the process-wide template catalog, creating it from the environment if needed."""
+    global _catalog
+    if _catalog is None:
+        _catalog = TemplateCatalog(
+            os.getenv("COPILOT_TEMPLATE_DIR"),
+            float(os.getenv("COPILOT_TEMPLATE_CHECK_INTERVAL", "2.0")),
+        )
+    return _catalog
@@ -0,0 +1,215 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Streaming upload pipeline and pluggable storage backends.
+
+Uploads are consumed as an async iterator of byte chunks. Each chunk is hashed
+and handed to a backend writer straight away, so memory per request is bounded
+by the chunk size whatever the file size. Content is addressed by its SHA-256
+digest, which lets a backend skip storing bytes it already holds.
+
+Only ``LocalFileStorage`` ships today; an S3-compatible backend maps onto the
+same ``UploadWriter`` calls (multipart upload parts, complete, abort). Its
+URLs point at ``COPILOT_UPLOAD_URL``: ``/api/uploads`` on the FastAPI server,
+``/api/workspace/uploads`` inside ComfyUI.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional, Tuple, TypedDict
+
+DEFAULT_UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "db", "uploads")
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_UPLOAD_BYTES = 1024 * 1024 * 1024
+
+_SAFE_EXT_RE = re.compile(r"^\.[A-Za-z0-9]{1,10}$")
+
+
+class UploadError(Exception):
+    """Base class for upload failures."""
+
+
+class UploadTooLarge(UploadError):
+    """Raised when an upload exceeds the configured size limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the maximum size of {limit} bytes")
+        self.limit = limit
+
+
+class StoredUpload(TypedDict):
+    url: str
+    sha256: str
+    size: int
+    filename: str
+    deduplicated: bool
+
+
+class UploadWriter(ABC):
+    """Receives the chunks of a single upload."""
+
+    @abstractmethod
+    async def write(self, chunk: bytes) -> None:
+        """Persist one chunk."""
+
+    @abstractmethod
+    async def commit(self, sha256: str, extension: str) -> Tuple[str, bool]:
+        """Finalize the upload; return its URL and whether it was a duplicate."""
+
+    @abstractmethod
+    async def abort(self) -> None:
+        """Discard everything written so far."""
+
+
+class UploadStorage(ABC):
+    """Storage backend for uploaded files."""
+
+    @abstractmethod
+    def open_writer(self) -> UploadWriter:
+        """Start a new upload."""
+
+    @abstractmethod
+    def path_for(self, name: str) -> Optional[str]:
+        """Return a local path for a stored object name, if it can be served locally."""
+
+
+class _LocalFileWriter(UploadWriter):
+    def __init__(self, storage: "LocalFileStorage"):
+        self.storage = storage
+        os.makedirs(storage.tmp_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=storage.tmp_dir, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    async def write(self, chunk: bytes) -> None:
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def commit(self, sha256: str, extension: str) -> Tuple[str, bool]:
+        await asyncio.to_thread(self._file.close)
+        name = sha256 + extension
+        final_path = self.storage.object_path(name)
+        if os.path.exists(final_path):
+            os.unlink(self.tmp_path)
+            return self.storage.url_for(name), True
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(self.tmp_path, final_path)
+        return self.storage.url_for(name), False
+
+    async def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+class LocalFileStorage(UploadStorage):
+    """Stores uploads on the local filesystem, sharded by digest prefix."""
+
+    def __init__(self, root: Optional[str] = None, base_url: str = "/api/uploads"):
+        self.root = root or DEFAULT_UPLOAD_DIR
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        self.base_url = base_url.rstrip("/")
+
+    def object_path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def url_for(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def open_writer(self) -> UploadWriter:
+        return _LocalFileWriter(self)
+
+    def path_for(self, name: str) -> Optional[str]:
+        if not re.fullmatch(r"[0-9a-f]{64}(\.[A-Za-z0-9]{1,10})?", name):
+            return None
+        path = self.object_path(name)
+        return path if os.path.isfile(path) else None
+
+
+def _extension(filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if _SAFE_EXT_RE.match(ext) else ""
+
+
+async def store_upload(
+    chunks: AsyncIterator[bytes],
+    filename: Optional[str],
+    storage: UploadStorage,
+    max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES,
+    declared_size: Optional[int] = None,
+) -> StoredUpload:
+    """Stream chunks into storage while hashing them and enforcing the size limit.
+
+    ``declared_size`` (e.g. from Content-Length) rejects oversized uploads
+    before a single byte is read.
+    """
+    if declared_size is not None and declared_size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    digest = hashlib.sha256()
+    size = 0
+    writer = storage.open_writer()
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            digest.update(chunk)
+            await writer.write(chunk)
+        sha256 = digest.hexdigest()
+        url, deduplicated = await writer.commit(sha256, _extension(filename))
+    except BaseException:
+        await writer.abort()
+        raise
+    return StoredUpload(
+        url=url,
+        sha256=sha256,
+        size=size,
+        filename=filename or "",
+        deduplicated=deduplicated,
+    )
+
+
+async def iter_upload_file(file, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Read a FastAPI/Starlette ``UploadFile`` in fixed-size chunks."""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def iter_bytes(data: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Expose an in-memory buffer as a chunk iterator."""
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+
+_storage: Optional[UploadStorage] = None
+
+
+def set_upload_storage(storage: Optional[UploadStorage]) -> None:
+    """Override the active storage backend (``None`` restores the default)."""
+    global _storage
+    _storage = storage
+
+
+def get_upload_storage() -> UploadStorage:
+    """Return the active storage backend, creating it from the environment if needed."""
+    global _storage
+    if _storage is None:
+        _storage = LocalFileStorage(
+            os.getenv("COPILOT_UPLOAD_DIR"), base_url=os.getenv("COPILOT_UPLOAD_URL", "/api/uploads"))
+    return _storage
+
+
+def get_upload_limits() -> Tuple[int, int]:
+    """Return ``(max_bytes, chunk_size)`` from the environment."""
+    max_bytes = int(os.getenv("COPILOT_UPLOAD_MAX_BYTES", DEFAULT_MAX_UPLOAD_BYTES))
+    chunk_size = int(os.getenv("COPILOT_UPLOAD_CHUNK_SIZE", DEFAULT_CHUNK_SIZE))
+    return max_bytes, chunk_size
+
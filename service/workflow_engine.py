@@ -0,0 +1,309 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Workflow generation for ``/api/workflow-gen``.
+
+A request is normalized and split into a *structure* (which template and
+extra node types make up the graph) and *parameters* (widget values and the
+display name). Assembled graphs are memoized under a SHA-256 of the
+normalized structure, and finished workflows under a hash of structure plus
+parameters. A request that only changes parameters reuses the cached graph
+and copies just the nodes whose values change.
+
+Request body::
+
+    {
+      "name": "My workflow",
+      "prompt": "upscale a photo",          # picks a template when none is given
+      "template": "upscale",                # optional template id
+      "node_types": ["SaveImage"],          # extra nodes appended to the graph
+      "params": {"7": {"0": "a cat"},       # node id -> widget index -> value
+                 "CLIPTextEncode": ["a dog"]}  # node type -> all widget values
+    }
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TypedDict
+
+from .builtin_registry import BUILTIN_REGISTRY
+from .template_catalog import TemplateCatalog, get_template_catalog
+
+
+# Widget indexes in ``params`` must be below this; nodes have a few dozen widgets at most
+MAX_WIDGET_INDEX = 256
+
+
+class WorkflowGenError(ValueError):
+    """The request cannot be turned into a workflow."""
+
+
+class GeneratedWorkflow(TypedDict):
+    id: str
+    name: str
+    description: str
+    template: Optional[str]
+    nodes: List[Dict[str, Any]]
+    connections: List[Dict[str, Any]]
+    unknown_node_types: List[str]
+
+
+class _Graph:
+    """An assembled, never-mutated graph shared by every parameter variant."""
+
+    __slots__ = ("template", "description", "nodes", "connections", "by_id", "by_type", "unknown")
+
+    def __init__(self, template, description, nodes, connections, unknown):
+        self.template = template
+        self.description = description
+        self.nodes = nodes
+        self.connections = connections
+        self.unknown = unknown
+        self.by_id = {str(node.get("id")): i for i, node in enumerate(nodes)}
+        self.by_type: Dict[str, List[int]] = {}
+        for i, node in enumerate(nodes):
+            self.by_type.setdefault(node.get("type", ""), []).append(i)
+
+
+def content_hash(value: Any) -> str:
+    """SHA-256 of canonical JSON; stable across processes, unlike ``hash()``."""
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def normalize_request(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Canonical form of a request; equivalent requests normalize identically."""
+    if not isinstance(data, dict):
+        raise WorkflowGenError("Request body must be a JSON object")
+    node_types = data.get("node_types") or []
+    if not isinstance(node_types, list) or not all(isinstance(t, str) for t in node_types):
+        raise WorkflowGenError("node_types must be a list of strings")
+    params = data.get("params") or {}
+    if not isinstance(params, dict):
+        raise WorkflowGenError("params must be an object")
+    normalized_params = {}
+    for target, values in params.items():
+        if isinstance(values, dict):
+            try:
+                values = {str(int(index)): value for index, value in values.items()}
+            except (TypeError, ValueError):
+                raise WorkflowGenError(f"params[{target!r}] keys must be widget indexes")
+            if any(not 0 <= int(index) < MAX_WIDGET_INDEX for index in values):
+                raise WorkflowGenError(f"params[{target!r}] keys must be widget indexes below {MAX_WIDGET_INDEX}")
+        elif not isinstance(values, list):
+            raise WorkflowGenError(f"params[{target!r}] must be an object or a list")
+        normalized_params[str(target)] = values
+    return {
+        "name": str(data.get("name") or "Generated Workflow").strip(),
+        "prompt": " ".join(str(data.get("prompt") or data.get("description") or "").lower().split()),
+        "template": str(data["template"]) if data.get("template") else None,
+        "node_types": sorted({t.strip() for t in node_types if t.strip()}),
+        "params": normalized_params,
+    }
+
+
+def _connections(workflow: Dict[str, Any], nodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Edges from the ``links`` table, or from node inputs when a template omits it."""
+    connections = []
+    for link in workflow.get("links") or []:
+        if isinstance(link, list) and len(link) >= 5:
+            connections.append({
+                "id": link[0], "from_node": link[1], "from_slot": link[2],
+                "to_node": link[3], "to_slot": link[4], "type": link[5] if len(link) > 5 else None,
+            })
+    if connections:
+        return connections
+    # Without a links table, recover edges by matching input link ids to output slots
+    sources = {}
+    for node in nodes:
+        for slot, output in enumerate(node.get("outputs") or []):
+            for link_id in output.get("links") or []:
+                sources[link_id] = (node.get("id"), output.get("slot_index", slot), output.get("type"))
+    for node in nodes:
+        for slot, node_input in enumerate(node.get("inputs") or []):
+            link_id = node_input.get("link")
+            if link_id in sources:
+                from_node, from_slot, link_type = sources[link_id]
+                connections.append({
+                    "id": link_id, "from_node": from_node, "from_slot": from_slot,
+                    "to_node": node.get("id"), "to_slot": slot, "type": link_type,
+                })
+    return connections
+
+
+class WorkflowEngine:
+    """Assembles workflows from templates, memoizing graphs and finished results."""
+
+    def __init__(self, catalog: Optional[TemplateCatalog] = None, max_graphs: int = 256, max_results: int = 1024):
+        self._catalog = catalog
+        self.max_graphs = max_graphs
+        self.max_results = max_results
+        self._graphs: "OrderedDict[str, _Graph]" = OrderedDict()
+        self._results: "OrderedDict[str, GeneratedWorkflow]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.patched = 0
+        self.misses = 0
+
+    @property
+    def catalog(self) -> TemplateCatalog:
+        return self._catalog or get_template_catalog()
+
+    def _resolve_template(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if request["template"]:
+            info = self.catalog.get(request["template"])
+            if info is None:
+                raise WorkflowGenError(f"Unknown template: {request['template']}")
+            return info
+        if request["prompt"]:
+            matches = self.catalog.search(request["prompt"], limit=1)["templates"]
+            if not matches:
+                # Fall back to any single matching word rather than requiring all of them
+                for word in request["prompt"].split():
+                    matches = self.catalog.search(word, limit=1)["templates"]
+                    if matches:
+                        break
+            if matches:
+                return matches[0]
+        return None
+
+    def _structure(self, request: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        info = self._resolve_template(request)
+        structure = {
+            "template": info["id"] if info else None,
+            "template_updated_at": info["updated_at"] if info else None,
+            "node_types": request["node_types"],
+            "registry": BUILTIN_REGISTRY.version,
+        }
+        return content_hash(structure), structure
+
+    def _build(self, structure: Dict[str, Any], known_types: Iterable[str]) -> _Graph:
+        template_id = structure["template"]
+        workflow: Dict[str, Any] = {}
+        description = "An empty workflow"
+        if template_id is not None:
+            workflow = self.catalog.load_workflow(template_id) or {}
+            description = self.catalog.get(template_id)["description"] or f"Built from the {template_id} template"
+        nodes = [node for node in workflow.get("nodes") or [] if isinstance(node, dict)]
+        connections = _connections(workflow, nodes)
+        next_id = max([int(n["id"]) for n in nodes if isinstance(n.get("id"), int)] or [0]) + 1
+        x = max([n["pos"][0] for n in nodes if isinstance(n.get("pos"), list) and n["pos"]] or [-300]) + 300
+        for offset, node_type in enumerate(structure["node_types"]):
+            nodes.append({"id": next_id + offset, "type": node_type, "pos": [x + 300 * offset, 200]})
+        if structure["node_types"] and template_id is None:
+            description = "A workflow with the requested nodes"
+        known = set(known_types)
+        unknown = sorted({n.get("type") for n in nodes if n.get("type") not in known})
+        return _Graph(template_id, description, nodes, connections, unknown)
+
+    def _graph(self, key: str, structure: Dict[str, Any]) -> Tuple[_Graph, bool]:
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is not None:
+                self._graphs.move_to_end(key)
+                return graph, True
+        graph = self._build(structure, known_node_types())
+        with self._lock:
+            self._graphs[key] = graph
+            while len(self._graphs) > self.max_graphs:
+                self._graphs.popitem(last=False)
+        return graph, False
+
+    @staticmethod
+    def _apply_params(graph: _Graph, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Copy the graph's node list, replacing only the nodes whose widgets change.
+
+        Replaced nodes are deep copies: the originals belong to the cached graph.
+        """
+        nodes = list(graph.nodes)
+        for target, values in params.items():
+            indexes = [graph.by_id[target]] if target in graph.by_id else graph.by_type.get(target)
+            if not indexes:
+                raise WorkflowGenError(f"params target {target!r} matches no node id or type")
+            for i in indexes:
+                node = copy.deepcopy(nodes[i])
+                if isinstance(values, list):
+                    node["widgets_values"] = copy.deepcopy(values)
+                else:
+                    widgets = node.get("widgets_values") or []
+                    for index, value in values.items():
+                        index = int(index)
+                        widgets.extend([None] * (index + 1 - len(widgets)))
+                        widgets[index] = copy.deepcopy(value)
+                    node["widgets_values"] = widgets
+                nodes[i] = node
+        return nodes
+
+    def generate(self, data: Dict[str, Any]) -> Tuple[GeneratedWorkflow, str]:
+        """Return the workflow for a request and how it was produced: hit, patched or miss."""
+        request = normalize_request(data)
+        structure_key, structure = self._structure(request)
+        result_key = content_hash({"structure": structure_key, "name": request["name"], "params": request["params"]})
+
+        with self._lock:
+            cached = self._results.get(result_key)
+            if cached is not None:
+                self._results.move_to_end(result_key)
+                self.hits += 1
+                return cached, "hit"
+
+        graph, reused = self._graph(structure_key, structure)
+        nodes = self._apply_params(graph, request["params"]) if request["params"] else graph.nodes
+        workflow = GeneratedWorkflow(
+            id="workflow_" + result_key[:16],
+            name=request["name"],
+            description=graph.description,
+            template=graph.template,
+            nodes=nodes,
+            connections=graph.connections,
+            unknown_node_types=graph.unknown,
+        )
+        with self._lock:
+            if reused:
+                self.patched += 1
+            else:
+                self.misses += 1
+            self._results[result_key] = workflow
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return workflow, "patched" if reused else "miss"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._graphs.clear()
+            self._results.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "graphs": len(self._graphs),
+            "results": len(self._results),
+            "hits": self.hits,
+            "patched": self.patched,
+            "misses": self.misses,
+        }
+
+
+def known_node_types() -> List[str]:
+    """Built-in node types plus the ones registered by installed custom nodes."""
+    from .node_service import get_node_class_mappings
+
+    return list(BUILTIN_REGISTRY.names) + list(get_node_class_mappings())
+
+
+_engine: Optional[WorkflowEngine] = None
+
+
+def get_workflow_engine() -> WorkflowEngine:
+    """Return the process-wide workflow engine, configured from the environment."""
+    global _engine
+    if _engine is None:
+        _engine = WorkflowEngine(
+            max_graphs=int(os.getenv("COPILOT_WORKFLOW_GRAPH_CACHE", 256)),
+            max_results=int(os.getenv("COPILOT_WORKFLOW_RESULT_CACHE", 1024)),
+        )
+    return _engine
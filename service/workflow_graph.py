@@ -0,0 +1,376 @@
+# Copyright (C) 2025 AIDC-AI
+# Licensed under the MIT License.
+
+"""
+Compact analysis of ComfyUI workflow JSON.
+
+``parse_workflow`` accepts both the UI format (``nodes`` plus a ``links``
+table) and the API format (``{id: {"class_type", "inputs"}}``) and builds a
+``WorkflowGraph``: nodes and links live in parallel arrays indexed by
+position, and outgoing edges are kept in CSR form (offsets plus targets), so
+validation, topological ordering and downstream walks are all O(nodes + links).
+``diff_workflows`` compares two versions structurally.
+"""
+
+from array import array
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class WorkflowParseError(ValueError):
+    """The payload is not a ComfyUI workflow."""
+
+
+def _types_compatible(a: Optional[str], b: Optional[str]) -> bool:
+    if not a or not b or a == "*" or b == "*":
+        return True
+    return bool(set(str(a).split(",")) & set(str(b).split(",")))
+
+
+class WorkflowGraph:
+    """Array-backed workflow graph; node ``i`` and link ``j`` are positions, not ids."""
+
+    __slots__ = (
+        "format", "ids", "types", "values", "input_types", "output_types", "index",
+        "link_ids", "link_src", "link_src_slot", "link_dst", "link_dst_slot", "link_types",
+        "out_offsets", "out_links", "in_degree", "issues",
+    )
+
+    def __init__(self, fmt: str):
+        self.format = fmt
+        self.ids: List[Any] = []
+        self.types: List[str] = []
+        self.values: List[Any] = []
+        self.input_types: List[Dict[int, str]] = []
+        self.output_types: List[Dict[int, str]] = []
+        self.index: Dict[str, int] = {}
+        self.link_ids: List[Any] = []
+        self.link_src = array("i")
+        self.link_src_slot = array("i")
+        self.link_dst = array("i")
+        self.link_dst_slot = array("i")
+        self.link_types: List[Optional[str]] = []
+        self.out_offsets = array("i")
+        self.out_links = array("i")
+        self.in_degree = array("i")
+        self.issues: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def link_count(self) -> int:
+        return len(self.link_src)
+
+    def _add_node(self, node_id: Any, node_type: str, values: Any,
+                  input_types: Dict[int, str], output_types: Dict[int, str]) -> None:
+        key = str(node_id)
+        if key in self.index:
+            self.issues.append({"kind": "duplicate_node", "node": node_id})
+            return
+        self.index[key] = len(self.ids)
+        self.ids.append(node_id)
+        self.types.append(node_type)
+        self.values.append(values)
+        self.input_types.append(input_types)
+        self.output_types.append(output_types)
+
+    def _add_link(self, link_id: Any, src: Any, src_slot: int, dst: Any, dst_slot: int,
+                  link_type: Optional[str]) -> None:
+        link_id = _link_id(link_id)
+        src_index = self.index.get(str(src))
+        dst_index = self.index.get(str(dst))
+        if src_index is None or dst_index is None:
+            self.issues.append({
+                "kind": "dangling_link", "link": link_id,
+                "node": src if src_index is None else dst,
+            })
+            return
+        self.link_ids.append(link_id)
+        self.link_src.append(src_index)
+        self.link_src_slot.append(_slot_index(src_slot))
+        self.link_dst.append(dst_index)
+        self.link_dst_slot.append(_slot_index(dst_slot))
+        self.link_types.append(link_type)
+
+    def _finish(self) -> "WorkflowGraph":
+        """Build the CSR adjacency (counting sort of links by source)."""
+        n = len(self.ids)
+        counts = array("i", bytes(4 * (n + 1)))
+        in_degree = array("i", bytes(4 * n))
+        for j in range(self.link_count):
+            counts[self.link_src[j] + 1] += 1
+            in_degree[self.link_dst[j]] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        cursor = array("i", counts)
+        out_links = array("i", bytes(4 * self.link_count))
+        for j in range(self.link_count):
+            src = self.link_src[j]
+            out_links[cursor[src]] = j
+            cursor[src] += 1
+        self.out_offsets = counts
+        self.out_links = out_links
+        self.in_degree = in_degree
+        return self
+
+    def successors(self, i: int) -> Iterable[int]:
+        for k in range(self.out_offsets[i], self.out_offsets[i + 1]):
+            yield self.link_dst[self.out_links[k]]
+
+    def topological_order(self) -> Tuple[List[Any], List[Any]]:
+        """Kahn's algorithm; returns (ordered node ids, ids of nodes on or behind a cycle)."""
+        n = len(self.ids)
+        remaining = array("i", self.in_degree)
+        queue = deque(i for i in range(n) if remaining[i] == 0)
+        order: List[int] = []
+        while queue:
+            i = queue.popleft()
+            order.append(i)
+            for target in self.successors(i):
+                remaining[target] -= 1
+                if remaining[target] == 0:
+                    queue.append(target)
+        emitted = bytearray(n)
+        for i in order:
+            emitted[i] = 1
+        return [self.ids[i] for i in order], [self.ids[i] for i in range(n) if not emitted[i]]
+
+    def downstream(self, seeds: Iterable[Any], include_seeds: bool = True) -> List[Any]:
+        """Ids of every node reachable from ``seeds``, in breadth-first order."""
+        seen = bytearray(len(self.ids))
+        queue = deque()
+        for seed in seeds:
+            i = self.index.get(str(seed))
+            if i is not None and not seen[i]:
+                seen[i] = 1
+                queue.append(i)
+        result: List[int] = list(queue) if include_seeds else []
+        while queue:
+            for target in self.successors(queue.popleft()):
+                if not seen[target]:
+                    seen[target] = 1
+                    result.append(target)
+                    queue.append(target)
+        return [self.ids[i] for i in result]
+
+    def subgraph(self, node_ids: Iterable[Any]) -> Dict[str, Any]:
+        """Node and link ids of the subgraph induced by ``node_ids``."""
+        members = bytearray(len(self.ids))
+        for node_id in node_ids:
+            i = self.index.get(str(node_id))
+            if i is not None:
+                members[i] = 1
+        links = [self.link_ids[j] for j in range(self.link_count)
+                 if members[self.link_src[j]] and members[self.link_dst[j]]]
+        return {"nodes": [self.ids[i] for i in range(len(self.ids)) if members[i]], "links": links}
+
+    def validate(self, known_types: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Parse issues plus unknown node types, type mismatches and cycles."""
+        issues = list(self.issues)
+        if known_types is not None:
+            known = known_types if isinstance(known_types, (set, frozenset)) else set(known_types)
+            for i, node_type in enumerate(self.types):
+                if node_type not in known:
+                    issues.append({"kind": "unknown_node_type", "node": self.ids[i], "type": node_type})
+        for j in range(self.link_count):
+            src, dst = self.link_src[j], self.link_dst[j]
+            produced = self.output_types[src].get(self.link_src_slot[j])
+            expected = self.input_types[dst].get(self.link_dst_slot[j])
+            link_type = self.link_types[j]
+            if not (_types_compatible(produced, expected)
+                    and _types_compatible(link_type, produced)
+                    and _types_compatible(link_type, expected)):
+                issues.append({
+                    "kind": "type_mismatch", "link": self.link_ids[j],
+                    "from": [self.ids[src], self.link_src_slot[j], produced],
+                    "to": [self.ids[dst], self.link_dst_slot[j], expected],
+                })
+            if src == dst:
+                issues.append({"kind": "self_loop", "link": self.link_ids[j], "node": self.ids[src]})
+        _, cyclic = self.topological_order()
+        if cyclic:
+            issues.append({"kind": "cycle", "nodes": cyclic})
+        return issues
+
+    def edge_keys(self) -> Set[Tuple[str, int, str, int]]:
+        """Links identified by their endpoints, which survive link-id renumbering."""
+        return {
+            (str(self.ids[self.link_src[j]]), self.link_src_slot[j],
+             str(self.ids[self.link_dst[j]]), self.link_dst_slot[j])
+            for j in range(self.link_count)
+        }
+
+
+def _slot_index(value: Any, default: int = 0) -> int:
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise WorkflowParseError(f"invalid slot index: {value!r}")
+    try:
+        index = int(value)
+    except (ValueError, OverflowError):
+        raise WorkflowParseError(f"invalid slot index: {value!r}") from None
+    # Slots are stored in 32-bit arrays
+    if not -2 ** 31 <= index < 2 ** 31:
+        raise WorkflowParseError(f"slot index out of range: {value!r}")
+    return index
+
+
+def _link_id(value: Any) -> Any:
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise WorkflowParseError(f"invalid link id: {value!r}")
+    return value
+
+
+def _slot_list(node: Dict[str, Any], key: str) -> List[Any]:
+    slots = node.get(key)
+    if slots is None:
+        return []
+    if not isinstance(slots, list):
+        raise WorkflowParseError(f"node {node['id']!r} {key} must be a list")
+    return slots
+
+
+def _slot_types(slots: Any) -> Dict[int, str]:
+    types = {}
+    if isinstance(slots, list):
+        for position, slot in enumerate(slots):
+            if isinstance(slot, dict) and slot.get("type") is not None:
+                types[_slot_index(slot.get("slot_index"), position)] = str(slot["type"])
+    return types
+
+
+def _parse_ui(data: Dict[str, Any]) -> WorkflowGraph:
+    graph = WorkflowGraph("ui")
+    nodes = data.get("nodes")
+    if not isinstance(nodes, list):
+        raise WorkflowParseError("nodes must be a list")
+    for node in nodes:
+        if not isinstance(node, dict) or "id" not in node:
+            raise WorkflowParseError("every node needs an id")
+        graph._add_node(
+            node["id"], str(node.get("type", "")), node.get("widgets_values"),
+            _slot_types(_slot_list(node, "inputs")), _slot_types(_slot_list(node, "outputs")),
+        )
+
+    links = data.get("links")
+    if isinstance(links, list) and links:
+        for link in links:
+            if isinstance(link, list) and len(link) >= 5:
+                graph._add_link(link[0], link[1], link[2], link[3], link[4], link[5] if len(link) > 5 else None)
+            elif isinstance(link, dict):
+                graph._add_link(link.get("id"), link.get("origin_id"), link.get("origin_slot"),
+                                link.get("target_id"), link.get("target_slot"), link.get("type"))
+            else:
+                raise WorkflowParseError("links must be [id, from, from_slot, to, to_slot, type] entries")
+    else:
+        # Older exports omit the links table; recover it from the per-node slot references
+        sources = {}
+        for node in nodes:
+            for position, output in enumerate(_slot_list(node, "outputs")):
+                if not isinstance(output, dict):
+                    continue
+                link_ids = output.get("links") or []
+                if not isinstance(link_ids, list):
+                    raise WorkflowParseError(f"node {node['id']!r} output links must be a list")
+                for link_id in link_ids:
+                    sources[_link_id(link_id)] = (node["id"], output.get("slot_index", position), output.get("type"))
+        for node in nodes:
+            for position, node_input in enumerate(_slot_list(node, "inputs")):
+                link_id = node_input.get("link") if isinstance(node_input, dict) else None
+                if link_id is None:
+                    continue
+                if _link_id(link_id) not in sources:
+                    graph.issues.append({"kind": "dangling_link", "link": link_id, "node": node["id"]})
+                    continue
+                src, src_slot, link_type = sources[link_id]
+                graph._add_link(link_id, src, src_slot, node["id"], position, link_type)
+    return graph._finish()
+
+
+def _parse_api(data: Dict[str, Any]) -> WorkflowGraph:
+    graph = WorkflowGraph("api")
+    for node_id, node in data.items():
+        if not isinstance(node, dict) or "class_type" not in node:
+            raise WorkflowParseError(f"node {node_id!r} needs a class_type")
+        inputs = node.get("inputs") or {}
+        if not isinstance(inputs, dict):
+            raise WorkflowParseError(f"node {node_id!r} inputs must be an object")
+        literals = {name: value for name, value in inputs.items() if not _is_api_link(value)}
+        graph._add_node(node_id, str(node["class_type"]), literals, {}, {})
+    link_id = 0
+    for node_id, node in data.items():
+        for slot, (name, value) in enumerate((node.get("inputs") or {}).items()):
+            if _is_api_link(value):
+                link_id += 1
+                graph._add_link(link_id, value[0], value[1], node_id, slot, None)
+    return graph._finish()
+
+
+def _is_api_link(value: Any) -> bool:
+    return (isinstance(value, list) and len(value) == 2
+            and isinstance(value[0], (str, int)) and isinstance(value[1], int))
+
+
+def parse_workflow(data: Any) -> WorkflowGraph:
+    """Parse UI-format or API-format workflow JSON."""
+    if isinstance(data, dict) and "nodes" in data:
+        return _parse_ui(data)
+    if isinstance(data, dict) and all(isinstance(n, dict) and "class_type" in n for n in data.values()):
+        return _parse_api(data)
+    raise WorkflowParseError("Expected a ComfyUI workflow (UI or API format)")
+
+
+def analyze_workflow(
+    graph: WorkflowGraph,
+    known_types: Optional[Iterable[str]] = None,
+    seeds: Optional[List[Any]] = None,
+) -> Dict[str, Any]:
+    """Validation issues, execution order and (optionally) the subgraph downstream of ``seeds``."""
+    order, cyclic = graph.topological_order()
+    known = set(known_types) if known_types is not None else None
+    result = {
+        "format": graph.format,
+        "node_count": len(graph),
+        "link_count": graph.link_count,
+        "issues": graph.validate(known),
+        "order": order,
+        "cyclic_nodes": cyclic,
+        "missing_node_types": sorted({t for t in graph.types if t not in known}) if known is not None else [],
+    }
+    result["valid"] = not result["issues"]
+    if seeds:
+        result["downstream"] = graph.subgraph(graph.downstream(seeds))
+    return result
+
+
+def diff_workflows(before: WorkflowGraph, after: WorkflowGraph) -> Dict[str, Any]:
+    """Structural diff: nodes added/removed/changed (type or values) and links added/removed."""
+    old_ids, new_ids = set(before.index), set(after.index)
+    changed = []
+    for key in old_ids & new_ids:
+        i, k = before.index[key], after.index[key]
+        change = {}
+        if before.types[i] != after.types[k]:
+            change["type"] = [before.types[i], after.types[k]]
+        if before.values[i] != after.values[k]:
+            change["values"] = [before.values[i], after.values[k]]
+        if change:
+            changed.append({"id": after.ids[k], **change})
+    old_edges, new_edges = before.edge_keys(), after.edge_keys()
+
+    def ids(graph: WorkflowGraph, keys: Set[str]) -> List[Any]:
+        return [graph.ids[graph.index[key]] for key in sorted(keys, key=graph.index.get)]
+
+    def edges(keys: Set[Tuple[str, int, str, int]]) -> List[Dict[str, Any]]:
+        return [{"from_node": a, "from_slot": b, "to_node": c, "to_slot": d} for a, b, c, d in sorted(keys)]
+
+    return {
+        "added_nodes": ids(after, new_ids - old_ids),
+        "removed_nodes": ids(before, old_ids - new_ids),
+        "changed_nodes": sorted(changed, key=lambda c: after.index[str(c["id"])]),
+        "added_links": edges(new_edges - old_edges),
+        "removed_links": edges(old_edges - new_edges),
+        "identical": not (old_ids ^ new_ids or changed or old_edges ^ new_edges),
+    }